@@ -0,0 +1,105 @@
+import os
+import time
+import random
+import itertools
+import threading
+from typing import Dict
+
+
+class AdmissionController:
+    """
+    Caps concurrent sessions and concurrent downloads on this node.
+    Downloads over the cap wait briefly in a priority queue where waiting time
+    ages their priority up; the rest get a retry hint that grows with load and
+    carries jitter, so cars turned away during a peak do not all come back at once.
+    """
+
+    def __init__(self, max_sessions: int = None, max_downloads: int = None,
+                 retry_after_seconds: float = None, retry_jitter: float = None):
+        # 0 is a valid cap (e.g. draining a node), so only None falls back to the environment
+        self.max_sessions = max_sessions if max_sessions is not None else int(os.getenv("HMI_MAX_SESSIONS", "1000"))
+        self.max_downloads = (max_downloads if max_downloads is not None
+                              else int(os.getenv("HMI_MAX_DOWNLOADS", "50")))
+        self.retry_after_seconds = (retry_after_seconds if retry_after_seconds is not None
+                                    else float(os.getenv("HMI_RETRY_AFTER_SECONDS", "30")))
+        self.retry_jitter = retry_jitter if retry_jitter is not None else float(os.getenv("HMI_RETRY_JITTER", "0.5"))
+        self.queue_timeout = float(os.getenv("HMI_DOWNLOAD_QUEUE_TIMEOUT", "10"))
+        self.aging_seconds = float(os.getenv("HMI_PRIORITY_AGING_SECONDS", "30"))
+
+        self.lock = threading.Condition()
+        self.waiting = []  # [priority, enqueued_at, ticket] of queued downloads
+        self.tickets = itertools.count()
+        self.active_sessions = 0
+        self.active_downloads = 0
+        self.rejected_sessions = 0
+        self.rejected_downloads = 0
+
+    def try_open_session(self) -> bool:
+        with self.lock:
+            if self.active_sessions >= self.max_sessions:
+                self.rejected_sessions += 1
+                return False
+            self.active_sessions += 1
+            return True
+
+    def close_session(self):
+        with self.lock:
+            self.active_sessions = max(0, self.active_sessions - 1)
+
+    def _effective_priority(self, waiter: list, now: float) -> float:
+        """Queued work gains one priority level per aging period, so nothing starves"""
+        return waiter[0] + (now - waiter[1]) / self.aging_seconds
+
+    def _next_waiter(self) -> list:
+        now = time.monotonic()
+        return max(self.waiting, key=lambda waiter: (self._effective_priority(waiter, now), -waiter[1]))
+
+    def acquire_download(self, priority: float = 0, timeout: float = None) -> bool:
+        """Take a download slot, waiting up to timeout behind higher-priority work"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self.lock:
+            enqueued_at = time.monotonic()
+            waiter = [priority, enqueued_at, next(self.tickets)]
+            self.waiting.append(waiter)
+            try:
+                while True:
+                    if self.active_downloads < self.max_downloads and self._next_waiter() is waiter:
+                        self.active_downloads += 1
+                        return True
+                    remaining = enqueued_at + timeout - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_downloads += 1
+                        return False
+                    self.lock.wait(remaining)
+            finally:
+                self.waiting.remove(waiter)
+                self.lock.notify_all()
+
+    def finish_download(self):
+        with self.lock:
+            self.active_downloads = max(0, self.active_downloads - 1)
+            self.lock.notify_all()
+
+    def retry_after(self, kind: str = "download") -> int:
+        """Seconds a rejected client should wait, scaled by load and jittered"""
+        with self.lock:
+            if kind == "session":
+                active, limit = self.active_sessions, self.max_sessions
+            else:
+                active, limit = self.active_downloads, self.max_downloads
+            # A cap of 0 admits nothing, so it counts as fully loaded
+            load = active / limit if limit else 1.0
+        base = self.retry_after_seconds * max(1.0, load)
+        return int(round(base * (1 + random.uniform(0, self.retry_jitter))))
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "active_sessions": self.active_sessions,
+                "max_sessions": self.max_sessions,
+                "active_downloads": self.active_downloads,
+                "max_downloads": self.max_downloads,
+                "queued_downloads": len(self.waiting),
+                "rejected_sessions": self.rejected_sessions,
+                "rejected_downloads": self.rejected_downloads
+            }
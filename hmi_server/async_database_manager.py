@@ -0,0 +1,238 @@
+import os
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional
+from pymongo import ReturnDocument
+from models import CarType, ECU, FlashingFeedback, RolloutCampaign
+from documents import version_from_doc, campaign_from_doc, feedback_to_doc
+from storage_backends import AzureBlobBackend, BlobStore, LocalBlobBackend, MemoryBlobBackend
+
+# Attempt counters of a flashing_metrics document, in the order DatabaseManager creates them
+METRIC_COUNTERS = ("total_attempts", "successful_attempts", "failed_attempts", "rollback_attempts")
+
+
+class AsyncDatabaseManager:
+    """
+    Asyncio counterpart of DatabaseManager for event-loop servers, on Motor and
+    azure.storage.blob.aio. Firmware URLs are dispatched like BlobStore does;
+    local reads run in the loop's executor so they never block it.
+    The Mongo and blob service clients can be injected, e.g. local stand-ins in tests.
+    """
+
+    def __init__(self, data_directory: str, mongo_client=None, blob_service_client=None):
+        self.data_directory = data_directory
+
+        if mongo_client is None:
+            # Imported here so the thread-based server needs no Motor
+            from motor.motor_asyncio import AsyncIOMotorClient
+            from pymongo.server_api import ServerApi
+            mongo_client = AsyncIOMotorClient(os.getenv("MONGO_URI"), server_api=ServerApi('1'))
+        self.client = mongo_client
+        self.db = self.client[os.getenv("MONGO_DB", 'automotive_firmware_db')]
+        self.car_types_collection = self.db['car_types']
+        self.ecus_collection = self.db['ecus']
+        self.versions_collection = self.db['versions']
+        self.rollout_campaigns_collection = self.db['rollout_campaigns']
+        self.flashing_feedback_collection = self.db['flashing_feedback']
+        self.flashing_metrics_collection = self.db['flashing_metrics']
+        self.car_flashing_history_collection = self.db['car_flashing_history']
+
+        self.local = LocalBlobBackend()
+        self.memory = MemoryBlobBackend()
+        # The Azure client is created on first use, so offline runs need no credentials
+        self.blob_service_client = blob_service_client
+        self.container_client = None
+
+    def _container(self):
+        if self.container_client is None:
+            if self.blob_service_client is None:
+                from azure.storage.blob.aio import BlobServiceClient
+                self.blob_service_client = BlobServiceClient.from_connection_string(
+                    f"DefaultEndpointsProtocol=https;AccountName={os.getenv('HEX_STORAGE_ACCOUNT_NAME')};"
+                    f"AccountKey={os.getenv('HEX_STORAGE_ACCOUNT_KEY')};EndpointSuffix=core.windows.net")
+            self.container_client = self.blob_service_client.get_container_client(
+                os.getenv("HEX_STORAGE_CONTAINER_NAME"))
+        return self.container_client
+
+    @staticmethod
+    async def _off_loop(function, *args):
+        """Run blocking file system work on the default executor"""
+        return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+    async def get_hex_file_chunk(self, file_path: str, chunk_size: int, offset: int) -> Optional[bytes]:
+        """Read a chunk of a hex file from the storage backend of its URL"""
+        try:
+            scheme = BlobStore.scheme(file_path)
+            if scheme == "azure":
+                blob_client = self._container().get_blob_client(AzureBlobBackend.blob_name(file_path))
+                downloader = await blob_client.download_blob(offset=offset, length=chunk_size)
+                return await downloader.readall()
+            if scheme == "mem":
+                return self.memory.read(file_path, offset, chunk_size)
+            return await self._off_loop(self.local.read, file_path, offset, chunk_size)
+        except Exception as e:
+            logging.error(f"Error reading hex file: {str(e)}")
+            return None
+
+    async def get_file_size(self, file_path: str) -> int:
+        """Get size of a hex file from the storage backend of its URL"""
+        try:
+            scheme = BlobStore.scheme(file_path)
+            if scheme == "azure":
+                blob_client = self._container().get_blob_client(AzureBlobBackend.blob_name(file_path))
+                properties = await blob_client.get_blob_properties()
+                return properties.size
+            if scheme == "mem":
+                return self.memory.size(file_path)
+            # stat can stall on network mounts, so it stays off the loop as well
+            return await self._off_loop(self.local.size, file_path)
+        except Exception as e:
+            logging.error(f"Error getting file size: {str(e)}")
+            return 0
+
+    async def read_file_bytes(self, file_path: str) -> Optional[bytes]:
+        """Read a whole hex file from the storage backend of its URL"""
+        try:
+            scheme = BlobStore.scheme(file_path)
+            if scheme == "azure":
+                blob_client = self._container().get_blob_client(AzureBlobBackend.blob_name(file_path))
+                downloader = await blob_client.download_blob()
+                return await downloader.readall()
+            if scheme == "mem":
+                return self.memory.read_all(file_path)
+            return await self._off_loop(self.local.read_all, file_path)
+        except Exception as e:
+            logging.error(f"Error reading hex file: {str(e)}")
+            return None
+
+    async def load_all_data(self) -> List[CarType]:
+        """Load the catalog with one query per collection instead of one per document"""
+        try:
+            car_type_docs = await self.car_types_collection.find({}).to_list(None)
+            ecu_ids = [ecu_id for doc in car_type_docs for ecu_id in doc.get('ecu_ids', [])]
+            ecu_docs = {doc['_id']: doc for doc in
+                        await self.ecus_collection.find({"_id": {"$in": ecu_ids}}).to_list(None)}
+            version_ids = [version_id for doc in ecu_docs.values() for version_id in doc.get('version_ids', [])]
+            version_docs = {doc['_id']: doc for doc in
+                            await self.versions_collection.find({"_id": {"$in": version_ids}}).to_list(None)}
+
+            return [CarType(
+                name=car_type_info['name'],
+                model_number=car_type_info['model_number'],
+                ecus=[ECU(
+                    name=ecu_docs[ecu_id]['name'],
+                    model_number=ecu_docs[ecu_id]['model_number'],
+                    versions=[version_from_doc(version_docs[version_id])
+                              for version_id in ecu_docs[ecu_id].get('version_ids', []) if version_id in version_docs]
+                ) for ecu_id in car_type_info.get('ecu_ids', []) if ecu_id in ecu_docs],
+                manufactured_count=car_type_info.get('manufactured_count', 0),
+                car_ids=car_type_info.get('car_ids', [])
+            ) for car_type_info in car_type_docs]
+        except Exception as e:
+            logging.error(f"Error loading database from MongoDB: {str(e)}")
+            return []
+
+    async def load_campaigns(self) -> List[RolloutCampaign]:
+        """Load staged rollout campaigns"""
+        try:
+            docs = await self.rollout_campaigns_collection.find({"status": "active"}).to_list(None)
+            return [campaign_from_doc(doc) for doc in docs]
+        except Exception as e:
+            logging.error(f"Error loading rollout campaigns: {str(e)}")
+            return []
+
+    async def validate_car_exists(self, car_id: str, car_type: str) -> bool:
+        """Validate that a car exists in the database"""
+        try:
+            car_type_doc = await self.car_types_collection.find_one({"name": car_type})
+            if not car_type_doc:
+                return False
+            return car_id.lower() in [cid.lower() for cid in car_type_doc.get('car_ids', [])]
+        except Exception as e:
+            logging.error(f"Error validating car existence: {str(e)}")
+            return False
+
+    async def save_flashing_feedback(self, feedback: FlashingFeedback) -> bool:
+        """Save flashing feedback from a car and update metrics and history"""
+        try:
+            if not await self.validate_car_exists(feedback.car_id, feedback.car_type):
+                logging.error(f"Car {feedback.car_id} of type {feedback.car_type} not found in database")
+                return False
+
+            result = await self.flashing_feedback_collection.insert_one(feedback_to_doc(feedback))
+            if not result.inserted_id:
+                logging.error(f"Failed to save flashing feedback for car {feedback.car_id}")
+                return False
+
+            logging.info(f"✅ Flashing feedback saved for car {feedback.car_id} (session: {feedback.session_id})")
+            results = [(ecu_name, "success") for ecu_name in feedback.successful_ecus]
+            results += [(ecu_name, "rollback") for ecu_name in feedback.rolled_back_ecus]
+            await asyncio.gather(
+                *(self._update_ecu_metrics(feedback.car_type, ecu_name,
+                                           feedback.final_ecu_versions.get(ecu_name, "unknown"), result_type)
+                  for ecu_name, result_type in results),
+                self.update_car_flashing_history(feedback)
+            )
+            return True
+        except Exception as e:
+            logging.error(f"Error saving flashing feedback: {str(e)}")
+            return False
+
+    async def _update_ecu_metrics(self, car_type: str, ecu_name: str, version: str, result_type: str):
+        """
+        Count one flashing attempt of an ECU version. Every counter is incremented,
+        by 0 when it is not the result's, so a new document has all of them like
+        DatabaseManager writes; concurrent reports cannot lose a count.
+        """
+        try:
+            counter = {"success": "successful_attempts", "rollback": "rollback_attempts"}.get(result_type,
+                                                                                           "failed_attempts")
+            metrics = await self.flashing_metrics_collection.find_one_and_update(
+                {"car_type": car_type, "ecu_name": ecu_name, "version": version},
+                {"$inc": {name: 1 if name in ("total_attempts", counter) else 0 for name in METRIC_COUNTERS},
+                 "$set": {"last_updated": datetime.now()}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+            success_rate = metrics["successful_attempts"] / metrics["total_attempts"] * 100
+            # Only the report that made the latest count writes the rate, so a slower one cannot overwrite it
+            await self.flashing_metrics_collection.update_one(
+                {"_id": metrics["_id"], "total_attempts": metrics["total_attempts"]},
+                {"$set": {"success_rate": success_rate}}
+            )
+        except Exception as e:
+            logging.error(f"Error updating ECU metrics: {str(e)}")
+
+    async def update_car_flashing_history(self, feedback: FlashingFeedback):
+        """Record a flashing session and the car's current ECU versions in one upsert"""
+        try:
+            counters = {
+                "successful_sessions": feedback.overall_status == "completed",
+                "partial_success_sessions": feedback.overall_status == "partial_failure",
+                "failed_sessions": feedback.overall_status not in ("completed", "partial_failure")
+            }
+            await self.car_flashing_history_collection.update_one(
+                {"car_id": feedback.car_id},
+                {
+                    "$inc": {"total_flashing_sessions": 1,
+                             **{name: int(counted) for name, counted in counters.items()}},
+                    "$set": {
+                        "last_flashing_date": feedback.flashing_timestamp,
+                        "current_ecu_versions": feedback.final_ecu_versions,
+                        "last_updated": datetime.now()
+                    },
+                    "$push": {"flashing_sessions": feedback.session_id},
+                    "$setOnInsert": {"car_type": feedback.car_type}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Error updating car flashing history: {str(e)}")
+
+    async def close(self):
+        """Close the Mongo and blob connection pools"""
+        self.client.close()
+        if self.blob_service_client is not None:
+            await self.blob_service_client.close()
+        self.memory.close()
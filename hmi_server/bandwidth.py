@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import heapq
+import itertools
+import threading
+from typing import Dict, Optional
+
+
+class _Session:
+    __slots__ = ("weight", "finish_tag", "sent_bytes")
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish_tag = 0.0
+        self.sent_bytes = 0
+
+
+class EgressScheduler:
+    """
+    Node-wide token bucket shared by all downloads.
+    Waiting sends are granted in order of their weighted virtual finish time,
+    so each session gets bandwidth in proportion to its weight. Each priority
+    level multiplies a session's weight, so critical updates win under contention
+    while lower priorities still progress. Sessions are keyed by transfer id,
+    since one car may run more than one download at a time.
+    """
+
+    def __init__(self, rate_bytes_per_sec: float = None, burst_bytes: int = None,
+                 car_type_weights: Dict[str, float] = None):
+        self.rate = rate_bytes_per_sec if rate_bytes_per_sec is not None else float(os.getenv("HMI_EGRESS_BYTES_PER_SEC", "0"))
+        self.burst = burst_bytes or int(os.getenv("HMI_EGRESS_BURST_BYTES", str(max(int(self.rate // 10), 65536))))
+        if car_type_weights is None:
+            car_type_weights = json.loads(os.getenv("HMI_CAR_TYPE_WEIGHTS", "{}"))
+        self.car_type_weights = {name.lower(): float(weight) for name, weight in car_type_weights.items()}
+        self.priority_weight_base = float(os.getenv("HMI_PRIORITY_WEIGHT_BASE", "4"))
+
+        self.condition = threading.Condition()
+        self.sessions: Dict[str, _Session] = {}
+        self.waiting = []
+        self.tickets = itertools.count()
+        self.tokens = float(self.burst)
+        self.last_refill = time.monotonic()
+        self.virtual_time = 0.0
+        self.total_sent = 0
+
+    def weight_for(self, car_type: Optional[str]) -> float:
+        return self.car_type_weights.get((car_type or "").lower(), 1.0)
+
+    def priority_weight(self, priority: int) -> float:
+        return self.priority_weight_base ** priority
+
+    def register(self, session_id: str, car_type: str = None, weight: float = None, priority: int = 0):
+        """Start scheduling a download session"""
+        with self.condition:
+            session = _Session((weight or self.weight_for(car_type)) * self.priority_weight(priority))
+            # A new session starts at the current virtual time instead of catching up
+            session.finish_tag = self.virtual_time
+            self.sessions[session_id] = session
+
+    def unregister(self, session_id: str):
+        with self.condition:
+            self.sessions.pop(session_id, None)
+            self.condition.notify_all()
+
+    def set_weight(self, session_id: str, weight: float):
+        with self.condition:
+            if session_id in self.sessions:
+                self.sessions[session_id].weight = weight
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, session_id: str, nbytes: int):
+        """Block until the session may put nbytes on the wire"""
+        with self.condition:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = _Session(1.0)
+            session.sent_bytes += nbytes
+            self.total_sent += nbytes
+
+            if self.rate <= 0:
+                return
+
+            tag = max(self.virtual_time, session.finish_tag) + nbytes / session.weight
+            session.finish_tag = tag
+            ticket = (tag, next(self.tickets))
+            heapq.heappush(self.waiting, ticket)
+
+            while True:
+                self._refill()
+                needed = min(nbytes, self.burst)
+                if self.waiting[0] == ticket and self.tokens >= needed:
+                    heapq.heappop(self.waiting)
+                    # Chunks larger than the burst run the bucket into debt
+                    self.tokens -= nbytes
+                    self.virtual_time = tag
+                    self.condition.notify_all()
+                    return
+
+                if self.waiting[0] == ticket:
+                    self.condition.wait((needed - self.tokens) / self.rate)
+                else:
+                    self.condition.wait()
+
+    def get_status(self) -> Dict:
+        with self.condition:
+            return {
+                "rate_bytes_per_sec": self.rate,
+                "burst_bytes": self.burst,
+                "active_sessions": len(self.sessions),
+                "waiting_sends": len(self.waiting),
+                "total_sent_bytes": self.total_sent,
+                "sessions": {session_id: {"weight": session.weight, "sent_bytes": session.sent_bytes}
+                             for session_id, session in self.sessions.items()}
+            }
@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+
+
+class RangedBlobReader:
+    """
+    Read-ahead reader for large blobs.
+    A blob is split into large ranges fetched concurrently; small reads such as
+    8 KB transfer chunks are served from the buffered ranges, and reading one
+    range starts fetching the next few in the background.
+    Sizes are re-checked after size_ttl seconds; a blob republished under the
+    same name (new ETag) drops its buffered ranges.
+    """
+
+    def __init__(self, fetch_range: Callable[[str, int, int], bytes], fetch_size: Callable[[str], Tuple[int, str]],
+                 range_size: int = None, max_workers: int = None, read_ahead: int = None,
+                 max_buffered_ranges: int = None, size_ttl: float = None):
+        self.fetch_range = fetch_range  # (blob name, offset, length) -> bytes
+        self.fetch_size = fetch_size  # blob name -> (size in bytes, ETag)
+        self.range_size = range_size or int(os.getenv("HMI_BLOB_RANGE_BYTES", str(4 * 1024 * 1024)))
+        self.read_ahead = read_ahead if read_ahead is not None else int(os.getenv("HMI_BLOB_READ_AHEAD", "3"))
+        self.max_buffered_ranges = max_buffered_ranges or int(os.getenv("HMI_BLOB_BUFFERED_RANGES", "32"))
+        self.size_ttl = size_ttl if size_ttl is not None else float(os.getenv("HMI_BLOB_SIZE_TTL_SECONDS", "60"))
+        max_workers = max_workers or int(os.getenv("HMI_BLOB_RANGE_WORKERS", "8"))
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blob-range")
+        self.lock = threading.Lock()
+        self.ranges: "OrderedDict[tuple, Future]" = OrderedDict()  # (blob name, range index) -> Future
+        self.sizes: Dict[str, tuple] = {}  # blob name -> (size, ETag, when fetched)
+
+    def size(self, blob_name: str) -> int:
+        now = time.monotonic()
+        with self.lock:
+            cached = self.sizes.get(blob_name)
+            if cached and now - cached[2] < self.size_ttl:
+                return cached[0]
+        size, etag = self.fetch_size(blob_name)
+        with self.lock:
+            if cached and cached[1] != etag:
+                # Republished under the same name: the buffered ranges hold the old bytes
+                self._drop_ranges(blob_name)
+            self.sizes[blob_name] = (size, etag, now)
+        return size
+
+    def _range_count(self, size: int) -> int:
+        return (size + self.range_size - 1) // self.range_size
+
+    def _fetch(self, blob_name: str, index: int, size: int) -> bytes:
+        offset = index * self.range_size
+        return self.fetch_range(blob_name, offset, min(self.range_size, size - offset))
+
+    def _range(self, blob_name: str, index: int, size: int) -> Future:
+        """Future of one range, submitting it and the ranges after it when not buffered yet"""
+        last = min(index + self.read_ahead, self._range_count(size) - 1)
+        with self.lock:
+            for ahead in range(index, last + 1):
+                key = (blob_name, ahead)
+                if key in self.ranges:
+                    self.ranges.move_to_end(key)
+                    continue
+                self.ranges[key] = self.executor.submit(self._fetch, blob_name, ahead, size)
+            self._evict()
+            return self.ranges[(blob_name, index)]
+
+    def _evict(self):
+        """Drop the least recently used finished ranges beyond the buffer bound"""
+        excess = len(self.ranges) - self.max_buffered_ranges
+        if excess <= 0:
+            return
+        for key in [key for key, future in self.ranges.items() if future.done()][:excess]:
+            del self.ranges[key]
+
+    def read(self, blob_name: str, offset: int, length: int) -> bytes:
+        """Bytes [offset, offset + length) of a blob, clipped to its end"""
+        size = self.size(blob_name)
+        end = min(offset + length, size)
+        parts: List[bytes] = []
+        while offset < end:
+            index = offset // self.range_size
+            future = self._range(blob_name, index, size)
+            try:
+                data = future.result()
+            except Exception:
+                # Let the next read retry the range instead of replaying the failure
+                with self.lock:
+                    if self.ranges.get((blob_name, index)) is future:
+                        del self.ranges[(blob_name, index)]
+                raise
+            start = offset - index * self.range_size
+            part = data[start:start + end - offset]
+            if not part:
+                # Shorter than its cached size: overwritten or truncated since the size was read
+                self.invalidate(blob_name)
+                raise IOError(f"Blob {blob_name} changed while it was being read")
+            parts.append(part)
+            offset += len(part)
+        return b"".join(parts)
+
+    def read_all(self, blob_name: str) -> bytes:
+        """Whole blob, all ranges fetched concurrently without filling the read-ahead buffer"""
+        size = self.size(blob_name)
+        futures = [self.executor.submit(self._fetch, blob_name, index, size)
+                   for index in range(self._range_count(size))]
+        data = b"".join(future.result() for future in futures)
+        if len(data) != size:
+            self.invalidate(blob_name)
+            raise IOError(f"Blob {blob_name} changed while it was being read")
+        return data
+
+    def _drop_ranges(self, blob_name: str):
+        """The caller holds the lock"""
+        for key in [key for key in self.ranges if key[0] == blob_name]:
+            del self.ranges[key]
+
+    def invalidate(self, blob_name: str):
+        """Forget buffered data of a blob that was overwritten"""
+        with self.lock:
+            self.sizes.pop(blob_name, None)
+            self._drop_ranges(blob_name)
+
+    def shutdown(self):
+        # Read-ahead ranges nobody has asked for yet are dropped; whole-blob reads have a caller waiting
+        with self.lock:
+            for future in self.ranges.values():
+                future.cancel()
+            self.ranges.clear()
+        self.executor.shutdown(wait=False)
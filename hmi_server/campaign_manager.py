@@ -0,0 +1,131 @@
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+from models import RolloutCampaign
+
+
+class CampaignManager:
+    """Decides which cars are offered a version under a staged rollout"""
+
+    def __init__(self, campaigns: List[RolloutCampaign] = None):
+        self.lock = threading.Lock()
+        self.campaigns: Dict[tuple, RolloutCampaign] = {}
+        self.active_downloads: Dict[str, Dict[str, str]] = {}  # campaign_id -> transfer id -> car id
+        self.generation = 0  # Bumped whenever the set of active campaigns changes
+        self.fingerprint = None
+        self.load(campaigns or [])
+
+    def load(self, campaigns: List[RolloutCampaign]):
+        """Replace the active campaigns, keeping download counts of ongoing ones"""
+        indexed = {}
+        for campaign in campaigns:
+            if campaign.status != "active":
+                continue
+            campaign.waves = sorted(campaign.waves, key=lambda wave: wave["start"])
+            indexed[(campaign.ecu_name.lower(), campaign.target_version)] = campaign
+        fingerprint = sorted(repr((key, campaign)) for key, campaign in indexed.items())
+        with self.lock:
+            self.campaigns = indexed
+            if fingerprint != self.fingerprint:
+                self.fingerprint = fingerprint
+                self.generation += 1
+            for campaign in indexed.values():
+                self.active_downloads.setdefault(campaign.campaign_id, {})
+
+    @staticmethod
+    def cohort(campaign_id: str, car_id: str) -> float:
+        """Stable position of a car in [0, 100) for a campaign"""
+        digest = hashlib.sha256(f"{campaign_id}:{car_id.lower()}".encode()).digest()
+        return int.from_bytes(digest[:4], "big") % 10000 / 100
+
+    @staticmethod
+    def current_percentage(campaign: RolloutCampaign, now: datetime = None) -> float:
+        """Share of the fleet the campaign has reached by now"""
+        if not campaign.waves:
+            return campaign.percentage
+        now = now or datetime.now()
+        percentage = 0.0
+        for wave in campaign.waves:
+            if wave["start"] <= now:
+                percentage = wave["percentage"]
+        return percentage
+
+    def get_campaign(self, ecu_name: str, version_number: str) -> Optional[RolloutCampaign]:
+        return self.campaigns.get((ecu_name.lower(), version_number))
+
+    def is_eligible(self, campaign: RolloutCampaign, car_type: str, car_id: str) -> bool:
+        """Whether the car falls inside the campaign's filter and current wave"""
+        if campaign.car_types and car_type.lower() not in [name.lower() for name in campaign.car_types]:
+            return False
+        return self.cohort(campaign.campaign_id, car_id) < self.current_percentage(campaign)
+
+    def has_capacity(self, campaign: RolloutCampaign, car_id: str) -> bool:
+        """Whether another car may enter the campaign's download phase"""
+        if not campaign.max_active_downloads:
+            return True
+        with self.lock:
+            cars = set(self.active_downloads.get(campaign.campaign_id, {}).values())
+            return car_id in cars or len(cars) < campaign.max_active_downloads
+
+    def is_offered(self, car_type: str, car_id: str, ecu_name: str, version_number: str) -> bool:
+        """Versions without a campaign are offered to everyone"""
+        campaign = self.get_campaign(ecu_name, version_number)
+        if campaign is None:
+            return True
+        return self.is_eligible(campaign, car_type, car_id) and self.has_capacity(campaign, car_id)
+
+    def offer_bits(self, car_type: str, car_id: str) -> tuple:
+        """Which campaign versions the car is offered right now, in a stable order"""
+        with self.lock:
+            campaigns = sorted(self.campaigns.values(), key=lambda campaign: campaign.campaign_id)
+        return tuple(self.is_offered(car_type, car_id, campaign.ecu_name, campaign.target_version)
+                     for campaign in campaigns)
+
+    def withheld_versions(self, car_type: str, car_id: str, required_versions: Dict[str, str]) -> List[str]:
+        """Requested campaign versions the car falls outside the filter or current wave of"""
+        withheld = []
+        for ecu_name, version in required_versions.items():
+            campaign = self.get_campaign(ecu_name, version)
+            if campaign and not self.is_eligible(campaign, car_type, car_id):
+                withheld.append(f"{ecu_name} {version}")
+        return withheld
+
+    def start_download(self, transfer_id: str, car_id: str, required_versions: Dict[str, str]) -> bool:
+        """
+        Take a download slot of every campaign version requested; False if one is full.
+        Slots are held per transfer and counted per car, so parallel transfers of one car
+        share its slot and finishing one does not release the others.
+        """
+        campaigns = [campaign for campaign in
+                     (self.get_campaign(ecu_name, version) for ecu_name, version in required_versions.items())
+                     if campaign]
+        with self.lock:
+            for campaign in campaigns:
+                cars = set(self.active_downloads.setdefault(campaign.campaign_id, {}).values())
+                if (campaign.max_active_downloads and car_id not in cars
+                        and len(cars) >= campaign.max_active_downloads):
+                    logging.info(f"Campaign {campaign.campaign_id} is at its download cap")
+                    return False
+            for campaign in campaigns:
+                self.active_downloads[campaign.campaign_id][transfer_id] = car_id
+        return True
+
+    def finish_download(self, transfer_id: str):
+        with self.lock:
+            for downloading in self.active_downloads.values():
+                downloading.pop(transfer_id, None)
+
+    def get_status(self) -> List[Dict]:
+        with self.lock:
+            return [{
+                "campaign_id": campaign.campaign_id,
+                "ecu_name": campaign.ecu_name,
+                "target_version": campaign.target_version,
+                "car_types": campaign.car_types,
+                "current_percentage": self.current_percentage(campaign),
+                "active_downloads": len(set(self.active_downloads.get(campaign.campaign_id, {}).values())),
+                "max_active_downloads": campaign.max_active_downloads,
+                "priority": campaign.priority
+            } for campaign in self.campaigns.values()]
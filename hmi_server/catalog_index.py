@@ -0,0 +1,87 @@
+import sys
+from typing import Dict, FrozenSet, List, Optional
+from models import CarType, ECU, Version
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class CatalogIndex:
+    """
+    O(1) lookups over one catalog generation.
+    Strings are interned and ECU/Version records shared by several car types
+    are stored once. The index is built before it is published and never
+    changed afterwards, so swapping the server's reference is atomic.
+    """
+
+    def __init__(self, car_types: List[CarType] = None):
+        self.car_types: List[CarType] = car_types or []
+        self.by_name: Dict[str, CarType] = {}  # lower-case car type name -> CarType
+        self.car_ids: Dict[str, FrozenSet[str]] = {}  # lower-case car type name -> lower-case car ids
+        self.ecus: Dict[tuple, ECU] = {}  # (car type, ECU name) -> ECU
+        self.versions: Dict[tuple, Version] = {}  # (car type, ECU name, version number) -> Version
+
+        shared_versions: Dict[tuple, Version] = {}
+        shared_ecus: Dict[tuple, ECU] = {}
+        for car_type in self.car_types:
+            car_type.name = _intern(car_type.name)
+            car_type.model_number = _intern(car_type.model_number)
+            car_type.car_ids = [_intern(car_id) for car_id in car_type.car_ids]
+            car_type.ecus = [self._compact_ecu(ecu, shared_ecus, shared_versions) for ecu in car_type.ecus]
+
+            key = car_type.name.lower()
+            self.by_name[key] = car_type
+            self.car_ids[key] = frozenset(_intern(car_id.lower()) for car_id in car_type.car_ids)
+            for ecu in car_type.ecus:
+                self.ecus[(key, ecu.name)] = ecu
+                for version in ecu.versions:
+                    self.versions[(key, ecu.name, version.version_number)] = version
+
+    @staticmethod
+    def _compact_version(version: Version) -> Version:
+        version.version_number = _intern(version.version_number)
+        version.hex_file_path = _intern(version.hex_file_path)
+        version.sha256 = _intern(version.sha256)
+        version.min_from_version = _intern(version.min_from_version)
+        version.compatible_car_types = [_intern(name) for name in version.compatible_car_types]
+        version.requires = {_intern(name): _intern(minimum) for name, minimum in version.requires.items()}
+        return version
+
+    def _compact_ecu(self, ecu: ECU, shared_ecus: Dict[tuple, ECU], shared_versions: Dict[tuple, Version]) -> ECU:
+        """The equal ECU already indexed for another car type, or this one with shared versions"""
+        ecu.name = _intern(ecu.name)
+        ecu.model_number = _intern(ecu.model_number)
+        versions = []
+        for version in ecu.versions:
+            key = (ecu.name, ecu.model_number, version.version_number, version.hex_file_path, version.sha256)
+            shared = shared_versions.get(key)
+            if shared is None or shared != version:
+                shared = shared_versions[key] = self._compact_version(version)
+            versions.append(shared)
+        ecu.versions = versions
+
+        shared = shared_ecus.get((ecu.name, ecu.model_number))
+        if shared is not None and shared == ecu:
+            return shared
+        shared_ecus[(ecu.name, ecu.model_number)] = ecu
+        return ecu
+
+    def car_type(self, name: str) -> Optional[CarType]:
+        return self.by_name.get((name or "").lower())
+
+    def has_car(self, car_type: str, car_id: str) -> bool:
+        return (car_id or "").lower() in self.car_ids.get((car_type or "").lower(), ())
+
+    def ecu(self, car_type: str, ecu_name: str) -> Optional[ECU]:
+        return self.ecus.get(((car_type or "").lower(), ecu_name))
+
+    def version(self, car_type: str, ecu_name: str, version_number: str) -> Optional[Version]:
+        return self.versions.get(((car_type or "").lower(), ecu_name, version_number))
+
+    def get_status(self) -> Dict:
+        return {
+            "car_types": len(self.by_name),
+            "ecus": len({id(ecu) for ecu in self.ecus.values()}),
+            "versions": len({id(version) for version in self.versions.values()})
+        }
@@ -0,0 +1,114 @@
+import os
+import json
+import logging
+import tempfile
+from dataclasses import asdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from models import CarType, ECU, Version, RolloutCampaign
+
+# Compact binary snapshots when msgpack is installed, JSON otherwise
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Bumped whenever the snapshot layout changes; older snapshots are ignored
+SNAPSHOT_FORMAT = 1
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot snapshot {type(value).__name__}")
+
+
+def _decode(value: Dict):
+    if "__datetime__" in value:
+        # isoformat() drops the microseconds when they are zero
+        text = value["__datetime__"]
+        return datetime.strptime(text, "%Y-%m-%dT%H:%M:%S.%f" if "." in text else "%Y-%m-%dT%H:%M:%S")
+    return value
+
+
+class CatalogSnapshot:
+    """
+    Last loaded catalog and campaigns on local disk, so a restarted node can
+    serve before the database answers. Written atomically after each load.
+    """
+
+    def __init__(self, data_directory: str, path: str = None):
+        extension = "msgpack" if msgpack is not None else "json"
+        self.path = path or os.getenv("HMI_CATALOG_SNAPSHOT") or \
+            os.path.join(data_directory, f"catalog_snapshot.{extension}")
+        self.saved_at: Optional[str] = None
+
+    def _dumps(self, document: Dict) -> bytes:
+        if msgpack is not None and self.path.endswith(".msgpack"):
+            return msgpack.packb(document, default=_encode, use_bin_type=True)
+        return json.dumps(document, default=_encode, separators=(",", ":")).encode("utf-8")
+
+    def _loads(self, data: bytes) -> Dict:
+        if self.path.endswith(".msgpack"):
+            if msgpack is None:
+                raise ValueError("msgpack is not installed")
+            return msgpack.unpackb(data, object_hook=_decode, raw=False)
+        return json.loads(data, object_hook=_decode)
+
+    def save(self, car_types: List[CarType], campaigns: List[RolloutCampaign]) -> bool:
+        """Replace the snapshot; readers never see a partly written file"""
+        document = {
+            "format": SNAPSHOT_FORMAT,
+            "saved_at": datetime.now().isoformat(),
+            "car_types": [asdict(car_type) for car_type in car_types],
+            "campaigns": [asdict(campaign) for campaign in campaigns]
+        }
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".catalog_snapshot.")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(self._dumps(document))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.path)
+            except Exception:
+                os.unlink(temp_path)
+                raise
+            self.saved_at = document["saved_at"]
+            return True
+        except Exception as e:
+            logging.error(f"Error writing catalog snapshot: {str(e)}")
+            return False
+
+    def load(self) -> Optional[Tuple[List[CarType], List[RolloutCampaign]]]:
+        """Catalog and campaigns of the snapshot, or None when there is no usable one"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                document = self._loads(f.read())
+            if document.get("format") != SNAPSHOT_FORMAT:
+                logging.warning(f"Ignoring catalog snapshot in format {document.get('format')}")
+                return None
+            car_types = [CarType(
+                name=car_type["name"],
+                model_number=car_type["model_number"],
+                ecus=[ECU(
+                    name=ecu["name"],
+                    model_number=ecu["model_number"],
+                    versions=[Version(**version) for version in ecu["versions"]]
+                ) for ecu in car_type["ecus"]],
+                manufactured_count=car_type["manufactured_count"],
+                car_ids=car_type["car_ids"]
+            ) for car_type in document["car_types"]]
+            campaigns = [RolloutCampaign(**campaign) for campaign in document["campaigns"]]
+            self.saved_at = document.get("saved_at")
+            return car_types, campaigns
+        except Exception as e:
+            logging.error(f"Error reading catalog snapshot: {str(e)}")
+            return None
+
+    def get_status(self) -> Dict:
+        return {"path": self.path, "format": SNAPSHOT_FORMAT, "saved_at": self.saved_at}
@@ -0,0 +1,55 @@
+import hashlib
+from typing import List, Tuple
+
+# Content-defined chunking parameters; cars must use the same values to
+# chunk the images they already hold
+MIN_CHUNK_SIZE = 2 * 1024
+AVG_CHUNK_SIZE = 8 * 1024
+MAX_CHUNK_SIZE = 32 * 1024
+CHUNK_HASH_LENGTH = 32  # hex characters of SHA-256 kept per chunk
+
+_HASH_BITS = 64
+_HASH_LIMIT = (1 << _HASH_BITS) - 1
+
+# Deterministic gear table, reproducible on the car side without shipping it
+GEAR = [int.from_bytes(hashlib.sha256(b"ota-cdc-gear" + bytes([i])).digest()[:8], "big") for i in range(256)]
+
+
+def _boundary_mask(avg_size: int) -> int:
+    """Mask over the high bits of the gear hash giving the requested average size"""
+    bits = avg_size.bit_length() - 1
+    return ((1 << bits) - 1) << (_HASH_BITS - bits)
+
+
+def chunk_boundaries(data: bytes, min_size: int = MIN_CHUNK_SIZE, avg_size: int = AVG_CHUNK_SIZE,
+                     max_size: int = MAX_CHUNK_SIZE) -> List[Tuple[int, int]]:
+    """Split data into content-defined chunks, returned as (offset, length) pairs"""
+    mask = _boundary_mask(avg_size)
+    gear = GEAR
+    boundaries = []
+    start = 0
+    length = len(data)
+
+    while start < length:
+        end = min(start + max_size, length)
+        cut = end
+        gear_hash = 0
+        for position in range(start + min_size, end):
+            gear_hash = ((gear_hash << 1) + gear[data[position]]) & _HASH_LIMIT
+            if not gear_hash & mask:
+                cut = position + 1
+                break
+        boundaries.append((start, cut - start))
+        start = cut
+
+    return boundaries
+
+
+def chunk_hash(chunk: bytes) -> str:
+    return hashlib.sha256(chunk).hexdigest()[:CHUNK_HASH_LENGTH]
+
+
+def build_manifest(data: bytes) -> List[List]:
+    """Chunk manifest of an image: [chunk hash, offset, length] per chunk"""
+    return [[chunk_hash(data[offset:offset + size]), offset, size]
+            for offset, size in chunk_boundaries(data)]
@@ -0,0 +1,60 @@
+import zlib
+from typing import List, Optional
+
+# Optional codecs, used only when their packages are installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+# Server preference order, best ratio/speed trade-off first
+CODEC_PREFERENCE = ["zstd", "lz4", "zlib"]
+
+
+def available_codecs() -> List[str]:
+    """Codecs this node can produce, in preference order"""
+    codecs = []
+    if zstandard is not None:
+        codecs.append("zstd")
+    if lz4_frame is not None:
+        codecs.append("lz4")
+    codecs.append("zlib")
+    return codecs
+
+
+def negotiate_codec(client_codecs: Optional[List[str]]) -> Optional[str]:
+    """Pick the preferred codec both sides support, or None for raw transfer"""
+    if not client_codecs:
+        return None
+    offered = {codec.lower() for codec in client_codecs if isinstance(codec, str)}
+    for codec in available_codecs():
+        if codec in offered:
+            return codec
+    return None
+
+
+def compress(codec: str, data: bytes) -> bytes:
+    """Compress a whole firmware image with the given codec"""
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=19).compress(data)
+    if codec == "lz4":
+        return lz4_frame.compress(data, compression_level=lz4_frame.COMPRESSIONLEVEL_MAX)
+    if codec == "zlib":
+        return zlib.compress(data, 9)
+    raise ValueError(f"Unsupported codec: {codec}")
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    """Inverse of compress, used for verification"""
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "lz4":
+        return lz4_frame.decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"Unsupported codec: {codec}")
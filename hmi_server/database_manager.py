@@ -1,19 +1,41 @@
 import os
 from typing import Dict, List, Optional
-from models import CarType, ECU, Version, FlashingFeedback, FlashingSession, FlashingMetrics, CarFlashingHistory
+from models import CarType, ECU, FlashingFeedback, FlashingSession, FlashingMetrics, CarFlashingHistory, RolloutCampaign
+from documents import version_from_doc, campaign_from_doc, feedback_to_doc
+from storage_backends import BlobStore
+from publish_events import MongoPublishEventSource
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 from bson.binary import Binary
-from azure.storage.blob import BlobServiceClient, BlobClient
-from urllib.parse import urlparse
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+import threading
 import logging
 
 # Load environment variables from .env file
 load_dotenv()
 
 class DatabaseManager:
+    _shared: Optional["DatabaseManager"] = None
+    _shared_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, data_directory: str) -> "DatabaseManager":
+        """Process-wide instance, so Mongo and Azure connection pools are created once"""
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls(data_directory)
+        return cls._shared
+
+    @classmethod
+    def close_shared(cls):
+        """Close the process-wide instance, if one was created"""
+        with cls._shared_lock:
+            shared = cls._shared
+        if shared is not None:
+            shared.close()
+
     def __init__(self, data_directory: str):
         """
         Initialize the DatabaseManager with MongoDB connection
@@ -23,7 +45,12 @@ class DatabaseManager:
         
         # MongoDB connection from env variables
         uri = os.getenv("MONGO_URI")
-        self.client = MongoClient(uri, server_api=ServerApi('1'))
+        self.mongo_max_pool_size = int(os.getenv("HMI_MONGO_MAX_POOL_SIZE", "50"))
+        self.mongo_min_pool_size = int(os.getenv("HMI_MONGO_MIN_POOL_SIZE", "4"))
+        self.client = MongoClient(uri, server_api=ServerApi('1'),
+                                  maxPoolSize=self.mongo_max_pool_size,
+                                  minPoolSize=self.mongo_min_pool_size,
+                                  waitQueueTimeoutMS=int(os.getenv("HMI_MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000")))
         self.db = self.client[os.getenv("MONGO_DB", 'automotive_firmware_db')]
         
         # Existing collections
@@ -39,22 +66,35 @@ class DatabaseManager:
         self.flashing_metrics_collection = self.db['flashing_metrics']
         self.car_flashing_history_collection = self.db['car_flashing_history']
         
-        # Azure Blob Storage configuration from env variables
-        self.blob_account_name = os.getenv("HEX_STORAGE_ACCOUNT_NAME")
-        self.blob_container_name = os.getenv("HEX_STORAGE_CONTAINER_NAME")
-        self.blob_account_key = os.getenv("HEX_STORAGE_ACCOUNT_KEY")
-        self.blob_connection_string = (f"DefaultEndpointsProtocol=https;AccountName={self.blob_account_name};"
-                                     f"AccountKey={self.blob_account_key};EndpointSuffix=core.windows.net")
-        self.blob_service_client = BlobServiceClient.from_connection_string(self.blob_connection_string)
-        self.container_client = self.blob_service_client.get_container_client(self.blob_container_name)
+        # Precomputed firmware deltas
+        self.firmware_deltas_collection = self.db['firmware_deltas']
+        
+        # Staged rollout campaigns
+        self.rollout_campaigns_collection = self.db['rollout_campaigns']
+        
+        # Version publish announcements written by the website
+        self.publish_events_collection = self.db['publish_events']
+        
+        # Content-addressed image records, with the chunk manifest computed at publish
+        self.firmware_blobs_collection = self.db['firmware_blobs']
+        
+        # Firmware files: local paths, mem:// and Azure blob URLs
+        self.blobs = BlobStore()
         
-        # Initialize collections if needed
-        self._initialize_db()
+        # Indexes are created by warm_up(), so a node can start from its catalog
+        # snapshot while Mongo is unreachable; MongoClient itself connects lazily
+        self.indexes_ready = False
     
     def _initialize_db(self):
         """Create indexes and ensure collections exist"""
+        if self.indexes_ready:
+            return
         # Existing indexes
         self.car_types_collection.create_index("name")
+        # Case-insensitive car type lookups; documents written before the field existed are backfilled
+        self.car_types_collection.update_many({"name_lower": {"$exists": False}},
+                                              [{"$set": {"name_lower": {"$toLower": "$name"}}}])
+        self.car_types_collection.create_index("name_lower")
         self.car_types_collection.create_index("model_number")
         self.ecus_collection.create_index("name")
         self.versions_collection.create_index([("version_number", 1), ("ecu_id", 1)])
@@ -76,71 +116,104 @@ class DatabaseManager:
         
         self.car_flashing_history_collection.create_index("car_id")
         self.car_flashing_history_collection.create_index("car_type")
+        
+        self.firmware_deltas_collection.create_index([("ecu_name", 1), ("model_number", 1),
+                                                      ("from_version", 1), ("to_version", 1)])
+        self.publish_events_collection.create_index("created_at")
+        self.indexes_ready = True
+
+    def warm_up(self) -> bool:
+        """Open the Mongo and Azure connections and create the indexes; False while Mongo is unreachable"""
+        try:
+            self.client.admin.command('ping')
+            self._initialize_db()
+            self.blobs.warm_up()
+            logging.info(f"✅ Storage connections ready (Mongo pool {self.mongo_min_pool_size}-"
+                         f"{self.mongo_max_pool_size})")
+            return True
+        except Exception as e:
+            logging.error(f"Error warming up storage connections: {str(e)}")
+            return False
+
+    def close(self):
+        """Release the Mongo and Azure connection pools"""
+        with DatabaseManager._shared_lock:
+            if DatabaseManager._shared is self:
+                DatabaseManager._shared = None
+        try:
+            self.blobs.close()
+        finally:
+            self.client.close()
+
+    def publish_event_source(self) -> MongoPublishEventSource:
+        return MongoPublishEventSource(self.publish_events_collection)
+
+    def get_status(self) -> Dict:
+        return {
+            "mongo_max_pool_size": self.mongo_max_pool_size,
+            "mongo_min_pool_size": self.mongo_min_pool_size,
+            "blobs": self.blobs.get_status(),
+            "indexes_ready": self.indexes_ready,
+            "shared": DatabaseManager._shared is self
+        }
 
     # ... (keep all existing methods unchanged) ...
-    
-    def _get_blob_name_from_url(self, blob_url: str) -> str:
-        """Extract blob name from blob URL"""
-        # Parse the URL to get the path
-        parsed_url = urlparse(blob_url)
-        # The path will be in format: /containername/blobname
-        path_parts = parsed_url.path.split('/')
-        # The blob name is after the container name (index 2 and beyond)
-        # Join all parts after the container name to handle blobs with '/' in the name
-        blob_name = '/'.join(path_parts[2:])
-        return blob_name
 
     def get_hex_file_chunk(self, file_path: str, chunk_size: int, offset: int) -> Optional[bytes]:
         """
-        Read a chunk of hex file from Azure Blob Storage or local file system
+        Read a chunk of hex file from the storage backend of its URL
         """
         try:
-            # Check if it's a blob URL or local file path
-            if file_path.startswith("https://") and "blob.core.windows.net" in file_path:
-                # It's a blob URL, extract blob name
-                blob_name = self._get_blob_name_from_url(file_path)
-                
-                # Get blob client
-                blob_client = self.container_client.get_blob_client(blob_name)
-                
-                # Download the range of bytes from the blob
-                download_stream = blob_client.download_blob(offset=offset, length=chunk_size)
-                
-                # Read the bytes
-                chunk_data = download_stream.readall()
-                return chunk_data
-            else:
-                # Fallback to local file system for backward compatibility
-                with open(file_path, 'rb') as f:
-                    f.seek(offset)
-                    return f.read(chunk_size)
+            return self.blobs.read(file_path, offset, chunk_size)
         except Exception as e:
             print(f"Error reading hex file: {str(e)}")
             return None
 
     def get_file_size(self, file_path: str) -> int:
         """
-        Get size of a hex file from Azure Blob Storage or local file system
+        Get size of a hex file from the storage backend of its URL
         """
         try:
-            # Check if it's a blob URL or local file path
-            if file_path.startswith("https://") and "blob.core.windows.net" in file_path:
-                # It's a blob URL, extract blob name
-                blob_name = self._get_blob_name_from_url(file_path)
-                
-                # Get blob client
-                blob_client = self.container_client.get_blob_client(blob_name)
-                
-                # Get blob properties to get size
-                blob_properties = blob_client.get_blob_properties()
-                return blob_properties.size
-            else:
-                # Fallback to local file system for backward compatibility
-                return os.path.getsize(file_path)
+            return self.blobs.size(file_path)
         except Exception as e:
             print(f"Error getting file size: {str(e)}")
             return 0
     
+    def read_file_bytes(self, file_path: str) -> Optional[bytes]:
+        """
+        Read a whole hex file from the storage backend of its URL
+        """
+        try:
+            return self.blobs.read_all(file_path)
+        except Exception as e:
+            print(f"Error reading hex file: {str(e)}")
+            return None
+
+    def get_chunk_manifest(self, digest: str) -> Optional[List]:
+        """Chunk manifest the website published for an image, if it has one"""
+        try:
+            doc = self.firmware_blobs_collection.find_one({"_id": digest}, {"chunk_manifest": 1})
+            return doc.get("chunk_manifest") if doc else None
+        except Exception as e:
+            logging.error(f"Error reading chunk manifest: {str(e)}")
+            return None
+
+    def save_delta_metadata(self, delta_info: Dict):
+        """Record a precomputed delta so other nodes can see it"""
+        try:
+            self.firmware_deltas_collection.update_one(
+                {
+                    "ecu_name": delta_info["ecu_name"],
+                    "model_number": delta_info["model_number"],
+                    "from_version": delta_info["from_version"],
+                    "to_version": delta_info["to_version"]
+                },
+                {"$set": {**delta_info, "last_updated": datetime.now()}},
+                upsert=True
+            )
+        except Exception as e:
+            logging.error(f"Error saving delta metadata: {str(e)}")
+    
     def load_all_data(self) -> List[CarType]:
         """Load all data from MongoDB and create CarType objects"""
         try:
@@ -165,11 +238,7 @@ class DatabaseManager:
                             version_info = self.versions_collection.find_one({"_id": version_id})
                             
                             if version_info:
-                                versions.append(Version(
-                                    version_number=version_info['version_number'],
-                                    compatible_car_types=version_info['compatible_car_types'],
-                                    hex_file_path=version_info['hex_file_path']
-                                ))
+                                versions.append(version_from_doc(version_info))
                         
                         ecus.append(ECU(
                             name=ecu_info['name'],
@@ -192,6 +261,17 @@ class DatabaseManager:
             print(f"Error loading database from MongoDB: {str(e)}")
             return []
 
+    def load_campaigns(self) -> List[RolloutCampaign]:
+        """Load staged rollout campaigns"""
+        try:
+            campaigns = []
+            for campaign_info in self.rollout_campaigns_collection.find({"status": "active"}):
+                campaigns.append(campaign_from_doc(campaign_info))
+            return campaigns
+        except Exception as e:
+            logging.error(f"Error loading rollout campaigns: {str(e)}")
+            return []
+
     # ... (keep all existing save/load methods) ...
 
     # NEW: Flashing feedback methods
@@ -203,21 +283,7 @@ class DatabaseManager:
                 logging.error(f"Car {feedback.car_id} of type {feedback.car_type} not found in database")
                 return False
             
-            feedback_data = {
-                "session_id": feedback.session_id,
-                "car_id": feedback.car_id,
-                "car_type": feedback.car_type,
-                "flashing_timestamp": feedback.flashing_timestamp,
-                "overall_status": feedback.overall_status,
-                "total_ecus": feedback.total_ecus,
-                "successful_ecus": feedback.successful_ecus,
-                "rolled_back_ecus": feedback.rolled_back_ecus,
-                "final_ecu_versions": feedback.final_ecu_versions,
-                "android_app_version": feedback.android_app_version,
-                "beaglebone_version": feedback.beaglebone_version,
-                "request_id": feedback.request_id,
-                "received_timestamp": feedback.received_timestamp
-            }
+            feedback_data = feedback_to_doc(feedback)
             
             # Insert feedback
             result = self.flashing_feedback_collection.insert_one(feedback_data)
@@ -567,6 +633,16 @@ class DatabaseManager:
                         "compatible_car_types": version.compatible_car_types,
                         "hex_file_path": version.hex_file_path
                     }
+                    if version.sha256:
+                        version_data["sha256"] = version.sha256
+                    if version.priority:
+                        version_data["priority"] = version.priority
+                    if version.requires:
+                        version_data["requires"] = version.requires
+                    if version.min_from_version:
+                        version_data["min_from_version"] = version.min_from_version
+                    if version.file_metadata:
+                        version_data["file_metadata"] = version.file_metadata
                     
                     # Check if version exists, update or insert
                     result = self.versions_collection.update_one(
@@ -684,31 +760,28 @@ class DatabaseManager:
             print(f"Error updating download request status in MongoDB: {str(e)}")
 
     def get_car_type_by_name(self, name: str) -> Optional[CarType]:
-        """Get a car type by name"""
+        """Get a car type by name, with one query per collection"""
         try:
-            car_type_info = self.car_types_collection.find_one({"name": name})
+            # Cars may report the name in another case; both clauses are served by an index
+            car_type_info = self.car_types_collection.find_one(
+                {"$or": [{"name_lower": name.lower()}, {"name": {"$in": [name, name.lower()]}}]})
             if not car_type_info:
                 return None
                 
-            # Load full car type using the same logic as load_all_data
+            ecu_ids = car_type_info.get('ecu_ids', [])
+            ecu_docs = {doc['_id']: doc for doc in self.ecus_collection.find({"_id": {"$in": ecu_ids}})}
+            version_ids = [version_id for doc in ecu_docs.values() for version_id in doc.get('version_ids', [])]
+            version_docs = {doc['_id']: doc for doc in self.versions_collection.find({"_id": {"$in": version_ids}})}
+
             ecus = []
-            for ecu_id in car_type_info.get('ecu_ids', []):
-                ecu_info = self.ecus_collection.find_one({"_id": ecu_id})
+            for ecu_id in ecu_ids:
+                ecu_info = ecu_docs.get(ecu_id)
                 if ecu_info:
-                    versions = []
-                    for version_id in ecu_info.get('version_ids', []):
-                        version_info = self.versions_collection.find_one({"_id": version_id})
-                        if version_info:
-                            versions.append(Version(
-                                version_number=version_info['version_number'],
-                                compatible_car_types=version_info['compatible_car_types'],
-                                hex_file_path=version_info['hex_file_path']
-                            ))
-                    
                     ecus.append(ECU(
                         name=ecu_info['name'],
                         model_number=ecu_info['model_number'],
-                        versions=versions
+                        versions=[version_from_doc(version_docs[version_id])
+                                  for version_id in ecu_info.get('version_ids', []) if version_id in version_docs]
                     ))
             
             return CarType(
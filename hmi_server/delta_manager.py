@@ -0,0 +1,308 @@
+import os
+import json
+import struct
+import zlib
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+from models import CarType, ECU, Version
+
+# Delta file layout: magic, target size, then a zlib-compressed stream of
+# COPY (offset, length from the base image) and INSERT (literal bytes) ops
+DELTA_MAGIC = b"OTAD1"
+DELTA_BLOCK_SIZE = 32
+_OP_COPY = 0x01
+_OP_INSERT = 0x02
+
+
+def compute_delta(old_data: bytes, new_data: bytes, block_size: int = DELTA_BLOCK_SIZE) -> bytes:
+    """Compute a binary delta that rebuilds new_data from old_data"""
+    index = {}
+    for offset in range(0, len(old_data) - block_size + 1, block_size):
+        index.setdefault(old_data[offset:offset + block_size], offset)
+
+    ops = bytearray()
+    literal = bytearray()
+
+    def flush_literal():
+        if literal:
+            ops.extend(struct.pack(">BI", _OP_INSERT, len(literal)))
+            ops.extend(literal)
+            literal.clear()
+
+    i = 0
+    new_length = len(new_data)
+    while i < new_length:
+        match_offset = index.get(new_data[i:i + block_size]) if i + block_size <= new_length else None
+        if match_offset is None:
+            literal.append(new_data[i])
+            i += 1
+            continue
+
+        # Extend the match forward as far as both images agree
+        match_length = block_size
+        while (i + match_length < new_length and match_offset + match_length < len(old_data)
+               and new_data[i + match_length] == old_data[match_offset + match_length]):
+            match_length += 1
+
+        flush_literal()
+        ops.extend(struct.pack(">BII", _OP_COPY, match_offset, match_length))
+        i += match_length
+
+    flush_literal()
+    return DELTA_MAGIC + struct.pack(">I", new_length) + zlib.compress(bytes(ops), 9)
+
+
+def apply_delta(old_data: bytes, delta: bytes) -> bytes:
+    """Rebuild the target image from the base image and a delta"""
+    if not delta.startswith(DELTA_MAGIC):
+        raise ValueError("Not a firmware delta")
+
+    header_size = len(DELTA_MAGIC) + 4
+    (target_size,) = struct.unpack(">I", delta[len(DELTA_MAGIC):header_size])
+    ops = zlib.decompress(delta[header_size:])
+
+    result = bytearray()
+    position = 0
+    while position < len(ops):
+        op = ops[position]
+        if op == _OP_COPY:
+            offset, length = struct.unpack(">II", ops[position + 1:position + 9])
+            result.extend(old_data[offset:offset + length])
+            position += 9
+        elif op == _OP_INSERT:
+            (length,) = struct.unpack(">I", ops[position + 1:position + 5])
+            result.extend(ops[position + 5:position + 5 + length])
+            position += 5 + length
+        else:
+            raise ValueError(f"Unknown delta op: {op}")
+
+    if len(result) != target_size:
+        raise ValueError("Delta produced an image of unexpected size")
+    return bytes(result)
+
+
+def _build_delta_job(old_data: bytes, new_data: bytes) -> Dict:
+    """Process pool entry point: build a delta and describe it"""
+    delta = compute_delta(old_data, new_data)
+    return {
+        "delta": delta,
+        "size": len(delta),
+        "sha256": hashlib.sha256(delta).hexdigest(),
+        "base_sha256": hashlib.sha256(old_data).hexdigest(),
+        "target_sha256": hashlib.sha256(new_data).hexdigest(),
+        "target_size": len(new_data)
+    }
+
+
+class DeltaManager:
+    """Precomputes binary deltas between ECU versions in a background process pool"""
+
+    def __init__(self, db_manager, data_directory: str, history_depth: int = None, max_workers: int = None):
+        self.db_manager = db_manager
+        self.delta_directory = os.path.join(data_directory, "deltas")
+        self.history_depth = history_depth or int(os.getenv("HMI_DELTA_HISTORY_DEPTH", "3"))
+        self.max_ratio = float(os.getenv("HMI_DELTA_MAX_RATIO", "0.9"))
+        max_workers = max_workers or int(os.getenv("HMI_DELTA_WORKERS", "2"))
+
+        os.makedirs(self.delta_directory, exist_ok=True)
+
+        # Spawned workers do not inherit the server's sockets and threads
+        self.executor = ProcessPoolExecutor(max_workers=max_workers,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        # Image reads happen off the caller's thread before jobs enter the pool
+        self.loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="delta-loader")
+        self.jobs: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        self.pending = set()  # Futures of both pools that have not finished, cancelled on shutdown
+
+    @staticmethod
+    def _job_key(ecu_name: str, model_number: str, from_version: str, to_version: str) -> str:
+        # ECU names are not unique across models, so the model is part of every key
+        return f"{ecu_name}/{model_number}:{from_version}->{to_version}"
+
+    def _delta_file_name(self, ecu_name: str, model_number: str, from_version: str, to_version: str) -> str:
+        return os.path.join(self.delta_directory, f"{ecu_name}_{model_number}_{from_version}_to_{to_version}.delta")
+
+    @staticmethod
+    def _matches(job: Dict, base_sha256: Optional[str], target_sha256: Optional[str]) -> bool:
+        """Whether a delta was built from these images; digests that are not known are not checked"""
+        return ((not base_sha256 or job.get("base_sha256") == base_sha256)
+                and (not target_sha256 or job.get("target_sha256") == target_sha256))
+
+    def schedule_catalog(self, car_types: List[CarType]):
+        """Enqueue deltas for the latest version of every ECU in the catalog"""
+        seen = set()
+        for car_type in car_types:
+            for ecu in car_type.ecus:
+                if (ecu.name, ecu.model_number) in seen:
+                    continue
+                seen.add((ecu.name, ecu.model_number))
+                self.schedule_ecu(ecu)
+
+    def schedule_ecu(self, ecu: ECU):
+        """Enqueue deltas from the previous history_depth versions to the latest one"""
+        versions = ecu.sorted_versions()
+        if len(versions) < 2:
+            return
+
+        target = versions[-1]
+        for base in versions[-self.history_depth - 1:-1]:
+            if base.hex_file_path == target.hex_file_path:
+                continue
+            self.enqueue(ecu.name, ecu.model_number, base, target)
+
+    def enqueue(self, ecu_name: str, model_number: str, base: Version, target: Version):
+        """Enqueue a single delta job unless a delta between these images is already known"""
+        key = self._job_key(ecu_name, model_number, base.version_number, target.version_number)
+        with self.lock:
+            existing = self.jobs.get(key)
+            # A version republished with other bytes keeps its number, so the digests decide
+            if existing and existing["status"] != "failed" and self._matches(existing, base.sha256, target.sha256):
+                return
+
+            self.jobs[key] = {
+                "ecu_name": ecu_name,
+                "model_number": model_number,
+                "from_version": base.version_number,
+                "to_version": target.version_number,
+                "status": "queued",
+                "enqueued_at": datetime.now().isoformat(),
+                "delta_path": self._delta_file_name(ecu_name, model_number, base.version_number,
+                                                    target.version_number)
+            }
+
+        logging.info(f"🧩 Delta job queued: {key}")
+        self._track(self.loader.submit(self._submit_job, key, base, target))
+
+    def _submit_job(self, key: str, base: Version, target: Version):
+        """Reuse a delta of an earlier run built from the same images, or hand the diff over to the process pool"""
+        try:
+            with self.lock:
+                delta_path = self.jobs[key]["delta_path"]
+            stored = self._load_metadata(delta_path)
+            if stored and base.sha256 and target.sha256 and self._matches(stored, base.sha256, target.sha256):
+                self._reuse_job(key, stored)
+                return
+
+            old_data = self.db_manager.read_file_bytes(base.hex_file_path)
+            new_data = self.db_manager.read_file_bytes(target.hex_file_path)
+            if old_data is None or new_data is None:
+                raise Exception("Failed to read firmware images")
+
+            # Versions published before digests were stored are checked against the images themselves
+            if stored and self._matches(stored, hashlib.sha256(old_data).hexdigest(),
+                                        hashlib.sha256(new_data).hexdigest()):
+                self._reuse_job(key, stored)
+                return
+
+            with self.lock:
+                self.jobs[key]["status"] = "running"
+                self.jobs[key]["started_at"] = datetime.now().isoformat()
+
+            future = self._track(self.executor.submit(_build_delta_job, old_data, new_data))
+            future.add_done_callback(lambda f: self._finish_job(key, f))
+        except Exception as e:
+            self._fail_job(key, str(e))
+
+    def _track(self, future: Future) -> Future:
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    def _reuse_job(self, key: str, stored: Dict):
+        with self.lock:
+            self.jobs[key] = stored
+        logging.info(f"♻️ Delta job {key} reused from disk ({stored['status']})")
+
+    def _finish_job(self, key: str, future):
+        """Store the finished delta next to its metadata"""
+        try:
+            result = future.result()
+            with self.lock:
+                job = dict(self.jobs[key])
+
+            job.update({
+                "size": result["size"],
+                "sha256": result["sha256"],
+                "base_sha256": result["base_sha256"],
+                "target_sha256": result["target_sha256"],
+                "target_size": result["target_size"],
+                "finished_at": datetime.now().isoformat()
+            })
+
+            # A delta that saves almost nothing is not worth serving
+            if result["size"] >= result["target_size"] * self.max_ratio:
+                job["status"] = "not_beneficial"
+            else:
+                with open(job["delta_path"], "wb") as f:
+                    f.write(result["delta"])
+                job["status"] = "completed"
+
+            with open(job["delta_path"] + ".json", "w") as f:
+                json.dump(job, f)
+
+            with self.lock:
+                self.jobs[key] = job
+
+            self.db_manager.save_delta_metadata(job)
+            logging.info(f"✅ Delta job {key} {job['status']} ({result['size']} bytes for {result['target_size']} byte image)")
+        except Exception as e:
+            self._fail_job(key, str(e))
+
+    def _fail_job(self, key: str, error: str):
+        with self.lock:
+            self.jobs[key]["status"] = "failed"
+            self.jobs[key]["error"] = error
+        logging.error(f"❌ Delta job {key} failed: {error}")
+
+    def _load_metadata(self, delta_path: str) -> Optional[Dict]:
+        """Metadata of a delta computed by an earlier run; the caller checks its digests"""
+        try:
+            with open(delta_path + ".json") as f:
+                job = json.load(f)
+            if job.get("status") not in ("completed", "not_beneficial"):
+                return None
+            if not job.get("base_sha256") or not job.get("target_sha256"):
+                return None
+            if job["status"] == "completed" and not os.path.exists(delta_path):
+                return None
+            return job
+        except (OSError, ValueError):
+            return None
+
+    def get_delta(self, ecu_name: str, model_number: str, from_version: str, to_version: str,
+                  base_sha256: str = None, target_sha256: str = None) -> Optional[Dict]:
+        """Return metadata of a ready delta between these images, or None if there is none"""
+        with self.lock:
+            job = self.jobs.get(self._job_key(ecu_name, model_number, from_version, to_version))
+            if job and job["status"] == "completed" and self._matches(job, base_sha256, target_sha256):
+                return dict(job)
+        return None
+
+    def get_status(self) -> Dict:
+        """Summarize the delta queue for inspection"""
+        with self.lock:
+            jobs = [dict(job) for job in self.jobs.values()]
+
+        counts = {}
+        for job in jobs:
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+
+        return {
+            "history_depth": self.history_depth,
+            "counts": counts,
+            "jobs": jobs
+        }
+
+    def shutdown(self):
+        """Stop accepting work and drop queued jobs"""
+        # Jobs already running cannot be cancelled and finish in the background
+        for future in list(self.pending):
+            future.cancel()
+        self.loader.shutdown(wait=False)
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,51 @@
+from typing import Dict
+from models import Version, FlashingFeedback, RolloutCampaign
+from enums import UpdatePriority
+
+
+def version_from_doc(version_info: Dict) -> Version:
+    """Build a Version from its stored document"""
+    return Version(
+        version_number=version_info['version_number'],
+        compatible_car_types=version_info['compatible_car_types'],
+        hex_file_path=version_info['hex_file_path'],
+        sha256=version_info.get('sha256'),
+        priority=UpdatePriority.parse(version_info.get('priority')),
+        requires=version_info.get('requires', {}),
+        min_from_version=version_info.get('min_from_version'),
+        file_metadata=version_info.get('file_metadata')
+    )
+
+
+def campaign_from_doc(campaign_info: Dict) -> RolloutCampaign:
+    """Build a RolloutCampaign from its stored document"""
+    return RolloutCampaign(
+        campaign_id=str(campaign_info.get('campaign_id', campaign_info.get('_id'))),
+        ecu_name=campaign_info['ecu_name'],
+        target_version=campaign_info['target_version'],
+        car_types=campaign_info.get('car_types', []),
+        percentage=campaign_info.get('percentage', 100.0),
+        waves=campaign_info.get('waves', []),
+        max_active_downloads=campaign_info.get('max_active_downloads', 0),
+        status=campaign_info.get('status', 'active'),
+        priority=UpdatePriority.parse(campaign_info.get('priority'))
+    )
+
+
+def feedback_to_doc(feedback: FlashingFeedback) -> Dict:
+    """Stored document of a flashing feedback report"""
+    return {
+        "session_id": feedback.session_id,
+        "car_id": feedback.car_id,
+        "car_type": feedback.car_type,
+        "flashing_timestamp": feedback.flashing_timestamp,
+        "overall_status": feedback.overall_status,
+        "total_ecus": feedback.total_ecus,
+        "successful_ecus": feedback.successful_ecus,
+        "rolled_back_ecus": feedback.rolled_back_ecus,
+        "final_ecu_versions": feedback.final_ecu_versions,
+        "android_app_version": feedback.android_app_version,
+        "beaglebone_version": feedback.beaglebone_version,
+        "request_id": feedback.request_id,
+        "received_timestamp": feedback.received_timestamp
+    }
@@ -13,6 +13,22 @@ class RequestStatus(Enum):
     FAILED = "failed"
     REJECTED = "rejected"
 
+class UpdatePriority(Enum):
+    LOW = -1
+    NORMAL = 0
+    HIGH = 1
+    CRITICAL = 2
+
+    @classmethod
+    def parse(cls, value) -> int:
+        """Priority level from a stored name or number, NORMAL when unknown"""
+        if isinstance(value, str):
+            member = cls.__members__.get(value.upper())
+            return member.value if member else cls.NORMAL.value
+        if isinstance(value, (int, float)):
+            return int(value)
+        return cls.NORMAL.value
+
 class DownloadStatus(Enum):
     PREPARING_FILES = "preparingFiles"
     SENDING_IN_PROGRESS = "sendingInProgress"
@@ -0,0 +1,280 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from models import CarType
+from compression import available_codecs, compress
+from firmware_image import convert_to_binary, FirmwareFormatError
+from chunking import build_manifest
+
+
+class FirmwareCache:
+    """
+    Local on-disk cache of firmware images and their precomputed variants.
+    Entries are keyed by the SHA-256 of the image, so versions sharing the
+    same bytes share one download and one set of variants.
+    """
+
+    def __init__(self, db_manager, data_directory: str, max_workers: int = None):
+        self.db_manager = db_manager
+        self.cache_directory = os.path.join(data_directory, "cache")
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+        max_workers = max_workers or int(os.getenv("HMI_CACHE_WORKERS", "2"))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="firmware-cache")
+        # Separate pool so prefetches for waiting cars never queue behind catalog precomputation
+        prefetch_workers = int(os.getenv("HMI_PREFETCH_WORKERS", "4"))
+        self.prefetch_executor = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="firmware-prefetch")
+        self.prefetching = set()  # (file path, codec, image format) being fetched
+        self.locks: Dict[str, threading.Lock] = {}
+        self.locks_guard = threading.Lock()
+        self.digests: Dict[str, str] = {}  # file path -> SHA-256
+        self.warmed = set()
+        self.not_convertible = set()
+        self.queued = set()  # Futures of both pools not finished yet
+
+    def _submit(self, executor: ThreadPoolExecutor, fn, *args) -> Future:
+        future = executor.submit(fn, *args)
+        self.queued.add(future)
+        future.add_done_callback(self.queued.discard)
+        return future
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        with self.locks_guard:
+            return self.locks.setdefault(key, threading.Lock())
+
+    def _entry_path(self, digest: str, suffix: str) -> str:
+        return os.path.join(self.cache_directory, f"{digest}.{suffix}")
+
+    def register_digest(self, file_path: str, digest: Optional[str]):
+        """Remember the content digest published for a file path"""
+        if digest:
+            with self.locks_guard:
+                self.digests[file_path] = digest
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def get_digest(self, file_path: str) -> Optional[str]:
+        """Return the digest of a file, caching the image locally if needed"""
+        digest = self.digests.get(file_path)
+        if digest and os.path.exists(self._entry_path(digest, "raw")):
+            return digest
+
+        with self._lock_for(file_path):
+            digest = self.digests.get(file_path)
+            if digest and os.path.exists(self._entry_path(digest, "raw")):
+                return digest
+
+            data = self.db_manager.read_file_bytes(file_path)
+            if data is None:
+                return None
+
+            actual_digest = hashlib.sha256(data).hexdigest()
+            if digest and digest != actual_digest:
+                logging.error(f"❌ Firmware image {file_path} does not match its published digest")
+                return None
+
+            path = self._entry_path(actual_digest, "raw")
+            if not os.path.exists(path):
+                self._write_atomic(path, data)
+                logging.info(f"📥 Cached firmware image {file_path} ({len(data)} bytes, sha256 {actual_digest[:12]})")
+            self.register_digest(file_path, actual_digest)
+            return actual_digest
+
+    def get_source(self, file_path: str) -> Optional[str]:
+        """Return a local copy of the firmware image, fetching it once"""
+        digest = self.get_digest(file_path)
+        return self._entry_path(digest, "raw") if digest else None
+
+    def get_cached_source(self, file_path: str) -> Optional[str]:
+        """
+        Local copy of the image if it is cached or being prefetched, without starting a fetch.
+        An in-flight prefetch is waited for, since it is already most of the way there.
+        """
+        digest = self.digests.get(file_path)
+        if digest and os.path.exists(self._entry_path(digest, "raw")):
+            return self._entry_path(digest, "raw")
+        with self.locks_guard:
+            inflight = any(key[0] == file_path for key in self.prefetching)
+        return self.get_source(file_path) if inflight else None
+
+    def prefetch(self, file_path: str, codec: Optional[str] = None, image_format: str = "original"):
+        """Fetch an image and the variant a car negotiated in the background"""
+        key = (file_path, codec, image_format)
+        with self.locks_guard:
+            if key in self.prefetching:
+                return
+            self.prefetching.add(key)
+
+        def run():
+            try:
+                if codec or image_format != "original":
+                    self.get_variant(file_path, codec, image_format)
+                else:
+                    self.get_source(file_path)
+            except Exception as e:
+                logging.error(f"Error prefetching {file_path}: {str(e)}")
+            finally:
+                with self.locks_guard:
+                    self.prefetching.discard(key)
+
+        try:
+            self._submit(self.prefetch_executor, run)
+        except RuntimeError:
+            # Executor already shut down
+            with self.locks_guard:
+                self.prefetching.discard(key)
+
+    def get_binary(self, file_path: str) -> Optional[str]:
+        """Return a local compact binary image converted from a SREC/Intel HEX source"""
+        digest = self.get_digest(file_path)
+        if digest is None or digest in self.not_convertible:
+            return None
+
+        path = self._entry_path(digest, "bin")
+        if os.path.exists(path):
+            return path
+
+        source_path = self._entry_path(digest, "raw")
+
+        with self._lock_for(path):
+            if os.path.exists(path):
+                return path
+            try:
+                with open(source_path, "rb") as f:
+                    image = convert_to_binary(f)
+            except FirmwareFormatError as e:
+                logging.error(f"❌ Firmware image {file_path} failed validation: {str(e)}")
+                image = None
+
+            if image is None:
+                self.not_convertible.add(digest)
+                return None
+            self._write_atomic(path, image)
+            logging.info(f"🔧 Converted {file_path} to binary image: {os.path.getsize(source_path)} -> {len(image)} bytes")
+            return path
+
+    def get_variant(self, file_path: str, codec: Optional[str],
+                    image_format: str = "original") -> Tuple[Optional[str], int, str, Optional[str]]:
+        """
+        Return (local path, size, image format, codec) of the image in the requested form.
+        Falls back to the original format when the source cannot be converted, and to
+        the uncompressed image (codec None) when compressing it does not make it smaller.
+        """
+        source_path = None
+        if image_format == "binary":
+            source_path = self.get_binary(file_path)
+        if source_path is None:
+            image_format = "original"
+            source_path = self.get_source(file_path)
+        if source_path is None:
+            return None, 0, image_format, None
+        source_size = os.path.getsize(source_path)
+        if not codec:
+            return source_path, source_size, image_format, None
+
+        suffix = f"bin.{codec}" if image_format == "binary" else codec
+        path = self._entry_path(self.digests[file_path], suffix)
+        if not os.path.exists(path):
+            with self._lock_for(path):
+                if not os.path.exists(path):
+                    with open(source_path, "rb") as f:
+                        data = f.read()
+                    compressed = compress(codec, data)
+                    self._write_atomic(path, compressed)
+                    logging.info(f"🗜️ Cached {codec} stream for {file_path}: {len(data)} -> {len(compressed)} bytes")
+        size = os.path.getsize(path)
+        if size >= source_size:
+            # Already compressed or random data only grows; send it as it is
+            return source_path, source_size, image_format, None
+        return path, size, image_format, codec
+
+    def _published_manifest(self, file_path: str, image_size: int) -> Optional[List]:
+        """
+        Manifest computed by the website when the image was published. Only converted
+        images and images published before manifests were stored are chunked here.
+        """
+        manifest = self.db_manager.get_chunk_manifest(self.digests[file_path])
+        if manifest and sum(chunk[2] for chunk in manifest) != image_size:
+            logging.error(f"❌ Published chunk manifest of {file_path} does not cover the image")
+            return None
+        return manifest or None
+
+    def get_manifest(self, file_path: str, image_format: str = "original") -> Tuple[Optional[List], Optional[str], str]:
+        """
+        Return (chunk manifest, local image path, image format) for the uncompressed
+        image in the requested form
+        """
+        image_path, _, image_format, _ = self.get_variant(file_path, None, image_format)
+        if image_path is None:
+            return None, None, image_format
+
+        manifest_path = f"{image_path}.manifest.json"
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                return json.load(f), image_path, image_format
+
+        with self._lock_for(manifest_path):
+            if not os.path.exists(manifest_path):
+                manifest = None
+                if image_format == "original":
+                    manifest = self._published_manifest(file_path, os.path.getsize(image_path))
+                if manifest is None:
+                    with open(image_path, "rb") as f:
+                        manifest = build_manifest(f.read())
+                    logging.info(f"🧱 Built chunk manifest for {file_path} ({image_format}): {len(manifest)} chunks")
+                self._write_atomic(manifest_path, json.dumps(manifest).encode())
+                return manifest, image_path, image_format
+
+        with open(manifest_path) as f:
+            return json.load(f), image_path, image_format
+
+    def precompute(self, file_path: str, codecs: List[str] = None):
+        """Build the binary image, chunk manifests and every compressed variant of one image"""
+        try:
+            for image_format in ("original", "binary"):
+                self.get_manifest(file_path, image_format)
+                for codec in codecs or available_codecs():
+                    self.get_variant(file_path, codec, image_format)
+        except Exception as e:
+            logging.error(f"Error precomputing variants for {file_path}: {str(e)}")
+
+    def precompute_catalog(self, car_types: List[CarType]):
+        """Warm binary, chunked and compressed variants of the latest version of every ECU in the background"""
+        file_paths = []
+        for car_type in car_types:
+            for ecu in car_type.ecus:
+                for version in ecu.versions:
+                    self.register_digest(version.hex_file_path, version.sha256)
+                latest_version = ecu.get_latest_version()
+                if latest_version and latest_version.hex_file_path not in file_paths:
+                    file_paths.append(latest_version.hex_file_path)
+
+        for file_path in file_paths:
+            self.warm(file_path)
+
+    def warm(self, file_path: str, digest: Optional[str] = None):
+        """Fetch an image and build all of its variants in the background, once per digest"""
+        self.register_digest(file_path, digest)
+        # Paths sharing a published digest are warmed only once
+        warm_key = self.digests.get(file_path, file_path)
+        with self.locks_guard:
+            if warm_key in self.warmed:
+                return
+            self.warmed.add(warm_key)
+        self._submit(self.executor, self.precompute, file_path)
+
+    def shutdown(self):
+        # Queued warmups and prefetches are dropped; the ones running finish their current file
+        for future in list(self.queued):
+            future.cancel()
+        self.executor.shutdown(wait=False)
+        self.prefetch_executor.shutdown(wait=False)
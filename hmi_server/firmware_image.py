@@ -0,0 +1,212 @@
+import struct
+import zlib
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+
+# Compact binary image layout:
+#   header  magic(4) layout_version(B) source_format(B) segment_count(H) entry_point(I) data_crc32(I)
+#   table   segment_count x (address(I) length(I) data_offset(I))
+#   data    segment payloads back to back
+BINARY_MAGIC = b"OTAB"
+BINARY_LAYOUT_VERSION = 1
+_HEADER = struct.Struct(">4sBBHII")
+_SEGMENT = struct.Struct(">III")
+NO_ENTRY_POINT = 0xFFFFFFFF
+
+SOURCE_FORMATS = {"srec": 1, "ihex": 2}
+
+# SREC record type -> address length in bytes
+_SREC_ADDRESS_SIZES = {"0": 2, "1": 2, "2": 3, "3": 4, "5": 2, "6": 3, "7": 4, "8": 3, "9": 2}
+
+
+class FirmwareFormatError(ValueError):
+    """Raised when a text firmware image is malformed"""
+
+
+def detect_format(head: bytes) -> Optional[str]:
+    """Guess the text format from the first bytes of an image"""
+    try:
+        first_line = head.lstrip().split(b"\n", 1)[0].strip().decode("ascii")
+    except UnicodeDecodeError:
+        return None
+    if len(first_line) >= 10 and first_line[0] == "S" and first_line[1] in _SREC_ADDRESS_SIZES:
+        return "srec"
+    if len(first_line) >= 11 and first_line[0] == ":":
+        return "ihex"
+    return None
+
+
+def _decode_records(lines: Iterable[bytes], image_format: str) -> List[Tuple[str, bytes]]:
+    """
+    Decode a batch of record lines to raw bytes and verify their checksums.
+    The hex of the whole batch is decoded in one bytes.fromhex call; each
+    record's checksum is then summed over its slice of the decoded buffer.
+    """
+    prefix = 2 if image_format == "srec" else 1
+    record_types = []
+    payloads = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        payload = line[prefix:]
+        if len(line) < prefix or len(payload) % 2:
+            raise FirmwareFormatError(f"Malformed record: {line[:40]!r}")
+        record_types.append(chr(line[1]) if image_format == "srec" else None)
+        payloads.append(payload)
+
+    try:
+        buffer = bytes.fromhex(b"".join(payloads).decode("ascii"))
+    except (UnicodeDecodeError, ValueError):
+        # Name the offending line; only failing batches pay for decoding line by line
+        for payload in payloads:
+            try:
+                bytes.fromhex(payload.decode("ascii"))
+            except (UnicodeDecodeError, ValueError):
+                raise FirmwareFormatError(f"Malformed record: {payload[:40]!r}")
+        raise FirmwareFormatError("Malformed record batch")
+
+    # SREC: count..checksum sums to 0xFF; Intel HEX: all bytes sum to 0
+    expected = 0xFF if image_format == "srec" else 0x00
+    view = memoryview(buffer)
+    records = []
+    bad = []
+    offset = 0
+    for index, (record_type, payload) in enumerate(zip(record_types, payloads)):
+        end = offset + len(payload) // 2
+        if sum(view[offset:end]) & 0xFF != expected:
+            bad.append(index)
+        records.append((record_type, buffer[offset:end]))
+        offset = end
+    if bad:
+        raise FirmwareFormatError(f"Checksum mismatch in {len(bad)} record(s), first at record {bad[0] + 1}")
+    return records
+
+
+class _SegmentBuilder:
+    """Accumulates data records into a sparse list of contiguous segments"""
+
+    def __init__(self):
+        self.segments: List[Tuple[int, bytearray]] = []
+        self.entry_point = NO_ENTRY_POINT
+
+    def add(self, address: int, data: bytes):
+        if not data:
+            return
+        if self.segments:
+            start, buffer = self.segments[-1]
+            if start + len(buffer) == address:
+                buffer.extend(data)
+                return
+        self.segments.append((address, bytearray(data)))
+
+    def finish(self) -> List[Tuple[int, bytes]]:
+        segments = sorted(self.segments, key=lambda segment: segment[0])
+        merged: List[Tuple[int, bytearray]] = []
+        for address, data in segments:
+            if merged:
+                previous_address, previous_data = merged[-1]
+                previous_end = previous_address + len(previous_data)
+                if address < previous_end:
+                    raise FirmwareFormatError(f"Overlapping data at address 0x{address:08X}")
+                if address == previous_end:
+                    previous_data.extend(data)
+                    continue
+            merged.append((address, data))
+        return [(address, bytes(data)) for address, data in merged]
+
+
+def _apply_srec(builder: _SegmentBuilder, records: List[Tuple[str, bytes]]):
+    for record_type, raw in records:
+        address_size = _SREC_ADDRESS_SIZES.get(record_type)
+        if address_size is None:
+            raise FirmwareFormatError(f"Unknown SREC record type S{record_type}")
+        if raw[0] != len(raw) - 1:
+            raise FirmwareFormatError("SREC byte count does not match record length")
+        address = int.from_bytes(raw[1:1 + address_size], "big")
+        if record_type in "123":
+            builder.add(address, raw[1 + address_size:-1])
+        elif record_type in "789":
+            builder.entry_point = address
+
+
+def _apply_ihex(builder: _SegmentBuilder, records: List[Tuple[str, bytes]], state: dict):
+    for _, raw in records:
+        if state["done"]:
+            break
+        length, address, record_type = raw[0], int.from_bytes(raw[1:3], "big"), raw[3]
+        if length != len(raw) - 5:
+            raise FirmwareFormatError("Intel HEX byte count does not match record length")
+        data = raw[4:-1]
+        if record_type == 0x00:
+            builder.add(state["base"] + address, data)
+        elif record_type == 0x01:
+            state["done"] = True
+        elif record_type == 0x02:
+            state["base"] = int.from_bytes(data, "big") << 4
+        elif record_type == 0x03:
+            builder.entry_point = (int.from_bytes(data[:2], "big") << 4) + int.from_bytes(data[2:], "big")
+        elif record_type == 0x04:
+            state["base"] = int.from_bytes(data, "big") << 16
+        elif record_type == 0x05:
+            builder.entry_point = int.from_bytes(data, "big")
+        else:
+            raise FirmwareFormatError(f"Unknown Intel HEX record type {record_type:02X}")
+
+
+def parse_text_image(stream: BinaryIO, image_format: str, batch_lines: int = 4096) -> Tuple[List[Tuple[int, bytes]], int]:
+    """Stream a SREC or Intel HEX image and return (segments, entry point)"""
+    builder = _SegmentBuilder()
+    ihex_state = {"base": 0, "done": False}
+
+    while True:
+        lines = stream.readlines(batch_lines * 80)
+        if not lines:
+            break
+        records = _decode_records(lines, image_format)
+        if image_format == "srec":
+            _apply_srec(builder, records)
+        else:
+            _apply_ihex(builder, records, ihex_state)
+
+    return builder.finish(), builder.entry_point
+
+
+def encode_binary_image(segments: List[Tuple[int, bytes]], entry_point: int, source_format: str) -> bytes:
+    """Pack segments into the compact binary layout"""
+    table = bytearray()
+    data = bytearray()
+    for address, payload in segments:
+        table.extend(_SEGMENT.pack(address, len(payload), len(data)))
+        data.extend(payload)
+
+    header = _HEADER.pack(BINARY_MAGIC, BINARY_LAYOUT_VERSION, SOURCE_FORMATS[source_format],
+                          len(segments), entry_point, zlib.crc32(data))
+    return header + bytes(table) + bytes(data)
+
+
+def decode_binary_image(image: bytes) -> Tuple[List[Tuple[int, bytes]], int]:
+    """Unpack a compact binary image into (segments, entry point)"""
+    magic, layout_version, _, segment_count, entry_point, data_crc = _HEADER.unpack_from(image)
+    if magic != BINARY_MAGIC or layout_version != BINARY_LAYOUT_VERSION:
+        raise FirmwareFormatError("Not a compact binary firmware image")
+
+    data_start = _HEADER.size + segment_count * _SEGMENT.size
+    data = image[data_start:]
+    if zlib.crc32(data) != data_crc:
+        raise FirmwareFormatError("Binary image data CRC mismatch")
+
+    segments = []
+    for index in range(segment_count):
+        address, length, offset = _SEGMENT.unpack_from(image, _HEADER.size + index * _SEGMENT.size)
+        segments.append((address, data[offset:offset + length]))
+    return segments, entry_point
+
+
+def convert_to_binary(stream: BinaryIO) -> Optional[bytes]:
+    """Convert a text firmware image to the compact binary layout, or None if it is not text"""
+    image_format = detect_format(stream.read(256))
+    if image_format is None:
+        return None
+    stream.seek(0)
+    segments, entry_point = parse_text_image(stream, image_format)
+    return encode_binary_image(segments, entry_point, image_format)
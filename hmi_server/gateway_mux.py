@@ -0,0 +1,269 @@
+import os
+import json
+import socket
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional
+from protocol import Protocol
+
+
+class MuxSessionChannel:
+    """
+    One car's session on a gateway connection. Stands in for the car's socket
+    in the request handlers: send() tags each frame with the session id and
+    receive_message() returns the session's next frame from the gateway.
+    Both directions are credit based: send() spends a credit per frame and
+    waits for the gateway's WINDOW_UPDATE when none are left, and reading
+    frames returns credits to the gateway so it never has more than the
+    window of frames waiting here.
+    """
+
+    def __init__(self, connection: "GatewayConnection", session_id: str):
+        self.connection = connection
+        self.session_id = session_id
+        self.inbox: Deque[Dict] = deque()
+        self.condition = threading.Condition()
+        self.send_credits = connection.session_window
+        self.consumed = 0  # frames read since credits were last returned to the gateway
+        self.timeout: Optional[float] = None
+        self.ended = False
+
+    def settimeout(self, timeout: Optional[float]):
+        self.timeout = timeout
+
+    def send(self, data: bytes) -> int:
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.ended or self.send_credits > 0, self.timeout):
+                raise socket.timeout(f"Session {self.session_id} got no window update from the gateway")
+            if self.ended:
+                raise ConnectionError(f"Session {self.session_id} is closed")
+            self.send_credits -= 1
+        self.connection.send_frame(self.session_id, data)
+        return len(data)
+
+    sendall = send
+
+    def grant(self, frames: int):
+        """The gateway forwarded frames to the car and lets this session send as many more"""
+        with self.condition:
+            self.send_credits += frames
+            self.condition.notify_all()
+
+    def backlogged(self) -> bool:
+        with self.condition:
+            return len(self.inbox) >= self.connection.session_window
+
+    def deliver(self, message: Dict, timeout: Optional[float]) -> bool:
+        """
+        Queue a frame from the gateway. A gateway that overruns the window is
+        pushed back by holding its reader until the handler catches up;
+        False when the session stayed full for the whole timeout.
+        """
+        with self.condition:
+            if not self.condition.wait_for(
+                    lambda: self.ended or len(self.inbox) < self.connection.session_window, timeout):
+                return False
+            if not self.ended:
+                self.inbox.append(message)
+                self.condition.notify_all()
+        return True
+
+    def receive_message(self) -> Optional[Dict]:
+        credits = 0
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.ended or self.inbox, self.timeout):
+                logging.error(f"Timeout while receiving message on session {self.session_id}")
+                return None
+            if not self.inbox:
+                # Keep answering None to later reads as a closed socket would
+                return None
+            message = self.inbox.popleft()
+            self.condition.notify_all()
+            self.consumed += 1
+            # Credits go back in batches, not one frame per frame read
+            if self.consumed >= max(1, self.connection.session_window // 2):
+                credits, self.consumed = self.consumed, 0
+
+        if credits:
+            try:
+                self.connection.send_frame(self.session_id, Protocol.create_message(
+                    Protocol.WINDOW_UPDATE, {'frames': credits}
+                ))
+            except Exception as e:
+                logging.error(f"Error returning window to session {self.session_id}: {str(e)}")
+        return message
+
+    def end(self):
+        """The gateway closed the session or the connection dropped"""
+        with self.condition:
+            self.ended = True
+            self.condition.notify_all()
+
+    def close(self):
+        """Called by the handler when it is done; tells the gateway unless the gateway ended the session"""
+        if self.connection.remove_session(self.session_id, self) and not self.ended:
+            self.end()
+            try:
+                self.connection.send_frame(self.session_id, Protocol.create_message(Protocol.SESSION_CLOSE, {}))
+            except Exception as e:
+                logging.error(f"Error closing session {self.session_id}: {str(e)}")
+
+
+class GatewayConnection:
+    """
+    One depot gateway connection carrying many car sessions. A single reader
+    routes frames by session_id to per-session queues, and every writer takes
+    the same lock so frames of different sessions never interleave.
+    Frames without a session_id are for the connection itself (batch checks);
+    they run on a worker in arrival order so the reader keeps serving sessions.
+    """
+
+    def __init__(self, client_socket: socket.socket, open_session: Callable[[MuxSessionChannel], bool],
+                 handle_control: Callable[[Dict, "GatewayConnection"], None],
+                 max_sessions: int = None, session_window: int = None, max_pending_control: int = None,
+                 backpressure_seconds: float = None):
+        self.client_socket = client_socket
+        self.open_session = open_session
+        self.handle_control = handle_control
+        self.max_sessions = max_sessions or int(os.getenv("HMI_GATEWAY_MAX_SESSIONS", "64"))
+        # Frames either side may have outstanding per session; the chunk acks of a multiplexed download fit in it
+        self.session_window = session_window or int(os.getenv("HMI_GATEWAY_SESSION_WINDOW", "128"))
+        self.max_pending_control = max_pending_control or int(os.getenv("HMI_GATEWAY_MAX_PENDING_BATCHES", "4"))
+        # How long the reader waits on a session that is over its window before dropping that session
+        self.backpressure_seconds = (backpressure_seconds if backpressure_seconds is not None
+                                     else float(os.getenv("HMI_GATEWAY_BACKPRESSURE_SECONDS", "30")))
+        self.write_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, MuxSessionChannel] = {}
+        self.control = ThreadPoolExecutor(max_workers=1, thread_name_prefix="gateway-control")
+        self.pending_control = 0
+        self.closed = False  # Set once the gateway disconnects; queued batch checks are then skipped
+        self.sessions_opened = 0
+        self.window_waits = 0
+        self.window_overruns = 0
+
+    @staticmethod
+    def tag(session_id: str, data: bytes) -> bytes:
+        """Add the session id to an encoded message without decoding its payload"""
+        body = b'{"session_id": ' + json.dumps(session_id).encode() + b', ' + data[11:]
+        return f"{len(body):010d}".encode() + body
+
+    def send_frame(self, session_id: str, data: bytes):
+        frame = self.tag(session_id, data)
+        with self.write_lock:
+            self.client_socket.sendall(frame)
+
+    def send(self, data: bytes) -> int:
+        """Connection level frames, e.g. BATCH_UPDATE_RESPONSE"""
+        with self.write_lock:
+            self.client_socket.sendall(data)
+        return len(data)
+
+    def remove_session(self, session_id: str, channel: MuxSessionChannel) -> bool:
+        with self.lock:
+            if self.sessions.get(session_id) is not channel:
+                return False
+            del self.sessions[session_id]
+            return True
+
+    def run(self, receive_message: Callable[[socket.socket], Optional[Dict]]):
+        """Read frames until the gateway disconnects, then end its remaining sessions"""
+        try:
+            while True:
+                message = receive_message(self.client_socket)
+                if not message:
+                    break
+                session_id = message.get('session_id')
+                if session_id is None:
+                    self._submit_control(message)
+                else:
+                    self._dispatch(str(session_id), message)
+        finally:
+            self.closed = True
+            self.control.shutdown(wait=False)
+            with self.lock:
+                sessions = list(self.sessions.values())
+                self.sessions.clear()
+            for channel in sessions:
+                channel.end()
+
+    def _submit_control(self, message: Dict):
+        with self.lock:
+            if self.pending_control >= self.max_pending_control:
+                busy = True
+            else:
+                busy = False
+                self.pending_control += 1
+        if busy:
+            self.send(Protocol.create_error_message(
+                429, f"Connection already has {self.max_pending_control} batch checks pending"
+            ))
+            return
+        self.control.submit(self._run_control, message)
+
+    def _run_control(self, message: Dict):
+        try:
+            if self.closed:
+                return
+            self.handle_control(message, self)
+        except Exception as e:
+            logging.error(f"Error handling gateway message {message.get('type')}: {str(e)}")
+        finally:
+            with self.lock:
+                self.pending_control -= 1
+
+    def _dispatch(self, session_id: str, message: Dict):
+        opened = False
+        with self.lock:
+            channel = self.sessions.get(session_id)
+            if channel is None and message['type'] not in (Protocol.SESSION_CLOSE, Protocol.WINDOW_UPDATE):
+                if len(self.sessions) >= self.max_sessions:
+                    channel = False
+                else:
+                    channel = self.sessions[session_id] = MuxSessionChannel(self, session_id)
+                    self.sessions_opened += 1
+                    opened = True
+
+        if channel is None:
+            return
+        if channel is False:
+            self.send_frame(session_id, Protocol.create_error_message(
+                429, f"Connection is at its limit of {self.max_sessions} sessions"
+            ))
+            return
+        if message['type'] == Protocol.SESSION_CLOSE:
+            if self.remove_session(session_id, channel):
+                channel.end()
+            return
+        if message['type'] == Protocol.WINDOW_UPDATE:
+            channel.grant(int(message['payload'].get('frames', 0)))
+            return
+        if channel.backlogged():
+            self.window_waits += 1
+        if not channel.deliver(message, self.backpressure_seconds):
+            # The handler made no progress while the gateway kept ignoring the window; only this session is dropped
+            self.window_overruns += 1
+            logging.warning(f"Session {session_id} stayed over its window of {self.session_window} frames")
+            self.send_frame(session_id, Protocol.create_error_message(
+                429, f"Session window of {self.session_window} frames exceeded"
+            ))
+            if self.remove_session(session_id, channel):
+                channel.end()
+            return
+        if opened and not self.open_session(channel):
+            if self.remove_session(session_id, channel):
+                channel.end()
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "sessions": len(self.sessions),
+                "max_sessions": self.max_sessions,
+                "session_window": self.session_window,
+                "sessions_opened": self.sessions_opened,
+                "pending_batches": self.pending_control,
+                "window_waits": self.window_waits,
+                "window_overruns": self.window_overruns
+            }
@@ -0,0 +1,260 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from models import CarType, ECU, Version
+from catalog_index import CatalogIndex
+from update_planner import CompiledCarType, UpdatePlan, UpdatePlanner
+
+
+class _LoadedCarType:
+    __slots__ = ("index", "planner", "fingerprint")
+
+    def __init__(self, car_type: CarType, size_of: Callable[[Version], int]):
+        self.index = CatalogIndex([car_type])
+        self.planner = UpdatePlanner(self.index.car_types, size_of=size_of)
+        self.fingerprint = hash(tuple(
+            (ecu.name, version.version_number, tuple(version.compatible_car_types),
+             version.hex_file_path, version.sha256)
+            for ecu in car_type.ecus for version in ecu.versions
+        ))
+
+
+class LazyCatalog:
+    """
+    Catalog for very large fleets: a car type's ECU graph and car ids are
+    loaded on first use, at most max_car_types stay in memory (least recently
+    used go first), and car types seen in recent handshakes are loaded ahead
+    in the background. Names that are not found are remembered for
+    miss_seconds, so unknown car types do not reach the database on every handshake.
+    Offers the lookups of CatalogIndex and the planning calls of UpdatePlanner.
+    """
+
+    def __init__(self, load_car_type: Callable[[str], Optional[CarType]], size_of: Callable[[Version], int] = None,
+                 on_load: Callable[[CarType, bool], None] = None, max_car_types: int = None,
+                 recent_seconds: float = None, max_workers: int = None, miss_seconds: float = None):
+        self.load_car_type = load_car_type
+        self.size_of = size_of
+        self.on_load = on_load  # (car type, published versions changed since its last load)
+        self.max_car_types = max_car_types or int(os.getenv("HMI_CATALOG_MAX_CAR_TYPES", "64"))
+        self.recent_seconds = recent_seconds or float(os.getenv("HMI_CATALOG_RECENT_SECONDS", "600"))
+        self.miss_seconds = miss_seconds if miss_seconds is not None else \
+            float(os.getenv("HMI_CATALOG_MISS_SECONDS", "60"))
+        max_workers = max_workers or int(os.getenv("HMI_CATALOG_PREFETCH_WORKERS", "2"))
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="catalog-prefetch")
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[str, Future]" = OrderedDict()  # lower-case name -> Future of _LoadedCarType or None
+        self.fingerprints: Dict[str, int] = {}  # Last seen, kept after eviction to detect changes on reload
+        self.recent: "OrderedDict[str, float]" = OrderedDict()  # car type seen in a handshake -> when
+        self.not_found: "OrderedDict[str, float]" = OrderedDict()  # name the database did not know -> when
+        self.max_not_found = int(os.getenv("HMI_CATALOG_MAX_MISSES", "4096"))
+        self.queued = set()  # Prefetch futures not finished yet, dropped on shutdown
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.prefetches = 0
+
+    @property
+    def car_types(self) -> List[CarType]:
+        """Car types currently in memory"""
+        with self.lock:
+            futures = list(self.entries.values())
+        return [future.result().index.car_types[0] for future in futures
+                if future.done() and future.result() is not None]
+
+    def _entry(self, name: str) -> Optional[_LoadedCarType]:
+        key = (name or "").lower()
+        owner = False
+        with self.lock:
+            future = self.entries.get(key)
+            if future is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            elif self._known_missing(key):
+                self.negative_hits += 1
+                return None
+            else:
+                self.misses += 1
+                future = self.entries[key] = Future()
+                owner = True
+        if owner:
+            self._load(key, name, future)
+        # Threads asking while another one loads the car type wait for that load
+        return future.result()
+
+    def _load(self, key: str, name: str, future: Future):
+        try:
+            car_type = self.load_car_type(name)
+        except Exception as e:
+            logging.error(f"Error loading car type {name}: {str(e)}")
+            car_type = None
+        if car_type is None:
+            # Remembered for miss_seconds only, so a car type published later is found again
+            with self.lock:
+                if self.entries.get(key) is future:
+                    del self.entries[key]
+                self.not_found[key] = time.monotonic()
+                self.not_found.move_to_end(key)
+                while len(self.not_found) > self.max_not_found:
+                    self.not_found.popitem(last=False)
+            future.set_result(None)
+            return
+
+        loaded = _LoadedCarType(car_type, self.size_of)
+        with self.lock:
+            previous = self.fingerprints.get(key)
+            self.fingerprints[key] = loaded.fingerprint
+            self._evict()
+        future.set_result(loaded)
+        if self.on_load:
+            self.on_load(loaded.index.car_types[0], previous is not None and previous != loaded.fingerprint)
+
+    def _known_missing(self, key: str) -> bool:
+        """Whether the name was not found within miss_seconds; the caller holds the lock"""
+        missed_at = self.not_found.get(key)
+        if missed_at is None:
+            return False
+        if time.monotonic() - missed_at < self.miss_seconds:
+            return True
+        del self.not_found[key]
+        return False
+
+    def forget_missing(self):
+        """Look unknown names up again, e.g. after a publish event"""
+        with self.lock:
+            self.not_found.clear()
+
+    def _evict(self):
+        """Drop least recently used car types beyond the bound; the caller holds the lock"""
+        while len(self.entries) > self.max_car_types:
+            key = next((key for key, future in self.entries.items() if future.done()), None)
+            if key is None:
+                break
+            del self.entries[key]
+            self.evictions += 1
+
+    def car_type(self, name: str) -> Optional[CarType]:
+        loaded = self._entry(name)
+        return loaded.index.car_types[0] if loaded else None
+
+    def has_car(self, car_type: str, car_id: str) -> bool:
+        loaded = self._entry(car_type)
+        return loaded is not None and loaded.index.has_car(car_type, car_id)
+
+    def ecu(self, car_type: str, ecu_name: str) -> Optional[ECU]:
+        loaded = self._entry(car_type)
+        return loaded.index.ecu(car_type, ecu_name) if loaded else None
+
+    def version(self, car_type: str, ecu_name: str, version_number: str) -> Optional[Version]:
+        loaded = self._entry(car_type)
+        return loaded.index.version(car_type, ecu_name, version_number) if loaded else None
+
+    def get(self, car_type: str) -> Optional[CompiledCarType]:
+        loaded = self._entry(car_type)
+        return loaded.planner.get(car_type) if loaded else None
+
+    def plan(self, car_type: str, current_versions: Dict[str, str], car_id: str = None,
+             campaigns=None) -> Optional[UpdatePlan]:
+        loaded = self._entry(car_type)
+        return loaded.planner.plan(car_type, current_versions, car_id, campaigns) if loaded else None
+
+    def note_handshake(self, name: str):
+        """Start loading a handshake's car type while the handshake is processed"""
+        key = (name or "").lower()
+        with self.lock:
+            future = self.entries.get(key)
+            if future is None and self._known_missing(key):
+                return
+        if future is not None and future.done():
+            if future.result() is not None:
+                self._remember(key)
+            return
+        if future is None:
+            self.prefetches += 1
+        self._prefetch(self._load_for_handshake, name)
+
+    def _load_for_handshake(self, name: str):
+        # Only car types that exist are remembered, so made-up names are never prefetched again
+        if self._entry(name) is not None:
+            self._remember((name or "").lower())
+
+    def _remember(self, key: str):
+        with self.lock:
+            self.recent[key] = time.time()
+            self.recent.move_to_end(key)
+            while len(self.recent) > self.max_car_types:
+                self.recent.popitem(last=False)
+
+    def prefetch_recent(self):
+        """Load car types seen in recent handshakes that are no longer in memory"""
+        cutoff = time.time() - self.recent_seconds
+        with self.lock:
+            missing = [key for key, seen in self.recent.items() if seen >= cutoff and key not in self.entries]
+        for key in missing:
+            self.prefetches += 1
+            self._prefetch(self._entry, key)
+
+    def _prefetch(self, load: Callable, name: str):
+        future = self.executor.submit(load, name)
+        self.queued.add(future)
+        future.add_done_callback(self.queued.discard)
+
+    def reload(self) -> Optional[bool]:
+        """
+        Reload the car types in memory; returns True when any published versions
+        changed, or None when none of them could be loaded
+        """
+        with self.lock:
+            keys = [key for key, future in self.entries.items() if future.done()]
+        changed = False
+        reloaded = 0
+        for key in keys:
+            future = Future()
+            try:
+                car_type = self.load_car_type(key)
+            except Exception as e:
+                logging.error(f"Error reloading car type {key}: {str(e)}")
+                car_type = None
+            if car_type is None:
+                # Keep serving what is in memory while the database is unreachable
+                continue
+            reloaded += 1
+            loaded = _LoadedCarType(car_type, self.size_of)
+            future.set_result(loaded)
+            with self.lock:
+                previous = self.fingerprints.get(key)
+                self.fingerprints[key] = loaded.fingerprint
+                if key in self.entries:
+                    self.entries[key] = future
+            if previous != loaded.fingerprint:
+                changed = True
+                if self.on_load:
+                    self.on_load(loaded.index.car_types[0], True)
+        if keys and not reloaded:
+            return None
+        return changed
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "mode": "lazy",
+                "car_types_in_memory": len(self.entries),
+                "max_car_types": self.max_car_types,
+                "recent_car_types": list(self.recent),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "prefetches": self.prefetches,
+                "not_found": len(self.not_found),
+                "negative_hits": self.negative_hits
+            }
+
+    def shutdown(self):
+        for future in list(self.queued):
+            future.cancel()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,221 @@
+import os
+import copy
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from models import CarType, ECU, FlashingFeedback, RolloutCampaign
+from documents import version_from_doc, campaign_from_doc, feedback_to_doc
+from storage_backends import BlobStore
+from publish_events import InMemoryEventBus
+
+
+class MemoryCatalogStore:
+    """
+    In-process stand-in for DatabaseManager, so the server, load tests and
+    benchmarks run on one machine without Mongo or Azure.
+    The catalog is seeded from car_types.json, ecus.json, versions.json and
+    campaigns.json in data_directory when they exist.
+    """
+
+    def __init__(self, data_directory: str, blobs: BlobStore = None):
+        self.data_directory = data_directory
+        self.blobs = blobs or BlobStore()
+        self.publish_events = InMemoryEventBus()
+        self.lock = threading.Lock()
+        self.car_types: List[CarType] = []
+        self.campaigns: List[RolloutCampaign] = []
+        self.feedback: List[Dict] = []
+        self.ecu_metrics: Dict[tuple, Dict] = {}  # (car_type, ecu_name, version) -> counters
+        self.car_histories: Dict[str, Dict] = {}
+        self.deltas: Dict[tuple, Dict] = {}
+        self.chunk_manifests: Dict[str, List] = {}  # image SHA-256 -> published manifest
+        self._load_seed()
+
+    def _read_seed(self, file_name: str) -> List[Dict]:
+        path = os.path.join(self.data_directory, file_name)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return json.load(f)
+
+    def _load_seed(self):
+        try:
+            versions = {doc['id']: doc for doc in self._read_seed("versions.json")}
+            ecus = {doc['id']: doc for doc in self._read_seed("ecus.json")}
+            for car_type_info in self._read_seed("car_types.json"):
+                self.car_types.append(CarType(
+                    name=car_type_info['name'],
+                    model_number=car_type_info['model_number'],
+                    ecus=[ECU(
+                        name=ecus[ecu_id]['name'],
+                        model_number=ecus[ecu_id]['model_number'],
+                        versions=[version_from_doc(versions[version_id])
+                                  for version_id in ecus[ecu_id].get('version_ids', []) if version_id in versions]
+                    ) for ecu_id in car_type_info.get('ecu_ids', []) if ecu_id in ecus],
+                    manufactured_count=car_type_info.get('manufactured_count', 0),
+                    car_ids=car_type_info.get('car_ids', [])
+                ))
+            self.campaigns = [campaign_from_doc(doc) for doc in self._read_seed("campaigns.json")]
+            logging.info(f"Loaded {len(self.car_types)} car types from {self.data_directory}")
+        except Exception as e:
+            logging.error(f"Error loading catalog seed files: {str(e)}")
+
+    def save_car_type(self, car_type: CarType):
+        """Add or replace a car type"""
+        with self.lock:
+            self.car_types = [existing for existing in self.car_types if existing.name != car_type.name]
+            self.car_types.append(copy.deepcopy(car_type))
+
+    def save_campaign(self, campaign: RolloutCampaign):
+        """Add or replace a rollout campaign"""
+        with self.lock:
+            self.campaigns = [existing for existing in self.campaigns
+                              if existing.campaign_id != campaign.campaign_id]
+            self.campaigns.append(copy.deepcopy(campaign))
+
+    def load_all_data(self) -> List[CarType]:
+        # Copies, like a fresh Mongo load, so callers cannot change the stored catalog
+        with self.lock:
+            return copy.deepcopy(self.car_types)
+
+    def load_campaigns(self) -> List[RolloutCampaign]:
+        with self.lock:
+            return [copy.deepcopy(campaign) for campaign in self.campaigns if campaign.status == "active"]
+
+    def get_car_type_by_name(self, name: str) -> Optional[CarType]:
+        with self.lock:
+            car_type = next((car_type for car_type in self.car_types if car_type.name.lower() == name.lower()), None)
+            return copy.deepcopy(car_type)
+
+    def get_hex_file_chunk(self, file_path: str, chunk_size: int, offset: int) -> Optional[bytes]:
+        try:
+            return self.blobs.read(file_path, offset, chunk_size)
+        except Exception as e:
+            logging.error(f"Error reading hex file: {str(e)}")
+            return None
+
+    def get_file_size(self, file_path: str) -> int:
+        try:
+            return self.blobs.size(file_path)
+        except Exception as e:
+            logging.error(f"Error getting file size: {str(e)}")
+            return 0
+
+    def read_file_bytes(self, file_path: str) -> Optional[bytes]:
+        try:
+            return self.blobs.read_all(file_path)
+        except Exception as e:
+            logging.error(f"Error reading hex file: {str(e)}")
+            return None
+
+    def get_chunk_manifest(self, digest: str) -> Optional[List]:
+        with self.lock:
+            return self.chunk_manifests.get(digest)
+
+    def save_delta_metadata(self, delta_info: Dict):
+        with self.lock:
+            key = (delta_info["ecu_name"], delta_info["model_number"], delta_info["from_version"],
+                   delta_info["to_version"])
+            self.deltas[key] = {**delta_info, "last_updated": datetime.now()}
+
+    def validate_car_exists(self, car_id: str, car_type: str) -> bool:
+        with self.lock:
+            return any(existing.name == car_type and car_id.lower() in [cid.lower() for cid in existing.car_ids]
+                       for existing in self.car_types)
+
+    def save_flashing_feedback(self, feedback: FlashingFeedback) -> bool:
+        """Record flashing feedback and update the ECU metrics and car history"""
+        if not self.validate_car_exists(feedback.car_id, feedback.car_type):
+            logging.error(f"Car {feedback.car_id} of type {feedback.car_type} not found in database")
+            return False
+
+        with self.lock:
+            self.feedback.append(feedback_to_doc(feedback))
+            now = datetime.now()
+            results = [(ecu_name, "successful_attempts") for ecu_name in feedback.successful_ecus]
+            results += [(ecu_name, "rollback_attempts") for ecu_name in feedback.rolled_back_ecus]
+            for ecu_name, counter in results:
+                version = feedback.final_ecu_versions.get(ecu_name, "unknown")
+                metrics = self.ecu_metrics.setdefault((feedback.car_type, ecu_name, version), {
+                    "car_type": feedback.car_type, "ecu_name": ecu_name, "version": version,
+                    "total_attempts": 0, "successful_attempts": 0, "failed_attempts": 0, "rollback_attempts": 0
+                })
+                metrics["total_attempts"] += 1
+                metrics[counter] += 1
+                metrics["success_rate"] = metrics["successful_attempts"] / metrics["total_attempts"] * 100
+                metrics["last_updated"] = now
+
+            history = self.car_histories.setdefault(feedback.car_id, {
+                "car_id": feedback.car_id, "car_type": feedback.car_type, "total_flashing_sessions": 0,
+                "successful_sessions": 0, "failed_sessions": 0, "partial_success_sessions": 0,
+                "flashing_sessions": []
+            })
+            history["total_flashing_sessions"] += 1
+            if feedback.overall_status == "completed":
+                history["successful_sessions"] += 1
+            elif feedback.overall_status == "partial_failure":
+                history["partial_success_sessions"] += 1
+            else:
+                history["failed_sessions"] += 1
+            history["flashing_sessions"].append(feedback.session_id)
+            history["last_flashing_date"] = feedback.flashing_timestamp
+            history["current_ecu_versions"] = feedback.final_ecu_versions
+            history["last_updated"] = now
+
+        logging.info(f"✅ Flashing feedback saved for car {feedback.car_id} (session: {feedback.session_id})")
+        return True
+
+    def get_flashing_metrics_summary(self, car_type: str = None, days: int = 30) -> Dict:
+        since_date = datetime.now() - timedelta(days=days)
+        with self.lock:
+            matching = [doc for doc in self.feedback
+                        if (not car_type or doc["car_type"] == car_type) and doc["received_timestamp"] >= since_date]
+        breakdown: Dict[str, int] = {}
+        for doc in matching:
+            breakdown[doc["overall_status"]] = breakdown.get(doc["overall_status"], 0) + 1
+        return {
+            "period_days": days,
+            "car_type_filter": car_type,
+            "total_sessions": len(matching),
+            "status_breakdown": breakdown,
+            "car_types_involved": list({doc["car_type"] for doc in matching})
+        }
+
+    def get_car_flashing_history(self, car_id: str) -> Optional[Dict]:
+        with self.lock:
+            history = self.car_histories.get(car_id)
+            return copy.deepcopy(history) if history else None
+
+    def get_recent_flashing_activities(self, limit: int = 50) -> List[Dict]:
+        fields = ("session_id", "car_id", "car_type", "flashing_timestamp", "overall_status", "total_ecus",
+                  "successful_ecus", "rolled_back_ecus", "received_timestamp")
+        with self.lock:
+            recent = sorted(self.feedback, key=lambda doc: doc["received_timestamp"], reverse=True)[:limit]
+            return [{key: doc[key] for key in fields} for doc in recent]
+
+    def get_ecu_success_rates(self, car_type: str = None) -> List[Dict]:
+        with self.lock:
+            rates = [dict(metrics) for metrics in self.ecu_metrics.values()
+                     if not car_type or metrics["car_type"] == car_type]
+        return sorted(rates, key=lambda metrics: metrics["success_rate"], reverse=True)
+
+    def publish_event_source(self) -> InMemoryEventBus:
+        return self.publish_events
+
+    def warm_up(self) -> bool:
+        return True
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "store": "memory",
+                "car_types": len(self.car_types),
+                "campaigns": len(self.campaigns),
+                "feedback_reports": len(self.feedback),
+                "blobs": self.blobs.get_status()
+            }
+
+    def close(self):
+        self.blobs.close()
@@ -1,25 +1,72 @@
 from datetime import datetime
 from typing import List, Dict, Optional
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 from enums import *
 
+
+def slotted(cls):
+    """
+    Rebuild a dataclass with __slots__, as dataclass(slots=True) does on Python 3.10+.
+    Field defaults live in the generated __init__, so the class attributes holding
+    them can go; they would otherwise conflict with the slots.
+    """
+    names = tuple(f.name for f in fields(cls))
+    namespace = {key: value for key, value in cls.__dict__.items()
+                 if key not in names and key not in ("__dict__", "__weakref__")}
+    namespace["__slots__"] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
+
+
+@slotted
 @dataclass
 class Version:
     version_number: str
     compatible_car_types: List[str]
     hex_file_path: str
+    sha256: Optional[str] = None  # Content address in the firmware store
+    priority: int = 0  # UpdatePriority level, higher is more urgent
+    requires: Dict[str, str] = field(default_factory=dict)  # Other ECU name -> minimum version installed first
+    min_from_version: Optional[str] = None  # Oldest version this one can be installed over
+    file_metadata: Optional[Dict] = None  # size, sha256, format, chunk_count, etag recorded at publish
+
+    def published_size(self) -> Optional[int]:
+        """Image size recorded at publish time, None for versions published before it was stored"""
+        return (self.file_metadata or {}).get("size")
+
+    @staticmethod
+    def sort_key(version_number: str) -> tuple:
+        """Semantic version ordering: 1.10.0 > 1.9.2 and 2.0.0 > 2.0.0-rc1"""
+        number = (version_number or "").strip().lower().lstrip("v")
+        if not number:
+            # Unknown versions sort before everything, so any published version is newer
+            return (), False, ()
+        release, _, prerelease = number.partition("-")
+        release_parts = tuple((0, int(part), "") if part.isdigit() else (1, 0, part)
+                              for part in release.split("."))
+        prerelease_parts = tuple((0, int(part), "") if part.isdigit() else (1, 0, part)
+                                 for part in prerelease.split(".")) if prerelease else ()
+        # A release sorts after all of its prereleases
+        return release_parts, not prerelease, prerelease_parts
 
+    def is_compatible_with(self, car_type: str) -> bool:
+        """Versions without a compatibility list fit every car type"""
+        return not self.compatible_car_types or car_type.lower() in (name.lower() for name in self.compatible_car_types)
+
+@slotted
 @dataclass
 class ECU:
     name: str
     model_number: str
     versions: List[Version]
+
+    def sorted_versions(self) -> List[Version]:
+        return sorted(self.versions, key=lambda version: Version.sort_key(version.version_number))
     
     def get_latest_version(self) -> Version:
-        # Assuming versions are stored in order, latest being last
-        print(f"latest version {self.versions[-1] if self.versions else None}")
-        return self.versions[-1] if self.versions else None
+        versions = self.sorted_versions()
+        return versions[-1] if versions else None
 
+@slotted
 @dataclass
 class CarType:
     name: str
@@ -28,27 +75,29 @@ class CarType:
     manufactured_count: int
     car_ids: List[str]
     
-    def check_for_updates(self, current_versions: Dict[str, str]) -> Dict[str, str]:
-        print("Entered check_for_updates")
+    def check_for_updates(self, current_versions: Dict[str, str], car_id: str = None,
+                          campaigns=None) -> Dict[str, str]:
         """
         Check if car needs updates by comparing current versions with latest versions
-        Returns dict of ECU names and their required update versions
+        Returns dict of ECU names and their required update versions, in install order
+        When a CampaignManager is given, versions under staged rollout are only
+        offered to cars their current wave has reached
         """
-        updates_needed = {}
-        
-        for ecu in self.ecus:
-            print(f"\n\n current_versions: ")
-            print(current_versions.values)
-
-            current_versions = {key.lower(): value.lower() for key, value in current_versions.items()}
-
-            print(current_versions)
-            if ecu.name in current_versions:
-                latest_version = ecu.get_latest_version()
-                if latest_version and current_versions[ecu.name] != latest_version.version_number:
-                    print(f"latest_version.version_number: {latest_version.version_number}")
-                    updates_needed[ecu.name] = latest_version.version_number
-        return updates_needed
+        from update_planner import CompiledCarType
+        return CompiledCarType(self).plan(current_versions, car_id, campaigns).updates_needed()
+
+@dataclass
+class RolloutCampaign:
+    """Staged rollout of one ECU version to a growing share of the fleet"""
+    campaign_id: str
+    ecu_name: str
+    target_version: str
+    car_types: List[str] = field(default_factory=list)  # Empty means every car type
+    percentage: float = 100.0  # Share of cars offered the version when no waves are set
+    waves: List[Dict] = field(default_factory=list)  # [{"start": datetime, "percentage": float}]
+    max_active_downloads: int = 0  # Cars allowed in the download phase at once, 0 = unlimited
+    status: str = "active"
+    priority: int = 0  # UpdatePriority level, raises the version's own priority
 
 @dataclass
 class Request:
@@ -60,6 +109,10 @@ class Request:
     service_type: ServiceType
     metadata: Dict  # Contains ECU versions
     status: RequestStatus
+    compression: Optional[str] = None  # Codec negotiated at HANDSHAKE
+    chunk_encoding: str = "hex"  # FILE_CHUNK data encoding negotiated at HANDSHAKE
+    image_format: str = "original"  # "binary" when the car accepts compact binary images
+    push_updates: bool = False  # Car wants UPDATE_RESPONSE pushed when new versions appear
 
 @dataclass
 class DownloadRequest:
@@ -75,6 +128,14 @@ class DownloadRequest:
     transferred_size: int = 0
     active_transfers: Dict[str, bool] = None
     file_offsets: Dict[str, int] = field(default_factory=dict)
+    accept_deltas: bool = False
+    compression: Optional[str] = None
+    chunk_encoding: str = "hex"
+    image_format: str = "original"
+    have_chunks: Optional[set] = None  # Chunk hashes the car already holds
+    multiplex_window: int = 0  # Chunks in flight across ECU streams, 0 = one file at a time
+    priority: int = 0  # Highest UpdatePriority among the requested versions
+    transfer_id: str = ""  # Unique per download; a car may run several at once
 
 # NEW: Flashing feedback models
 @dataclass
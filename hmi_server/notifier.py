@@ -0,0 +1,115 @@
+import socket
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+from models import Request
+from protocol import Protocol
+
+
+class Subscription:
+    """A connected car that asked to be told about new versions"""
+
+    def __init__(self, request: Request, client_socket: socket.socket, send_lock: threading.Lock,
+                 current_versions: Dict[str, str]):
+        self.request = request
+        self.client_socket = client_socket
+        self.send_lock = send_lock
+        self.current_versions = dict(current_versions)
+        self.last_offered: Dict[str, str] = {}
+        self.checked_key: Optional[tuple] = None  # Offer key of the last completed re-check
+        self.pushes = 0
+
+
+class UpdateNotifier:
+    """
+    Registry of subscribed connections.
+    After a catalog refresh every subscriber is re-checked and sent an
+    UPDATE_RESPONSE when its offer changed, so cars no longer need to poll.
+    A subscriber is only re-planned when its offer key (car type, catalog and
+    campaign generation, versions, campaign bits) moved since its last check.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions: Dict[str, Subscription] = {}  # car_id -> Subscription
+
+    def subscribe(self, request: Request, client_socket: socket.socket, send_lock: threading.Lock,
+                  current_versions: Dict[str, str], offered: Dict[str, str]):
+        """Track a connection, remembering the offer it was just sent"""
+        subscription = Subscription(request, client_socket, send_lock, current_versions)
+        subscription.last_offered = dict(offered)
+        with self.lock:
+            self.subscriptions[request.car_id] = subscription
+
+    def unsubscribe(self, car_id: str, client_socket: socket.socket = None):
+        """Forget a car, unless it has already reconnected on another socket"""
+        with self.lock:
+            subscription = self.subscriptions.get(car_id)
+            if subscription and (client_socket is None or subscription.client_socket is client_socket):
+                del self.subscriptions[car_id]
+
+    def update_versions(self, car_id: str, current_versions: Dict[str, str], offered: Dict[str, str] = None):
+        """Record what the car now runs, e.g. after an UPDATE_CHECK or flashing feedback"""
+        with self.lock:
+            subscription = self.subscriptions.get(car_id)
+            if not subscription:
+                return
+            subscription.current_versions.update(current_versions)
+            subscription.checked_key = None
+            if offered is not None:
+                subscription.last_offered = dict(offered)
+
+    def is_subscribed(self, car_id: str) -> bool:
+        with self.lock:
+            return car_id in self.subscriptions
+
+    def notify(self, offer_key: Callable[[Subscription], Optional[tuple]],
+               resolve: Callable[[tuple, Subscription], Optional[Tuple[Dict[str, str], Dict]]]) -> int:
+        """
+        Push changed offers to subscribers; returns the number of pushes sent.
+        offer_key names a subscriber's offer, resolve returns (updates_needed, install plan) for it.
+        """
+        with self.lock:
+            subscriptions = list(self.subscriptions.values())
+
+        pushed = 0
+        for subscription in subscriptions:
+            request = subscription.request
+            key = offer_key(subscription)
+            if key is None or key == subscription.checked_key:
+                continue
+            offer = resolve(key, subscription)
+            if offer is None:
+                continue
+            updates_needed, install_plan = offer
+            if not updates_needed or updates_needed == subscription.last_offered:
+                subscription.checked_key = key
+                continue
+
+            # A busy connection (e.g. mid-download) keeps its pending offer for the next refresh
+            if not subscription.send_lock.acquire(blocking=False):
+                continue
+            try:
+                subscription.client_socket.send(Protocol.create_update_response(
+                    updates_needed, pushed=True, install_plan=install_plan))
+                subscription.last_offered = updates_needed
+                subscription.checked_key = key
+                subscription.pushes += 1
+                pushed += 1
+                logging.info(f"📣 Pushed update offer to car {request.car_id}: {updates_needed}")
+            except Exception as e:
+                logging.error(f"Error pushing update offer to car {request.car_id}: {str(e)}")
+                self.unsubscribe(request.car_id, subscription.client_socket)
+            finally:
+                subscription.send_lock.release()
+        return pushed
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "subscribed_cars": len(self.subscriptions),
+                "subscriptions": {car_id: {"car_type": subscription.request.car_type,
+                                           "last_offered": subscription.last_offered,
+                                           "pushes": subscription.pushes}
+                                  for car_id, subscription in self.subscriptions.items()}
+            }
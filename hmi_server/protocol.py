@@ -1,5 +1,5 @@
 import json
-from typing import Dict, Any
+from typing import Dict, List, Any
 
 class Protocol:
     # Existing message types
@@ -9,8 +9,15 @@ class Protocol:
     DOWNLOAD_REQUEST = "DOWNLOAD_REQUEST"
     DOWNLOAD_START = "DOWNLOAD_START"
     FILE_CHUNK = "FILE_CHUNK"
+    FILE_COMPLETE = "FILE_COMPLETE"
     DOWNLOAD_COMPLETE = "DOWNLOAD_COMPLETE"
     ERROR = "ERROR"
+    BUSY = "BUSY"
+    BATCH_UPDATE_CHECK = "BATCH_UPDATE_CHECK"
+    BATCH_UPDATE_RESPONSE = "BATCH_UPDATE_RESPONSE"
+    GATEWAY_OPEN = "GATEWAY_OPEN"
+    SESSION_CLOSE = "SESSION_CLOSE"
+    WINDOW_UPDATE = "WINDOW_UPDATE"
     
     # NEW: Flashing feedback message types
     FLASHING_FEEDBACK = "FLASHING_FEEDBACK"
@@ -46,9 +53,32 @@ class Protocol:
         })
 
     @staticmethod
-    def create_update_response(updates_needed: Dict[str, str]) -> bytes:
-        return Protocol.create_message(Protocol.UPDATE_RESPONSE, {
-            "updates_needed": updates_needed
+    def create_update_response(updates_needed: Dict[str, str], pushed: bool = False,
+                               install_plan: Dict = None) -> bytes:
+        payload = {"updates_needed": updates_needed}
+        if install_plan is not None:
+            # Full ordered plan including later rounds, with total download size
+            payload["install_plan"] = install_plan
+        if pushed:
+            # Sent unprompted after a catalog change rather than in reply to UPDATE_CHECK
+            payload["pushed"] = True
+        return Protocol.create_message(Protocol.UPDATE_RESPONSE, payload)
+
+    @staticmethod
+    def create_batch_update_response(results: List[Dict]) -> bytes:
+        """One result per car of a gateway's BATCH_UPDATE_CHECK, in request order"""
+        return Protocol.create_message(Protocol.BATCH_UPDATE_RESPONSE, {
+            "results": results,
+            "checked": len(results)
+        })
+
+    @staticmethod
+    def create_busy_response(retry_after: int, message: str) -> bytes:
+        """Tell a client the server is saturated and when to retry"""
+        return Protocol.create_message(Protocol.BUSY, {
+            "code": 503,
+            "retry_after": retry_after,
+            "message": message
         })
 
     @staticmethod
@@ -0,0 +1,139 @@
+import os
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class InMemoryEventBus:
+    """Process-local stand-in for the publish_events collection, for tests and single-node setups"""
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.events: List[Dict] = []
+
+    def publish(self, event: Dict):
+        with self.condition:
+            self.events.append(event)
+            self.condition.notify_all()
+
+    def initial_position(self) -> int:
+        with self.condition:
+            return len(self.events)
+
+    def read_after(self, position: int, timeout: float) -> Tuple[List[Dict], int]:
+        """Events published after position, waiting up to timeout for the first one"""
+        with self.condition:
+            if len(self.events) <= position:
+                self.condition.wait(timeout)
+            return self.events[position:], len(self.events)
+
+
+class MongoPublishEventSource:
+    """
+    Reads publish events written by the website.
+    Uses a change stream when the deployment supports one and falls back to
+    polling by _id otherwise (e.g. a standalone mongod).
+    """
+
+    def __init__(self, collection, use_change_stream: bool = None):
+        self.collection = collection
+        if use_change_stream is None:
+            use_change_stream = os.getenv("HMI_PUBLISH_CHANGE_STREAM", "1") == "1"
+        self.use_change_stream = use_change_stream
+        self.stream = None
+
+    def initial_position(self):
+        """Only events published after the node started; startup warming covers the rest"""
+        latest = self.collection.find_one(sort=[("_id", -1)])
+        return latest["_id"] if latest else None
+
+    def read_after(self, position, timeout: float) -> Tuple[List[Dict], object]:
+        if self.use_change_stream:
+            try:
+                return self._read_change_stream(position, timeout)
+            except Exception as e:
+                logging.warning(f"Publish event change stream unavailable, polling instead: {str(e)}")
+                self.use_change_stream = False
+                self.stream = None
+        return self._poll(position, timeout)
+
+    def _read_change_stream(self, position, timeout: float) -> Tuple[List[Dict], object]:
+        if self.stream is None:
+            self.stream = self.collection.watch([{"$match": {"operationType": "insert"}}],
+                                                max_await_time_ms=int(timeout * 1000))
+            # Catch up on anything published before the stream opened; handlers are idempotent
+            query = {"_id": {"$gt": position}} if position is not None else {}
+            missed = list(self.collection.find(query).sort("_id", 1))
+            if missed:
+                return missed, missed[-1]["_id"]
+        events = []
+        change = self.stream.try_next()
+        while change is not None:
+            event = change["fullDocument"]
+            events.append(event)
+            position = event["_id"]
+            change = self.stream.try_next()
+        return events, position
+
+    def _poll(self, position, timeout: float) -> Tuple[List[Dict], object]:
+        query = {"_id": {"$gt": position}} if position is not None else {}
+        events = list(self.collection.find(query).sort("_id", 1))
+        if events:
+            return events, events[-1]["_id"]
+        threading.Event().wait(timeout)
+        return [], position
+
+
+class PublishEventConsumer:
+    """Background reader handing each publish event to the server"""
+
+    def __init__(self, source, handler: Callable[[Dict], None], poll_seconds: float = None):
+        self.source = source
+        self.handler = handler
+        self.poll_seconds = poll_seconds or float(os.getenv("HMI_PUBLISH_POLL_SECONDS", "5"))
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.handled = 0
+        self.failed = 0
+        self.last_event: Optional[Dict] = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True, name="publish-events")
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        position = None
+        started = False
+        while not self.stop_event.is_set():
+            try:
+                if not started:
+                    position = self.source.initial_position()
+                    started = True
+                events, position = self.source.read_after(position, self.poll_seconds)
+            except Exception as e:
+                logging.error(f"Error reading publish events: {str(e)}")
+                self.stop_event.wait(self.poll_seconds)
+                continue
+
+            for event in events:
+                try:
+                    self.handler(event)
+                    self.handled += 1
+                    self.last_event = {key: str(value) for key, value in event.items()
+                                       if key in ("type", "ecu_name", "version_number", "created_at")}
+                except Exception as e:
+                    self.failed += 1
+                    logging.error(f"Error handling publish event: {str(e)}")
+
+    def get_status(self) -> Dict:
+        return {
+            "source": type(self.source).__name__,
+            "running": self.thread is not None and self.thread.is_alive(),
+            "handled_events": self.handled,
+            "failed_events": self.failed,
+            "last_event": self.last_event
+        }
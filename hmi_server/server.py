@@ -6,9 +6,25 @@ from datetime import datetime
 import logging
 from models import *
 from protocol import Protocol
-from database_manager import DatabaseManager
+from storage_backends import open_catalog_store
+from delta_manager import DeltaManager
+from firmware_cache import FirmwareCache
+from compression import negotiate_codec, compress
+from bandwidth import EgressScheduler
+from admission import AdmissionController
+from campaign_manager import CampaignManager
+from notifier import UpdateNotifier
+from update_memo import UpdateCheckMemo
+from update_planner import UpdatePlanner
+from catalog_snapshot import CatalogSnapshot
+from catalog_index import CatalogIndex
+from lazy_catalog import LazyCatalog
+from gateway_mux import GatewayConnection, MuxSessionChannel
+from publish_events import PublishEventConsumer, InMemoryEventBus
 from bson import ObjectId
 import uuid
+import base64
+import os
 
 logging.basicConfig(level=logging.INFO)
 
@@ -16,28 +32,63 @@ class ECUUpdateServer:
     def __init__(self, host: str, port: int, data_directory: str):
         self.host = host
         self.port = port
-        self.db_manager = DatabaseManager(data_directory)
+        self.db_manager = open_catalog_store(data_directory)
         self.data_directory = data_directory
+        self.delta_manager = DeltaManager(self.db_manager, data_directory)
+        self.firmware_cache = FirmwareCache(self.db_manager, data_directory)
+        self.egress_scheduler = EgressScheduler()
+        self.admission = AdmissionController()
+        self.campaigns = CampaignManager()
+        self.notifier = UpdateNotifier()
+        self.update_memo = UpdateCheckMemo()
+        self.planner = UpdatePlanner()
+        self.catalog_refresh_seconds = float(os.getenv("HMI_CATALOG_REFRESH_SECONDS", "30"))
+        self.catalog_generation = 0
+        self.catalog_fingerprint = None
+        self.catalog_lock = threading.Lock()  # Refresh loop and publish events both reload the catalog
+        self.generation_lock = threading.Lock()  # Bumped by catalog loads and by lazy car type loads
+        self.catalog_snapshot = CatalogSnapshot(data_directory)
+        self.catalog_source = None  # "snapshot" until the database has been reached, then "database"
+        self.stop_event = threading.Event()
+        self.publish_events = PublishEventConsumer(self._publish_event_source(), self.handle_publish_event)
+        self.listen_backlog = int(os.getenv("HMI_LISTEN_BACKLOG", "128"))
         self.car_types: List[CarType] = []
+        self.catalog = CatalogIndex()  # Lookups over car_types, replaced as a whole on every load
+        # Very large fleets load car types on first use instead of the whole catalog up front
+        self.lazy_catalog = os.getenv("HMI_CATALOG_MODE", "eager") == "lazy"
+        if self.lazy_catalog:
+            self.catalog = self.planner = LazyCatalog(self.db_manager.get_car_type_by_name,
+                                                      size_of=self._version_size, on_load=self._car_type_loaded)
         self.active_requests: Dict[str, Request] = {}  # car_id -> Request
         self.active_downloads: Dict[str, DownloadRequest] = {}  # car_id -> DownloadRequest
         self.chunk_size = 8192  # 8KB chunks for file transfer
+        self.batch_max_cars = int(os.getenv("HMI_BATCH_MAX_CARS", "1000"))
+        self.gateways: Dict[GatewayConnection, str] = {}  # open gateway connections -> "ip:port"
+        self.gateways_lock = threading.Lock()
+        self.multiplex_window = int(os.getenv("HMI_MUX_WINDOW", "8"))
+        self.max_multiplex_window = int(os.getenv("HMI_MUX_MAX_WINDOW", "64"))
         self.socket = None
         self.running = False
 
     def start(self):
         """Start the server"""
         try:
-            # Load database
-            self.car_types = self.db_manager.load_all_data()
-            if not self.car_types:
+            # Serve the last snapshot right away and reconcile with the database in the background
+            from_snapshot = not self.lazy_catalog and self.load_catalog_snapshot()
+            storage_ready = False
+            if not from_snapshot:
+                storage_ready = self.db_manager.warm_up()
+                self.refresh_catalog()
+            if not self.lazy_catalog and not self.car_types:
                 raise Exception("Failed to load car types database")
             print(self.car_types)
+            threading.Thread(target=self._catalog_refresh_loop, args=(storage_ready,), daemon=True).start()
+            self.publish_events.start()
             # Create and bind socket
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.socket.bind((self.host, self.port))
-            self.socket.listen(5)
+            self.socket.listen(self.listen_backlog)
             self.running = True
 
             logging.info(f"Server started on {self.host}:{self.port}")
@@ -47,6 +98,14 @@ class ECUUpdateServer:
             while self.running:
                 try:
                     client_socket, (client_ip, client_port) = self.socket.accept()
+
+                    # Shed load before spending a thread on the connection
+                    if not self.admission.try_open_session():
+                        self._reject_busy(client_socket, "session", "Server is at its session limit")
+                        client_socket.close()
+                        logging.warning(f"Rejected connection from {client_ip}:{client_port}: session limit reached")
+                        continue
+
                     client_thread = threading.Thread(
                         target=self.handle_client,
                         args=(client_socket, client_ip, client_port)
@@ -62,8 +121,157 @@ class ECUUpdateServer:
             logging.error(f"Failed to start server: {str(e)}")
             self.shutdown()
 
+    def load_catalog_snapshot(self) -> bool:
+        """Serve the catalog saved by the last run; returns True when one was loaded"""
+        snapshot = self.catalog_snapshot.load()
+        if not snapshot or not snapshot[0]:
+            return False
+        with self.catalog_lock:
+            self._apply_catalog(*snapshot)
+            self.catalog_source = "snapshot"
+        logging.info(f"📦 Serving catalog snapshot saved at {self.catalog_snapshot.saved_at} "
+                     f"until the database is reached")
+        return True
+
+    def refresh_catalog(self) -> bool:
+        """Reload the catalog and campaigns; returns True when the published versions changed"""
+        if self.lazy_catalog:
+            return self._refresh_lazy_catalog()
+        with self.catalog_lock:
+            car_types = self.db_manager.load_all_data()
+            if not car_types:
+                # Keep serving the last good catalog while the database is unreachable
+                return False
+            campaigns = self.db_manager.load_campaigns()
+            campaign_generation = self.campaigns.generation
+            changed = self._apply_catalog(car_types, campaigns)
+            if changed or campaign_generation != self.campaigns.generation or self.catalog_source != "database":
+                self.catalog_snapshot.save(car_types, campaigns)
+            self.catalog_source = "database"
+            return changed
+
+    def _refresh_lazy_catalog(self) -> bool:
+        """Reload the car types in memory, then load recently seen ones that were evicted"""
+        with self.catalog_lock:
+            changed = self.catalog.reload()
+            if changed is None:
+                # Keep the last good campaigns while the database is unreachable
+                return False
+            self.campaigns.load(self.db_manager.load_campaigns())
+        self.catalog.prefetch_recent()
+        return changed
+
+    def _car_type_loaded(self, car_type: CarType, changed: bool):
+        """Prepare a car type the lazy catalog just loaded; a changed one invalidates memoized offers"""
+        if changed:
+            # Runs on loader threads, concurrently with other loads and refreshes
+            with self.generation_lock:
+                self.catalog_generation += 1
+                generation = self.catalog_generation
+            self.update_memo.clear()
+            logging.info(f"🔄 Car type {car_type.name} changed, catalog generation {generation}")
+        self.delta_manager.schedule_catalog([car_type])
+        self.firmware_cache.precompute_catalog([car_type])
+
+    def _apply_catalog(self, car_types: List[CarType], campaigns: List[RolloutCampaign]) -> bool:
+        """Swap in a loaded catalog; the caller holds catalog_lock"""
+        self.campaigns.load(campaigns)
+        self.catalog = CatalogIndex(car_types)
+        self.car_types = self.catalog.car_types
+
+        fingerprint = self._catalog_fingerprint(car_types)
+        if fingerprint == self.catalog_fingerprint:
+            return False
+        self.catalog_fingerprint = fingerprint
+        self.planner = UpdatePlanner(car_types, size_of=self._version_size)
+        with self.generation_lock:
+            self.catalog_generation += 1
+        self.update_memo.clear()
+        self.delta_manager.schedule_catalog(car_types)
+        self.firmware_cache.precompute_catalog(car_types)
+        logging.info(f"🔄 Catalog generation {self.catalog_generation} loaded")
+        return True
+
+    def _version_size(self, version: Version) -> int:
+        """Image size from the published metadata, asking storage only for older versions"""
+        size = version.published_size()
+        return size if size is not None else self.db_manager.get_file_size(version.hex_file_path)
+
+    @staticmethod
+    def _catalog_fingerprint(car_types: List[CarType]) -> tuple:
+        return tuple(
+            (car_type.name, ecu.name, version.version_number, tuple(version.compatible_car_types),
+             version.hex_file_path, version.sha256)
+            for car_type in car_types for ecu in car_type.ecus for version in ecu.versions
+        )
+
+    def _publish_event_source(self):
+        """
+        Publish events come from the catalog store. HMI_PUBLISH_EVENTS=memory
+        asks for the process-local bus, which only the memory store publishes to,
+        so it is refused with any other store instead of silently never firing.
+        """
+        source = self.db_manager.publish_event_source()
+        if os.getenv("HMI_PUBLISH_EVENTS", "store") == "memory" and not isinstance(source, InMemoryEventBus):
+            raise ValueError("HMI_PUBLISH_EVENTS=memory requires HMI_CATALOG_STORE=memory; "
+                             "no other store publishes to the in-memory bus")
+        return source
+
+    def handle_publish_event(self, event: Dict):
+        """Warm this node for a newly published version and tell subscribed cars about it"""
+        if event.get('type') != 'version_published':
+            return
+        logging.info(f"📦 Version {event.get('version_number')} of {event.get('ecu_name')} published")
+        # Image and every compressed/binary variant, in the background
+        self.firmware_cache.warm(event['hex_file_path'], event.get('sha256'))
+        if self.lazy_catalog:
+            # The version may belong to a car type that was not known a moment ago
+            self.catalog.forget_missing()
+        # A catalog change schedules deltas to the new version and recompiles the planner
+        if self.refresh_catalog():
+            self.notifier.notify(self._subscriber_offer_key, self._resolve_subscriber_offer)
+
+    def _subscriber_offer_key(self, subscription) -> Optional[tuple]:
+        """Memo key of a subscriber's offer; unchanged keys are not re-planned"""
+        request = subscription.request
+        return self.update_memo.key(request.car_type, self.catalog_generation, self.campaigns.generation,
+                                    subscription.current_versions,
+                                    self.campaigns.offer_bits(request.car_type, request.car_id))
+
+    def _resolve_subscriber_offer(self, memo_key: tuple, subscription) -> Optional[tuple]:
+        """(updates_needed, install plan) for a subscriber, shared with update checks through the memo"""
+        cached = self.update_memo.get(memo_key)
+        if cached:
+            return cached[:2]
+        request = subscription.request
+        plan = self.planner.plan(request.car_type, subscription.current_versions, request.car_id, self.campaigns)
+        if plan is None:
+            return None
+        offer = (plan.updates_needed(), plan.to_dict())
+        self.update_memo.put(memo_key, *offer)
+        return offer
+
+    def _catalog_refresh_loop(self, storage_ready: bool = True):
+        """Pick up published versions and push new offers to subscribed cars"""
+        # Started from a snapshot or without the database: reconcile straight away
+        reconcile = not storage_ready
+        while reconcile or not self.stop_event.wait(self.catalog_refresh_seconds):
+            reconcile = False
+            try:
+                if not storage_ready:
+                    # Connects and creates the indexes once the database is reachable
+                    storage_ready = self.db_manager.warm_up()
+                self.refresh_catalog()
+                # Campaign waves widen over time, so subscribers are re-checked every cycle
+                self.notifier.notify(self._subscriber_offer_key, self._resolve_subscriber_offer)
+            except Exception as e:
+                logging.error(f"Error refreshing catalog: {str(e)}")
+
     def handle_client(self, client_socket: socket.socket, client_ip: str, client_port: int):
         """Handle individual client connection"""
+        car_id = None
+        # Held while a request is served so pushed offers never interleave with its frames
+        send_lock = threading.Lock()
         try:
             logging.info(f"starting new thread handling request from client ip:{client_ip} and port {client_port}")
             client_socket.settimeout(1000)  # Set timeout for client operations
@@ -77,6 +285,21 @@ class ECUUpdateServer:
             
             logging.info(f"received new message from client ip: {client_ip} , message:: {str(message)}")  
 
+            if message['type'] == Protocol.GATEWAY_OPEN and isinstance(client_socket, MuxSessionChannel):
+                logging.error(f"Nested gateway connection refused on session {client_socket.session_id} from {client_ip}")
+                client_socket.send(Protocol.create_error_message(400, "Gateway connections cannot be opened inside a session"))
+                return
+
+            if message['type'] == Protocol.GATEWAY_OPEN:
+                # Depot gateways run many car sessions over this one connection
+                self.handle_gateway_connection(client_socket, client_ip, client_port)
+                return
+
+            if message['type'] == Protocol.BATCH_UPDATE_CHECK:
+                # Depot gateways check many cars per message and never hand shake as one car
+                self.handle_gateway_session(message, client_socket, client_ip, client_port)
+                return
+
             if message['type'] != Protocol.HANDSHAKE:
                 logging.error(f"Invalid initial message type from {client_ip}:{client_port}")
                 client_socket.send(Protocol.create_error_message(400, "Invalid initial message"))
@@ -86,6 +309,8 @@ class ECUUpdateServer:
             payload = message['payload']
             car_type = payload.get('car_type')
             car_id = payload.get('car_id')
+            if self.lazy_catalog and car_type:
+                self.catalog.note_handshake(car_type)
 
             if not car_type or not car_id:
                 logging.error(f"Missing required information in handshake from {client_ip}:{client_port}")
@@ -107,7 +332,11 @@ class ECUUpdateServer:
                 port=client_port,
                 service_type=service_type,
                 metadata=payload.get('metadata', {}),
-                status=RequestStatus.CHECKING_AUTHENTICITY
+                status=RequestStatus.CHECKING_AUTHENTICITY,
+                compression=negotiate_codec(payload.get('compression')),
+                chunk_encoding='base64' if 'base64' in payload.get('chunk_encodings', []) else 'hex',
+                image_format='binary' if 'binary' in payload.get('image_formats', []) else 'original',
+                push_updates=bool(payload.get('push_updates', False))
             )
             logging.info(f"new Request has been created for car with client ip:{request.ip_address}. status:{request.status}")
 
@@ -116,12 +345,20 @@ class ECUUpdateServer:
                 logging.info(f"Authentication success for request from client ip:{request.ip_address}")
                 client_socket.send(Protocol.create_message(Protocol.HANDSHAKE, {
                     'status': 'authenticated',
-                    'message': 'Connection established'
+                    'message': 'Connection established',
+                    'compression': request.compression,
+                    'chunk_encoding': request.chunk_encoding,
+                    'image_format': request.image_format,
+                    'push_updates': request.push_updates
                 }))
 
                 # Initial update check
                 logging.info(f"Performing initial update check for car ID: {car_id}")
-                self.check_for_updates(request, client_socket)
+                with send_lock:
+                    updates_needed = self.check_for_updates(request, client_socket)
+                    if request.push_updates and updates_needed is not None:
+                        self.notifier.subscribe(request, client_socket, send_lock,
+                                                request.metadata.get('ecu_versions', {}), updates_needed)
 
                 # Keep connection alive and handle subsequent requests
                 logging.info(f"Maintaining connection for car ID: {car_id} to handle subsequent requests")
@@ -135,37 +372,41 @@ class ECUUpdateServer:
 
                     logging.info(f"Received request from car ID: {car_id}, message type: {message['type']}")
 
-                    if message['type'] == Protocol.DOWNLOAD_REQUEST:
-                        logging.info(f"Processing download request from car ID: {car_id}")
-                        request.service_type = ServiceType.DOWNLOAD_UPDATE
-                        request.metadata = message['payload']
-                        self.handle_download_request(request, client_socket)
-                        logging.info(f"Completed download request processing for car ID: {car_id}")
+                    with send_lock:
+                        if message['type'] == Protocol.DOWNLOAD_REQUEST:
+                            logging.info(f"Processing download request from car ID: {car_id}")
+                            request.service_type = ServiceType.DOWNLOAD_UPDATE
+                            request.metadata = message['payload']
+                            self.handle_download_request(request, client_socket)
+                            logging.info(f"Completed download request processing for car ID: {car_id}")
                     
-                    elif message['type'] == Protocol.UPDATE_CHECK:
-                        logging.info(f"Processing update check request from car ID: {car_id}")
-                        request.service_type = ServiceType.CHECK_FOR_UPDATE
-                        request.metadata = message['payload']
-                        self.check_for_updates(request, client_socket)
-                        logging.info(f"Completed update check for car ID: {car_id}")
+                        elif message['type'] == Protocol.UPDATE_CHECK:
+                            logging.info(f"Processing update check request from car ID: {car_id}")
+                            request.service_type = ServiceType.CHECK_FOR_UPDATE
+                            request.metadata = message['payload']
+                            updates_needed = self.check_for_updates(request, client_socket)
+                            if request.push_updates and updates_needed is not None:
+                                self.notifier.update_versions(car_id, request.metadata.get('ecu_versions', {}),
+                                                              updates_needed)
+                            logging.info(f"Completed update check for car ID: {car_id}")
                     
-                    # NEW: Handle flashing feedback
-                    elif message['type'] == Protocol.FLASHING_FEEDBACK:
-                        logging.info(f"📋 Processing flashing feedback from car ID: {car_id}")
-                        self.handle_flashing_feedback(request, message['payload'], client_socket)
-                        logging.info(f"✅ Completed flashing feedback processing for car ID: {car_id}")
+                        # NEW: Handle flashing feedback
+                        elif message['type'] == Protocol.FLASHING_FEEDBACK:
+                            logging.info(f"📋 Processing flashing feedback from car ID: {car_id}")
+                            self.handle_flashing_feedback(request, message['payload'], client_socket)
+                            logging.info(f"✅ Completed flashing feedback processing for car ID: {car_id}")
                     
-                    # NEW: Handle server metrics request
-                    elif message['type'] == Protocol.SERVER_METRICS_REQUEST:
-                        logging.info(f"📊 Processing metrics request from car ID: {car_id}")
-                        self.handle_metrics_request(request, message['payload'], client_socket)
-                        logging.info(f"✅ Completed metrics request for car ID: {car_id}")
+                        # NEW: Handle server metrics request
+                        elif message['type'] == Protocol.SERVER_METRICS_REQUEST:
+                            logging.info(f"📊 Processing metrics request from car ID: {car_id}")
+                            self.handle_metrics_request(request, message['payload'], client_socket)
+                            logging.info(f"✅ Completed metrics request for car ID: {car_id}")
                     
-                    else:
-                        logging.warning(f"Unknown message type '{message['type']}' received from car ID: {car_id}")
-                        client_socket.send(Protocol.create_error_message(
-                            400, f"Unknown message type: {message['type']}"
-                        ))
+                        else:
+                            logging.warning(f"Unknown message type '{message['type']}' received from car ID: {car_id}")
+                            client_socket.send(Protocol.create_error_message(
+                                400, f"Unknown message type: {message['type']}"
+                            ))
 
             else:
                 logging.info(f"Authentication failed for request from client ip:{request.ip_address}")
@@ -178,6 +419,9 @@ class ECUUpdateServer:
         except Exception as e:
             logging.error(f"Error handling client {client_ip}:{client_port}: {str(e)}")
         finally:
+            if car_id:
+                self.notifier.unsubscribe(car_id, client_socket)
+            self.admission.close_session()
             try:
                 logging.info(f"Closing connection for client {client_ip}:{client_port}")
                 client_socket.close()
@@ -244,6 +488,8 @@ class ECUUpdateServer:
                 ))
                 
                 logging.info(f"✅ Flashing feedback processed successfully for car {request.car_id}")
+                # Subscribers are re-checked against what they now run
+                self.notifier.update_versions(request.car_id, feedback.final_ecu_versions)
                 logging.info(f"   Session ID: {feedback.session_id}")
                 logging.info(f"   Status: {feedback.overall_status}")
                 logging.info(f"   Successful ECUs: {len(feedback.successful_ecus)}")
@@ -296,6 +542,30 @@ class ECUUpdateServer:
             elif metrics_type == 'recent_activities':
                 limit = payload.get('limit', 50)
                 metrics = self.db_manager.get_recent_flashing_activities(limit=limit)
+            elif metrics_type == 'delta_jobs':
+                metrics = self.delta_manager.get_status()
+            elif metrics_type == 'egress':
+                metrics = self.egress_scheduler.get_status()
+            elif metrics_type == 'admission':
+                metrics = self.admission.get_status()
+            elif metrics_type == 'campaigns':
+                metrics = self.campaigns.get_status()
+            elif metrics_type == 'subscriptions':
+                metrics = self.notifier.get_status()
+            elif metrics_type == 'update_memo':
+                metrics = self.update_memo.get_status()
+            elif metrics_type == 'publish_events':
+                metrics = self.publish_events.get_status()
+            elif metrics_type == 'storage':
+                metrics = self.db_manager.get_status()
+            elif metrics_type == 'gateways':
+                with self.gateways_lock:
+                    gateways = list(self.gateways.items())
+                metrics = {address: gateway.get_status() for gateway, address in gateways}
+            elif metrics_type == 'catalog':
+                metrics = {"source": "lazy" if self.lazy_catalog else self.catalog_source,
+                           "generation": self.catalog_generation,
+                           "index": self.catalog.get_status(), "snapshot": self.catalog_snapshot.get_status()}
             else:
                 metrics = {"error": f"Unknown metrics type: {metrics_type}"}
             
@@ -347,8 +617,8 @@ class ECUUpdateServer:
     def check_authentication(self, request: Request) -> bool:
         """Authenticate the car request"""
         try:
-            car_type = next((ct for ct in self.car_types 
-                           if ct.name.lower() == request.car_type.lower()), None)
+            catalog = self.catalog
+            car_type = catalog.car_type(request.car_type)
             
             if not car_type:
                 print("bazet fl car type")
@@ -357,8 +627,7 @@ class ECUUpdateServer:
 
             print(f"\n\n request.car_id.lower(): {request.car_id.lower()}")
             print(f"car_type.car_ids: {car_type.car_ids}")
-            car_type.car_ids = [car_id.lower() for car_id in car_type.car_ids]
-            if request.car_id.lower() not in car_type.car_ids:
+            if not catalog.has_car(car_type.name, request.car_id):
                 print("bazet fl id")
                 request.status = RequestStatus.NON_AUTHENTICATED
                 return False
@@ -372,14 +641,11 @@ class ECUUpdateServer:
             request.status = RequestStatus.FAILED
             return False
 
-    def check_for_updates(self, request: Request, client_socket: socket.socket):
-        self.db_manager = DatabaseManager(data_directory=self.data_directory)
-        self.car_types = self.db_manager.load_all_data()
+    def check_for_updates(self, request: Request, client_socket: socket.socket) -> Optional[Dict[str, str]]:
         logging.info(f"checking-for-update method started processing for client:{request.ip_address}")
         """Check if updates are available for the car"""
         try:
-            car_type = next((ct for ct in self.car_types 
-                        if ct.name == request.car_type), None)
+            car_type = self.catalog.car_type(request.car_type)
             
             if not car_type:
                 raise Exception("Car type not found")
@@ -387,16 +653,36 @@ class ECUUpdateServer:
             # Get current versions from metadata
             current_versions = request.metadata.get('ecu_versions', {})
             
-            # Check for updates
-            updates_needed = car_type.check_for_updates(current_versions)
+            # Cars reporting the same versions share one computed offer and encoded response
+            memo_key = self.update_memo.key(car_type.name, self.catalog_generation, self.campaigns.generation,
+                                            current_versions, self.campaigns.offer_bits(car_type.name, request.car_id))
+            cached = self.update_memo.get(memo_key)
+            if cached and cached[2] is not None:
+                updates_needed, _, response = cached
+            else:
+                if cached:
+                    # Resolved by a gateway batch check, only the response still has to be encoded
+                    updates_needed, install_plan, _ = cached
+                else:
+                    # Resolve against the planner compiled for this catalog generation
+                    plan = self.planner.plan(car_type.name, current_versions, request.car_id, self.campaigns)
+                    if plan is None:
+                        raise Exception("Car type not compiled")
+                    updates_needed = plan.updates_needed()
+                    install_plan = plan.to_dict()
+                response = Protocol.create_update_response(updates_needed, install_plan=install_plan)
+                self.update_memo.put(memo_key, updates_needed, install_plan, response)
             logging.info(f"updates needed response for client with ip:{request.ip_address}")
             # Send response
-            response = Protocol.create_update_response(updates_needed)
             
             client_socket.send(response)
+            # A DOWNLOAD_REQUEST for these versions usually follows within seconds
+            if updates_needed:
+                self._prefetch_updates(request, car_type, updates_needed)
             logging.info(f"updates needed response for client with ip:{request.ip_address} is send successfully with message:{response}")
             logging.info(f"Request for: {request.ip_address} finished successfully")
             request.status = RequestStatus.FINISHED_SUCCESSFULLY
+            return updates_needed
 
         except Exception as e:
             logging.error(f"Update check error: {str(e)}")
@@ -404,11 +690,211 @@ class ECUUpdateServer:
             client_socket.send(Protocol.create_error_message(
                 500, "Update check failed"
             ))
+            return None
 
     # ... Keep all other existing methods unchanged (handle_download_request, send_new_versions, etc.) ...
 
+    def handle_gateway_session(self, message: Dict, client_socket: socket.socket, client_ip: str, client_port: int):
+        """Answer BATCH_UPDATE_CHECK messages from a depot gateway until it disconnects"""
+        logging.info(f"client ip: {client_ip} is a depot gateway")
+        while message:
+            if message['type'] != Protocol.BATCH_UPDATE_CHECK:
+                logging.warning(f"Unexpected message type '{message['type']}' from gateway {client_ip}:{client_port}")
+                client_socket.send(Protocol.create_error_message(
+                    400, f"Unknown message type: {message['type']}"
+                ))
+            else:
+                self.handle_batch_update_check(message['payload'], client_socket, client_ip)
+            message = self.receive_message(client_socket)
+        logging.info(f"Gateway {client_ip}:{client_port} disconnected gracefully")
+
+    def handle_gateway_connection(self, client_socket: socket.socket, client_ip: str, client_port: int):
+        """Route the frames of a multiplexed gateway connection to one handler per car session"""
+        def open_session(channel: MuxSessionChannel) -> bool:
+            # Every car session counts against the session limit as its own connection would
+            if not self.admission.try_open_session():
+                self._reject_busy(channel, "session", "Server is at its session limit")
+                logging.warning(f"Rejected session {channel.session_id} from gateway {client_ip}: session limit reached")
+                return False
+            threading.Thread(target=self.handle_client, args=(channel, client_ip, client_port),
+                             name=f"gateway-{client_ip}-{channel.session_id}", daemon=True).start()
+            return True
+
+        def handle_control(message: Dict, gateway: GatewayConnection):
+            # Runs on the connection's worker, so a large batch never holds up the sessions' frames
+            if message['type'] == Protocol.BATCH_UPDATE_CHECK:
+                self.handle_batch_update_check(message['payload'], gateway, client_ip)
+            else:
+                gateway.send(Protocol.create_error_message(400, f"Unknown message type: {message['type']}"))
+
+        gateway = GatewayConnection(client_socket, open_session, handle_control)
+        with self.gateways_lock:
+            self.gateways[gateway] = f"{client_ip}:{client_port}"
+        try:
+            client_socket.send(Protocol.create_message(Protocol.GATEWAY_OPEN, {
+                'status': 'ready',
+                'max_sessions': gateway.max_sessions,
+                'session_window': gateway.session_window
+            }))
+            logging.info(f"client ip: {client_ip} is a depot gateway with multiplexed sessions")
+            gateway.run(self.receive_message)
+            logging.info(f"Gateway {client_ip}:{client_port} disconnected gracefully")
+        finally:
+            with self.gateways_lock:
+                del self.gateways[gateway]
+
+    def handle_batch_update_check(self, payload: Dict, client_socket: socket.socket, client_ip: str):
+        """Authenticate and resolve updates for every car of a depot sync in one round trip"""
+        cars = payload.get('cars')
+        if not isinstance(cars, list) or not cars:
+            client_socket.send(Protocol.create_error_message(400, "Missing required information"))
+            return
+        if len(cars) > self.batch_max_cars:
+            client_socket.send(Protocol.create_error_message(
+                413, f"Batch of {len(cars)} cars exceeds the limit of {self.batch_max_cars}"
+            ))
+            return
+        try:
+            results = self.check_for_updates_batch(cars)
+        except Exception as e:
+            logging.error(f"Batch update check error: {str(e)}")
+            client_socket.send(Protocol.create_error_message(500, f"Batch update check failed: {str(e)}"))
+            return
+
+        client_socket.send(Protocol.create_batch_update_response(results))
+        logging.info(f"Answered batch update check for {len(results)} cars from gateway {client_ip}")
+
+        # The gateway downloads for its cars in the form it negotiated, so warm the cache once per image
+        compression = negotiate_codec(payload.get('compression'))
+        image_format = 'binary' if 'binary' in payload.get('image_formats', []) else 'original'
+        offered = {(result['car_type'], ecu_name, version_number)
+                   for result in results for ecu_name, version_number in result['updates_needed'].items()}
+        catalog = self.catalog
+        for car_type_name, ecu_name, version_number in offered:
+            version = catalog.version(car_type_name, ecu_name, version_number)
+            if version:
+                self.firmware_cache.prefetch(version.hex_file_path, compression, image_format)
+
+    def check_for_updates_batch(self, cars: List[Dict]) -> List[Dict]:
+        """
+        One result per car, in order. The catalog, planner and campaigns are
+        read once for the whole batch, each car type is looked up once, and cars
+        reporting the same versions share one resolved offer.
+        """
+        catalog, planner, campaigns = self.catalog, self.planner, self.campaigns
+        catalog_generation, campaign_generation = self.catalog_generation, campaigns.generation
+        car_types: Dict[str, Optional[CarType]] = {}
+        offers: Dict[tuple, tuple] = {}  # memo key -> (updates_needed, install plan) within this batch
+        results = []
+        for car in cars:
+            car_type_name = str(car.get('car_type') or '')
+            car_id = str(car.get('car_id') or '')
+            current_versions = car.get('ecu_versions') or {}
+            result = {'car_type': car_type_name, 'car_id': car_id, 'updates_needed': {}, 'install_plan': None}
+            results.append(result)
+
+            key = car_type_name.lower()
+            if key not in car_types:
+                car_types[key] = catalog.car_type(car_type_name) if car_type_name else None
+            car_type = car_types[key]
+            if car_type is None:
+                result['status'] = 'unknown_car_type'
+                continue
+            result['car_type'] = car_type.name
+            if not car_id or not catalog.has_car(car_type.name, car_id):
+                result['status'] = 'non_authenticated'
+                continue
+
+            memo_key = self.update_memo.key(car_type.name, catalog_generation, campaign_generation,
+                                            current_versions, campaigns.offer_bits(car_type.name, car_id))
+            offer = offers.get(memo_key)
+            if offer is None:
+                cached = self.update_memo.get(memo_key)
+                if cached:
+                    offer = cached[:2]
+                else:
+                    plan = planner.plan(car_type.name, current_versions, car_id, campaigns)
+                    if plan is None:
+                        result['status'] = 'failed'
+                        continue
+                    offer = (plan.updates_needed(), plan.to_dict())
+                    self.update_memo.put(memo_key, *offer)
+                offers[memo_key] = offer
+            result['status'] = 'authenticated'
+            result['updates_needed'], result['install_plan'] = offer
+        return results
+
+    def _prefetch_updates(self, request: Request, car_type: CarType, updates_needed: Dict[str, str]):
+        """Start pulling the offered images into the local cache in the form the car negotiated"""
+        catalog = self.catalog
+        for ecu_name, version_number in updates_needed.items():
+            version = catalog.version(car_type.name, ecu_name, version_number)
+            if version:
+                self.firmware_cache.prefetch(version.hex_file_path, request.compression, request.image_format)
+
     def handle_download_request(self, request: Request, client_socket: socket.socket):
         """Handle download request for new ECU versions"""
+        # Critical updates take free download slots ahead of queued routine ones
+        priority = self._download_priority(request)
+        if not self.admission.acquire_download(priority):
+            logging.warning(f"Download from car {request.car_id} deferred: download limit reached")
+            self._reject_busy(client_socket, "download", "Server is at its download limit")
+            return
+
+        # A car outside a campaign's filter or current wave is never offered its version,
+        # so a request for it is refused rather than queued
+        required_versions = request.metadata.get('required_versions', {})
+        withheld = self.campaigns.withheld_versions(request.car_type, request.car_id, required_versions)
+        if withheld:
+            self.admission.finish_download()
+            logging.warning(f"Download from car {request.car_id} refused: {', '.join(withheld)} not offered to it")
+            try:
+                client_socket.send(Protocol.create_error_message(
+                    403, f"Versions not offered to this car: {', '.join(withheld)}"
+                ))
+            except Exception as e:
+                logging.error(f"Error sending download refusal: {str(e)}")
+            return
+
+        # Staged rollouts cap how many cars download a campaign version at once
+        transfer_id = f"{request.car_id}/{uuid.uuid4().hex[:12]}"
+        if not self.campaigns.start_download(transfer_id, request.car_id, required_versions):
+            self.admission.finish_download()
+            logging.info(f"Download from car {request.car_id} deferred: rollout campaign at capacity")
+            self._reject_busy(client_socket, "download", "Rollout campaign is at its download limit")
+            return
+
+        try:
+            self._handle_admitted_download(request, client_socket, priority, transfer_id)
+        finally:
+            self.campaigns.finish_download(transfer_id)
+            self.admission.finish_download()
+
+    def _download_priority(self, request: Request) -> int:
+        """Highest priority among the requested versions and their rollout campaigns"""
+        priority = UpdatePriority.NORMAL.value
+        catalog = self.catalog
+        if not catalog.car_type(request.car_type):
+            return priority
+        for ecu_name, version_number in request.metadata.get('required_versions', {}).items():
+            version = catalog.version(request.car_type, ecu_name, version_number)
+            if version:
+                priority = max(priority, version.priority)
+            campaign = self.campaigns.get_campaign(ecu_name, version_number)
+            if campaign:
+                priority = max(priority, campaign.priority)
+        return priority
+
+    def _reject_busy(self, client_socket: socket.socket, kind: str, message: str):
+        """Tell the client to come back later instead of letting it time out"""
+        try:
+            client_socket.send(Protocol.create_busy_response(self.admission.retry_after(kind), message))
+        except Exception as e:
+            logging.error(f"Error sending busy response: {str(e)}")
+
+    def _handle_admitted_download(self, request: Request, client_socket: socket.socket, priority: int,
+                                  transfer_id: str):
+        """Run a download that passed admission control"""
         try:
             logging.info(f"starting new download request for client with ip:{request.ip_address} on port:{request.port}")
             # Get download information from metadata
@@ -432,13 +918,27 @@ class ECUUpdateServer:
                 old_versions=old_versions,
                 status=DownloadStatus.PREPARING_FILES,
                 active_transfers={},
-                file_offsets=file_offsets
+                file_offsets=file_offsets,
+                accept_deltas=request.metadata.get('accept_deltas', False),
+                compression=request.compression,
+                chunk_encoding=request.chunk_encoding,
+                image_format=request.image_format,
+                have_chunks=self._collect_chunk_hashes(request.metadata.get('have_chunks')),
+                multiplex_window=self._multiplex_window(request.metadata),
+                priority=priority,
+                transfer_id=transfer_id
             )
 
             self.active_downloads[request.car_id] = download_request
             
             # Start download process
-            self.send_new_versions(download_request, client_socket)
+            # Flows are per transfer, so parallel downloads of one car do not share or drop each other's state
+            self.egress_scheduler.register(download_request.transfer_id, car_type=request.car_type,
+                                           priority=download_request.priority)
+            try:
+                self.send_new_versions(download_request, client_socket)
+            finally:
+                self.egress_scheduler.unregister(download_request.transfer_id)
 
         except Exception as e:
             logging.error(f"Download request error: {str(e)}")
@@ -450,8 +950,8 @@ class ECUUpdateServer:
     def send_new_versions(self, download_request: DownloadRequest, client_socket: socket.socket):
         """Send new ECU versions to client"""
         try:
-            car_type = next((ct for ct in self.car_types 
-                           if ct.name == download_request.car_type), None)
+            catalog = self.catalog
+            car_type = catalog.car_type(download_request.car_type)
             
             if not car_type:
                 raise Exception("Car type not found")
@@ -463,35 +963,112 @@ class ECUUpdateServer:
             total_size = 0
             
             for ecu_name, version_number in download_request.required_versions.items():
-                ecu = next((e for e in car_type.ecus if e.name == ecu_name), None)
-                if not ecu:
-                    continue
-                
-                version = next((v for v in ecu.versions 
-                              if v.version_number == version_number), None)
+                version = catalog.version(car_type.name, ecu_name, version_number)
                 if not version:
                     continue
 
-                file_size = self.db_manager.get_file_size(version.hex_file_path)
+                # Serve a precomputed delta when the car can apply one
+                delta = None
+                old_version = download_request.old_versions.get(ecu_name)
+                if download_request.accept_deltas and old_version:
+                    ecu = catalog.ecu(car_type.name, ecu_name)
+                    base = catalog.version(car_type.name, ecu_name, old_version)
+                    if ecu and base:
+                        delta = self.delta_manager.get_delta(ecu_name, ecu.model_number, old_version, version_number,
+                                                             base.sha256, version.sha256)
+
+                image_format = 'original'
+                codec = None  # Codec of the bytes actually sent for this file
+                missing_chunks = None
+                manifest = None
+                metadata = None  # Published metadata, sent only when the original bytes are served
+                if delta:
+                    file_path = delta['delta_path']
+                    file_size = delta['size']
+                elif download_request.have_chunks is not None:
+                    # Chunk dedup: stream only chunks the car does not hold yet
+                    manifest, file_path, image_format = self.firmware_cache.get_manifest(
+                        version.hex_file_path, download_request.image_format)
+                    if not manifest:
+                        continue
+                    missing_chunks = []
+                    queued = set()
+                    for chunk_hash, chunk_offset, chunk_length in manifest:
+                        if chunk_hash in download_request.have_chunks or chunk_hash in queued:
+                            continue
+                        queued.add(chunk_hash)
+                        missing_chunks.append((chunk_hash, chunk_offset, chunk_length))
+                    file_size = sum(chunk[2] for chunk in missing_chunks)
+                elif download_request.compression or download_request.image_format == 'binary':
+                    # Deltas are already compressed; full images use the cached variant
+                    file_path, file_size, image_format, codec = self.firmware_cache.get_variant(
+                        version.hex_file_path, download_request.compression, download_request.image_format)
+                    if not file_path:
+                        continue
+                    if not codec and image_format == 'original':
+                        metadata = version.file_metadata
+                else:
+                    # Serve from the node cache when a prefetch already pulled the image
+                    file_path = self.firmware_cache.get_cached_source(version.hex_file_path) or version.hex_file_path
+                    file_size = self._version_size(version)
+                    metadata = version.file_metadata
                 total_size += file_size
                 
                 # Get offset from download_request.files_offset (default to 0)
                 offset = download_request.file_offsets.get(ecu_name, 0)
 
                 files_info[ecu_name] = {
-                    'path': version.hex_file_path,
+                    'path': file_path,
                     'size': file_size,
-                    'transferred': offset  # <-- Use offset here
+                    'transferred': offset,  # <-- Use offset here
+                    'delta': delta,
+                    'compression': codec,
+                    'image_format': image_format,
+                    'manifest': manifest,
+                    'missing_chunks': missing_chunks,
+                    'metadata': metadata
                 }
 
             download_request.total_size = total_size
 
             # Send download start message
-            start_message = Protocol.create_message(Protocol.DOWNLOAD_START, {
+            start_payload = {
                 'total_size': total_size,
                 'files': {name: info['size'] for name, info in files_info.items()},
                 'file_offsets': {name: info['transferred'] for name, info in files_info.items()}
-            })
+            }
+            deltas = {name: {
+                'base_version': info['delta']['from_version'],
+                'base_sha256': info['delta']['base_sha256'],
+                'target_sha256': info['delta']['target_sha256'],
+                'target_size': info['delta']['target_size']
+            } for name, info in files_info.items() if info['delta']}
+            if deltas:
+                start_payload['deltas'] = deltas
+            file_metadata = {name: {
+                'sha256': info['metadata'].get('sha256'),
+                'format': info['metadata'].get('format'),
+                'etag': info['metadata'].get('etag')
+            } for name, info in files_info.items() if info['metadata']}
+            if file_metadata:
+                start_payload['file_metadata'] = file_metadata
+            chunk_manifests = {name: {
+                'image_size': sum(chunk[2] for chunk in info['manifest']),
+                'chunks': info['manifest'],
+                'missing': len(info['missing_chunks'])
+            } for name, info in files_info.items() if info['manifest']}
+            if chunk_manifests:
+                start_payload['chunk_manifests'] = chunk_manifests
+            if download_request.compression:
+                # Files sent uncompressed despite the negotiated codec (deltas, images that
+                # would grow) are listed with null so the car does not try to decompress them
+                compressed = {name: info['compression'] for name, info in files_info.items() if not info['manifest']}
+                if compressed:
+                    start_payload['compression'] = compressed
+            binary_images = [name for name, info in files_info.items() if info['image_format'] == 'binary']
+            if binary_images:
+                start_payload['image_formats'] = {name: 'binary' for name in binary_images}
+            start_message = Protocol.create_message(Protocol.DOWNLOAD_START, start_payload)
             
             client_socket.send(start_message)
             logging.info(f"Download Start message for client on ip:{download_request.ip_address} port: {download_request.port} , with message:{start_message}")
@@ -503,19 +1080,33 @@ class ECUUpdateServer:
 
             # Send files
             successful_transfers = 0
-            for ecu_name, file_info in files_info.items():
-                try:
-                    self.transfer_file(
-                        client_socket,
-                        ecu_name,
-                        file_info['path'],
-                        file_info['size'],
-                        download_request,
-                        start_offset=file_info['transferred']  # <-- Pass offset here
-                    )
-                    successful_transfers += 1
-                except Exception as e:
-                    logging.error(f"Error transferring {ecu_name}: {str(e)}")
+            if download_request.multiplex_window:
+                # All ECU streams share one window instead of one stop-and-wait transfer each
+                successful_transfers = self.transfer_multiplexed(
+                    client_socket, files_info, download_request, download_request.multiplex_window)
+            else:
+                for ecu_name, file_info in files_info.items():
+                    try:
+                        if file_info['missing_chunks'] is not None:
+                            self.transfer_chunks(
+                                client_socket,
+                                ecu_name,
+                                file_info['path'],
+                                file_info['missing_chunks'],
+                                download_request
+                            )
+                        else:
+                            self.transfer_file(
+                                client_socket,
+                                ecu_name,
+                                file_info['path'],
+                                file_info['size'],
+                                download_request,
+                                start_offset=file_info['transferred']  # <-- Pass offset here
+                            )
+                        successful_transfers += 1
+                    except Exception as e:
+                        logging.error(f"Error transferring {ecu_name}: {str(e)}")
 
             # Update final status
             if successful_transfers == len(files_info):
@@ -545,6 +1136,115 @@ class ECUUpdateServer:
         """Transfer a single file to client"""
         print(f"file_path: {file_path}")
         print(f"File offset: {start_offset}")
+        for chunk_payload, chunk_length in self._iter_file_chunks(
+                ecu_name, file_path, file_size, download_request, start_offset):
+            self._send_chunk(client_socket, download_request, chunk_payload)
+
+            # Wait for chunk acknowledgment
+            ack = self.receive_message(client_socket)
+            if not ack or ack['type'] != "CHUNK_ACK":
+                raise Exception("Chunk not acknowledged")
+
+            download_request.transferred_size += chunk_length
+
+    def transfer_chunks(self, client_socket: socket.socket, ecu_name: str, image_path: str,
+                        missing_chunks: List, download_request: DownloadRequest):
+        """Transfer only the content-defined chunks the car is missing"""
+        for chunk_payload, chunk_length in self._iter_missing_chunks(
+                ecu_name, image_path, missing_chunks, download_request):
+            self._send_chunk(client_socket, download_request, chunk_payload)
+
+            ack = self.receive_message(client_socket)
+            if not ack or ack['type'] != "CHUNK_ACK":
+                raise Exception("Chunk not acknowledged")
+
+            download_request.transferred_size += chunk_length
+
+    def transfer_multiplexed(self, client_socket: socket.socket, files_info: Dict,
+                             download_request: DownloadRequest, window: int) -> int:
+        """
+        Interleave all ECU streams over one connection with up to `window` chunks in flight.
+        Each stream gets a FILE_COMPLETE as soon as its last chunk is acknowledged, so the car
+        can start flashing it while the other streams are still downloading.
+        Returns the number of streams that completed.
+        """
+        streams = {}
+        for ecu_name, file_info in files_info.items():
+            if file_info['missing_chunks'] is not None:
+                chunks = self._iter_missing_chunks(ecu_name, file_info['path'],
+                                                   file_info['missing_chunks'], download_request)
+            else:
+                chunks = self._iter_file_chunks(ecu_name, file_info['path'], file_info['size'],
+                                                download_request, file_info['transferred'])
+            streams[ecu_name] = {'chunks': chunks, 'exhausted': False, 'failed': False,
+                                 'in_flight': {}, 'acked': file_info['transferred']}
+
+        in_flight = 0
+        completed = 0
+        rotation = list(streams)
+        next_stream = 0
+
+        while True:
+            # Fill the window round-robin across streams that still have data
+            sendable = [name for name in rotation if not streams[name]['exhausted']]
+            while in_flight < window and sendable:
+                ecu_name = sendable[next_stream % len(sendable)]
+                next_stream += 1
+                stream = streams[ecu_name]
+                try:
+                    chunk_payload, chunk_length = next(stream['chunks'])
+                except StopIteration:
+                    stream['exhausted'] = True
+                    sendable.remove(ecu_name)
+                    continue
+                except Exception as e:
+                    logging.error(f"Error reading {ecu_name} stream: {str(e)}")
+                    stream['exhausted'] = stream['failed'] = True
+                    sendable.remove(ecu_name)
+                    continue
+
+                chunk_payload['stream_id'] = ecu_name
+                self._send_chunk(client_socket, download_request, chunk_payload)
+                stream['in_flight'][chunk_payload['offset']] = chunk_length
+                in_flight += 1
+
+            # Announce streams whose every chunk has been acknowledged
+            for ecu_name in list(rotation):
+                stream = streams[ecu_name]
+                if stream['exhausted'] and not stream['in_flight']:
+                    rotation.remove(ecu_name)
+                    if stream['failed']:
+                        continue
+                    completed += 1
+                    client_socket.send(Protocol.create_message(Protocol.FILE_COMPLETE, {
+                        'ecu_name': ecu_name,
+                        'size': files_info[ecu_name]['size']
+                    }))
+
+            if not in_flight:
+                return completed
+
+            ack = self.receive_message(client_socket)
+            if not ack or ack['type'] != "CHUNK_ACK":
+                raise Exception("Chunk not acknowledged")
+
+            stream = streams.get(ack['payload'].get('ecu_name'))
+            chunk_length = stream['in_flight'].pop(ack['payload'].get('offset'), None) if stream else None
+            if chunk_length is None:
+                logging.warning(f"Ignoring acknowledgment for unknown chunk: {ack['payload']}")
+                continue
+            in_flight -= 1
+            download_request.transferred_size += chunk_length
+
+    def _send_chunk(self, client_socket: socket.socket, download_request: DownloadRequest, chunk_payload: Dict):
+        """Send a FILE_CHUNK once the egress scheduler grants its bytes"""
+        chunk_message = Protocol.create_message(Protocol.FILE_CHUNK, chunk_payload)
+        self.egress_scheduler.acquire(download_request.transfer_id, len(chunk_message))
+        client_socket.send(chunk_message)
+
+    def _iter_file_chunks(self, ecu_name: str, file_path: str, file_size: int,
+                          download_request: DownloadRequest, start_offset: int = 0):
+        """Yield (FILE_CHUNK payload, byte count) for a file from start_offset"""
         offset = start_offset
         while offset < file_size:
             chunk = self.db_manager.get_hex_file_chunk(file_path, self.chunk_size, offset)
@@ -552,23 +1252,66 @@ class ECUUpdateServer:
                 raise Exception(f"Failed to read chunk from {file_path}")
 
             # Create chunk message
-            chunk_message = Protocol.create_message(Protocol.FILE_CHUNK, {
+            chunk_payload = {
                 'ecu_name': ecu_name,
-                'offset': offset,
-                'data': chunk.hex()  # Convert binary to hex string
-            })
-            client_socket.send(chunk_message)
+                'offset': offset
+            }
+            self._encode_chunk_data(chunk_payload, chunk, download_request)
+            yield chunk_payload, len(chunk)
+            offset += len(chunk)
 
-            # Wait for chunk acknowledgment
-            ack = self.receive_message(client_socket)
-            if not ack or ack['type'] != "CHUNK_ACK":
-                raise Exception("Chunk not acknowledged")
+    def _iter_missing_chunks(self, ecu_name: str, image_path: str, missing_chunks: List,
+                             download_request: DownloadRequest):
+        """Yield (FILE_CHUNK payload, byte count) for each content-defined chunk the car is missing"""
+        with open(image_path, 'rb') as f:
+            for chunk_hash, offset, length in missing_chunks:
+                f.seek(offset)
+                chunk = f.read(length)
+                if len(chunk) != length:
+                    raise Exception(f"Failed to read chunk {chunk_hash} from {image_path}")
 
-            offset += len(chunk)
-            download_request.transferred_size += len(chunk)
+                chunk_payload = {
+                    'ecu_name': ecu_name,
+                    'offset': offset,
+                    'chunk_hash': chunk_hash
+                }
+                # Chunks are compressed one by one since the car reassembles them out of order
+                if download_request.compression:
+                    compressed = compress(download_request.compression, chunk)
+                    if len(compressed) < len(chunk):
+                        chunk_payload['compression'] = download_request.compression
+                        chunk = compressed
+                self._encode_chunk_data(chunk_payload, chunk, download_request)
+                yield chunk_payload, length
+
+    def _encode_chunk_data(self, chunk_payload: Dict, chunk: bytes, download_request: DownloadRequest):
+        """Put chunk bytes into a FILE_CHUNK payload using the negotiated encoding"""
+        if download_request.chunk_encoding == 'base64':
+            chunk_payload['data'] = base64.b64encode(chunk).decode()
+            chunk_payload['encoding'] = 'base64'
+        else:
+            chunk_payload['data'] = chunk.hex()  # Convert binary to hex string
+
+    def _multiplex_window(self, metadata: Dict) -> int:
+        """Chunks in flight for a multiplexed download, or 0 for one-by-one transfers"""
+        if not metadata.get('multiplex'):
+            return 0
+        requested = int(metadata.get('window', self.multiplex_window))
+        return max(1, min(requested, self.max_multiplex_window))
+
+    def _collect_chunk_hashes(self, have_chunks) -> Optional[set]:
+        """Flatten the chunk hashes a car reports, either a list or a per-ECU map"""
+        if have_chunks is None:
+            return None
+        if isinstance(have_chunks, dict):
+            return {chunk_hash for hashes in have_chunks.values() for chunk_hash in hashes}
+        return set(have_chunks)
 
     def receive_message(self, client_socket: socket.socket) -> Optional[Dict]:
         """Receive and parse a message from the client"""
+        if isinstance(client_socket, MuxSessionChannel):
+            # Frames of a gateway session were already read and parsed by the gateway connection
+            return client_socket.receive_message()
         try:
             # First receive message length (10 bytes)
             length_data = b""
@@ -606,5 +1349,12 @@ class ECUUpdateServer:
     def shutdown(self):
         """Shutdown the server"""
         self.running = False
+        self.stop_event.set()
+        self.publish_events.stop()
         if self.socket:
-            self.socket.close()
\ No newline at end of file
+            self.socket.close()
+        self.delta_manager.shutdown()
+        self.firmware_cache.shutdown()
+        if self.lazy_catalog:
+            self.catalog.shutdown()
+        self.db_manager.close()
\ No newline at end of file
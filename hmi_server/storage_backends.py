@@ -0,0 +1,215 @@
+import os
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+
+class LocalBlobBackend:
+    """Firmware files on the local file system (plain paths and file:// URLs)"""
+
+    @staticmethod
+    def _path(file_path: str) -> str:
+        return urlparse(file_path).path if file_path.startswith("file://") else file_path
+
+    def read(self, file_path: str, offset: int, length: int) -> bytes:
+        with open(self._path(file_path), 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def size(self, file_path: str) -> int:
+        return os.path.getsize(self._path(file_path))
+
+    def read_all(self, file_path: str) -> bytes:
+        with open(self._path(file_path), 'rb') as f:
+            return f.read()
+
+    def get_status(self) -> Dict:
+        return {}
+
+    def close(self):
+        pass
+
+
+class MemoryBlobBackend:
+    """Firmware held in process memory under mem:// URLs, for load tests and benchmarks"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.blobs: Dict[str, bytes] = {}
+
+    def put(self, file_path: str, data: bytes):
+        with self.lock:
+            self.blobs[file_path] = bytes(data)
+
+    def _get(self, file_path: str) -> bytes:
+        with self.lock:
+            if file_path not in self.blobs:
+                raise FileNotFoundError(file_path)
+            return self.blobs[file_path]
+
+    def read(self, file_path: str, offset: int, length: int) -> bytes:
+        return self._get(file_path)[offset:offset + length]
+
+    def size(self, file_path: str) -> int:
+        return len(self._get(file_path))
+
+    def read_all(self, file_path: str) -> bytes:
+        return self._get(file_path)
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {"blobs": len(self.blobs), "bytes": sum(len(data) for data in self.blobs.values())}
+
+    def close(self):
+        with self.lock:
+            self.blobs.clear()
+
+
+class AzureBlobBackend:
+    """Firmware in an Azure Blob Storage container, served through a ranged read-ahead reader"""
+
+    def __init__(self, account_name: str, account_key: str, container_name: str, pool_size: int = None):
+        # Imported here so local and in-memory setups need no Azure SDK
+        import requests
+        from requests.adapters import HTTPAdapter
+        from azure.storage.blob import BlobServiceClient
+        from azure.core.pipeline.transport import RequestsTransport
+        from blob_reader import RangedBlobReader
+
+        self.container_name = container_name
+        # One pooled HTTP session so concurrent range reads reuse connections
+        self.pool_size = pool_size or int(os.getenv("HMI_BLOB_POOL_SIZE", "16"))
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=self.pool_size,
+                                                   pool_maxsize=self.pool_size, pool_block=True))
+        self.service_client = BlobServiceClient.from_connection_string(
+            f"DefaultEndpointsProtocol=https;AccountName={account_name};"
+            f"AccountKey={account_key};EndpointSuffix=core.windows.net",
+            transport=RequestsTransport(session=self.session, session_owner=False)
+        )
+        self.container_client = self.service_client.get_container_client(container_name)
+        self.reader = RangedBlobReader(self._fetch_range, self._fetch_size)
+
+    @classmethod
+    def from_env(cls) -> "AzureBlobBackend":
+        return cls(os.getenv("HEX_STORAGE_ACCOUNT_NAME"), os.getenv("HEX_STORAGE_ACCOUNT_KEY"),
+                   os.getenv("HEX_STORAGE_CONTAINER_NAME"))
+
+    @staticmethod
+    def blob_name(blob_url: str) -> str:
+        """The blob name is the URL path after the container name; it may contain '/'"""
+        return '/'.join(urlparse(blob_url).path.split('/')[2:])
+
+    def _fetch_range(self, blob_name: str, offset: int, length: int) -> bytes:
+        blob_client = self.container_client.get_blob_client(blob_name)
+        return blob_client.download_blob(offset=offset, length=length).readall()
+
+    def _fetch_size(self, blob_name: str) -> tuple:
+        properties = self.container_client.get_blob_client(blob_name).get_blob_properties()
+        return properties.size, properties.etag
+
+    def read(self, file_path: str, offset: int, length: int) -> bytes:
+        # Served from large ranges fetched ahead in parallel
+        return self.reader.read(self.blob_name(file_path), offset, length)
+
+    def size(self, file_path: str) -> int:
+        # Blob properties are cached for HMI_BLOB_SIZE_TTL_SECONDS
+        return self.reader.size(self.blob_name(file_path))
+
+    def read_all(self, file_path: str) -> bytes:
+        return self.reader.read_all(self.blob_name(file_path))
+
+    def warm_up(self):
+        if self.container_name:
+            self.container_client.get_container_properties()
+
+    def get_status(self) -> Dict:
+        return {"pool_size": self.pool_size, "buffered_ranges": len(self.reader.ranges)}
+
+    def close(self):
+        self.reader.shutdown()
+        try:
+            self.service_client.close()
+        finally:
+            self.session.close()
+
+
+class BlobStore:
+    """
+    Picks the firmware backend from the file URL: mem:// is in-memory,
+    https://<account>.blob.core.windows.net is Azure, anything else is local.
+    The Azure backend is created on first use, so offline runs need no credentials.
+    """
+
+    def __init__(self, azure_factory=None):
+        self.local = LocalBlobBackend()
+        self.memory = MemoryBlobBackend()
+        self.azure_factory = azure_factory or AzureBlobBackend.from_env
+        self.azure: Optional[AzureBlobBackend] = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def scheme(file_path: str) -> str:
+        parsed = urlparse(file_path)
+        if parsed.scheme == "https" and parsed.netloc.endswith(".blob.core.windows.net"):
+            return "azure"
+        if parsed.scheme == "mem":
+            return "mem"
+        return "file"
+
+    def _azure(self) -> AzureBlobBackend:
+        with self.lock:
+            if self.azure is None:
+                self.azure = self.azure_factory()
+            return self.azure
+
+    def backend_for(self, file_path: str):
+        scheme = self.scheme(file_path)
+        if scheme == "azure":
+            return self._azure()
+        if scheme == "mem":
+            return self.memory
+        return self.local
+
+    def read(self, file_path: str, offset: int, length: int) -> bytes:
+        return self.backend_for(file_path).read(file_path, offset, length)
+
+    def size(self, file_path: str) -> int:
+        return self.backend_for(file_path).size(file_path)
+
+    def read_all(self, file_path: str) -> bytes:
+        return self.backend_for(file_path).read_all(file_path)
+
+    def warm_up(self):
+        """Open the Azure connections up front when Azure storage is configured"""
+        if os.getenv("HEX_STORAGE_ACCOUNT_NAME"):
+            self._azure().warm_up()
+
+    def get_status(self) -> Dict:
+        return {
+            "memory": self.memory.get_status(),
+            "azure": self.azure.get_status() if self.azure else None
+        }
+
+    def close(self):
+        with self.lock:
+            azure, self.azure = self.azure, None
+        if azure:
+            azure.close()
+        self.memory.close()
+
+
+def open_catalog_store(data_directory: str):
+    """
+    Catalog and feedback store selected by HMI_CATALOG_STORE: 'mongo' (default)
+    is the shared DatabaseManager, 'memory' is seeded from the JSON files in data_directory.
+    """
+    store = os.getenv("HMI_CATALOG_STORE", "mongo")
+    if store == "memory":
+        from memory_store import MemoryCatalogStore
+        return MemoryCatalogStore(data_directory)
+    if store != "mongo":
+        logging.warning(f"Unknown HMI_CATALOG_STORE '{store}', using mongo")
+    from database_manager import DatabaseManager
+    return DatabaseManager.shared(data_directory)
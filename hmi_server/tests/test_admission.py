@@ -0,0 +1,83 @@
+import threading
+import time
+
+from admission import AdmissionController
+
+
+def test_zero_caps_are_kept_and_reject_everything(monkeypatch):
+    monkeypatch.setenv("HMI_MAX_SESSIONS", "1000")
+    monkeypatch.setenv("HMI_MAX_DOWNLOADS", "50")
+    admission = AdmissionController(max_sessions=0, max_downloads=0, retry_after_seconds=10, retry_jitter=0)
+
+    assert not admission.try_open_session()
+    assert not admission.acquire_download(timeout=0)
+    assert admission.retry_after("session") == 10
+    assert admission.retry_after("download") == 10
+    status = admission.get_status()
+    assert (status["max_sessions"], status["max_downloads"]) == (0, 0)
+    assert (status["rejected_sessions"], status["rejected_downloads"]) == (1, 1)
+
+
+def test_unset_caps_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("HMI_MAX_SESSIONS", "2")
+    monkeypatch.setenv("HMI_MAX_DOWNLOADS", "1")
+    admission = AdmissionController()
+
+    assert admission.try_open_session() and admission.try_open_session()
+    assert not admission.try_open_session()
+    assert admission.acquire_download(timeout=0)
+    assert not admission.acquire_download(timeout=0)
+    admission.finish_download()
+    assert admission.acquire_download(timeout=0)
+
+
+def queue_behind_full_slot(admission, priorities, delay: float = 0.0):
+    """Queue one waiter per priority behind an occupied slot; returns the order they were admitted in"""
+    admitted = []
+
+    def wait(priority):
+        if admission.acquire_download(priority, timeout=5):
+            admitted.append(priority)
+
+    threads = []
+    for priority in priorities:
+        thread = threading.Thread(target=wait, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        deadline = time.monotonic() + 5
+        while len(admission.waiting) < len(threads) and time.monotonic() < deadline:
+            time.sleep(0.005)
+        time.sleep(delay)
+
+    for _ in priorities:
+        admission.finish_download()
+        deadline = time.monotonic() + 5
+        while admission.active_downloads == 0 and time.monotonic() < deadline:
+            time.sleep(0.005)
+    for thread in threads:
+        thread.join(5)
+    return admitted
+
+
+def test_higher_priority_download_takes_the_next_slot(monkeypatch):
+    monkeypatch.setenv("HMI_PRIORITY_AGING_SECONDS", "3600")
+    admission = AdmissionController(max_downloads=1)
+    assert admission.acquire_download(timeout=0)
+    assert queue_behind_full_slot(admission, [0, 2]) == [2, 0]
+
+
+def test_waiting_ages_a_routine_download_past_a_newer_critical_one(monkeypatch):
+    monkeypatch.setenv("HMI_PRIORITY_AGING_SECONDS", "0.05")
+    admission = AdmissionController(max_downloads=1)
+    assert admission.acquire_download(timeout=0)
+    # The routine download waits 0.3s, six aging periods, before the critical one arrives
+    assert queue_behind_full_slot(admission, [0, 2], delay=0.3) == [0, 2]
+
+
+def test_effective_priority_grows_one_level_per_aging_period(monkeypatch):
+    monkeypatch.setenv("HMI_PRIORITY_AGING_SECONDS", "30")
+    admission = AdmissionController()
+    now = time.monotonic()
+    assert admission._effective_priority([1, now - 45, 0], now) == 2.5
+    admission.waiting = [[1, now, 0], [0, now - 60, 1]]
+    assert admission._next_waiter()[2] == 1
@@ -0,0 +1,210 @@
+import asyncio
+import copy
+import threading
+from datetime import datetime
+from types import SimpleNamespace
+
+from pymongo import ReturnDocument
+
+import async_database_manager
+from async_database_manager import AsyncDatabaseManager
+from models import FlashingFeedback
+
+
+def matches(doc: dict, query: dict) -> bool:
+    for key, expected in query.items():
+        if isinstance(expected, dict) and "$in" in expected:
+            if doc.get(key) not in expected["$in"]:
+                return False
+        elif doc.get(key) != expected:
+            return False
+    return True
+
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class Collection:
+    """The part of a Motor collection the manager uses, with Mongo's update operators"""
+
+    def __init__(self):
+        self.docs = []
+
+    def find(self, query: dict):
+        return Cursor([copy.deepcopy(doc) for doc in self.docs if matches(doc, query)])
+
+    async def find_one(self, query: dict):
+        return next((copy.deepcopy(doc) for doc in self.docs if matches(doc, query)), None)
+
+    async def insert_one(self, doc: dict):
+        doc = dict(doc, _id=len(self.docs) + 1)
+        self.docs.append(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def find_one_and_update(self, query: dict, update: dict, upsert=False, return_document=None):
+        await asyncio.sleep(0)  # Let concurrent updates interleave, as they would over the network
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return None
+            doc = {key: value for key, value in query.items() if not isinstance(value, dict)}
+            doc.update(update.get("$setOnInsert", {}))
+            doc["_id"] = len(self.docs) + 1
+            self.docs.append(doc)
+        for key, amount in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + amount
+        doc.update(update.get("$set", {}))
+        for key, value in update.get("$push", {}).items():
+            doc.setdefault(key, []).append(value)
+        assert return_document is ReturnDocument.AFTER
+        return copy.deepcopy(doc)
+
+    async def update_one(self, query: dict, update: dict, upsert=False):
+        if upsert or any(matches(doc, query) for doc in self.docs):
+            await self.find_one_and_update(query, update, upsert, ReturnDocument.AFTER)
+
+
+class Database(dict):
+    def __missing__(self, name: str) -> Collection:
+        return self.setdefault(name, Collection())
+
+
+class MongoClient:
+    def __init__(self):
+        self.database = Database()
+        self.closed = False
+
+    def __getitem__(self, name) -> Database:
+        return self.database
+
+    def close(self):
+        self.closed = True
+
+
+class Downloader:
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def readall(self):
+        return self.data
+
+
+class BlobServiceClient:
+    """azure.storage.blob.aio stand-in serving blobs of one container from memory"""
+
+    def __init__(self, blobs: dict):
+        self.blobs = blobs
+        self.container = None
+
+    def get_container_client(self, name):
+        self.container = name
+        return self
+
+    def get_blob_client(self, blob_name):
+        data = self.blobs[blob_name]
+
+        async def download_blob(offset=0, length=None):
+            return Downloader(data[offset:None if length is None else offset + length])
+
+        async def get_blob_properties():
+            return SimpleNamespace(size=len(data))
+
+        return SimpleNamespace(download_blob=download_blob, get_blob_properties=get_blob_properties)
+
+    async def close(self):
+        pass
+
+
+def manager(tmp_path) -> AsyncDatabaseManager:
+    mongo = MongoClient()
+    mongo.database["car_types"].docs.append({"_id": 1, "name": "ModelX", "model_number": "MX", "ecu_ids": [10],
+                                                "car_ids": ["MX-1"], "manufactured_count": 1})
+    mongo.database["ecus"].docs.append({"_id": 10, "name": "Engine", "model_number": "E1", "version_ids": [100, 101]})
+    mongo.database["versions"].docs.append({"_id": 100, "version_number": "1.0.0", "compatible_car_types": ["ModelX"],
+                                              "hex_file_path": "engine_1_0_0.hex"})
+    blobs = BlobServiceClient({"sha256/ab/abcd": b"0123456789"})
+    return AsyncDatabaseManager(str(tmp_path), mongo_client=mongo, blob_service_client=blobs)
+
+
+def feedback(status: str, successful, rolled_back) -> FlashingFeedback:
+    return FlashingFeedback(session_id=f"s-{status}", car_id="MX-1", car_type="ModelX",
+                            flashing_timestamp=datetime(2026, 1, 1), overall_status=status, total_ecus=2,
+                            successful_ecus=successful, rolled_back_ecus=rolled_back,
+                            final_ecu_versions={"Engine": "2.0.0", "Brakes": "1.0.0"},
+                            android_app_version="1", beaglebone_version="1", request_id="r")
+
+
+def test_catalog_is_loaded_with_one_query_per_collection(tmp_path):
+    db = manager(tmp_path)
+    car_types = asyncio.run(db.load_all_data())
+    assert [(car_type.name, [ecu.name for ecu in car_type.ecus]) for car_type in car_types] == [("ModelX", ["Engine"])]
+    # Version 101 is not stored, so it is skipped
+    assert [version.version_number for version in car_types[0].ecus[0].versions] == ["1.0.0"]
+
+
+def test_files_are_read_from_the_backend_of_their_url(tmp_path, monkeypatch):
+    db = manager(tmp_path)
+    local = tmp_path / "engine.hex"
+    local.write_bytes(b"S00600004844521B")
+    db.memory.put("mem://engine.hex", b"in memory")
+    azure_url = "https://account.blob.core.windows.net/firmware/sha256/ab/abcd"
+
+    stat_threads = []
+    getsize = async_database_manager.LocalBlobBackend.size
+
+    def size(self, file_path):
+        stat_threads.append(threading.current_thread())
+        return getsize(self, file_path)
+
+    monkeypatch.setattr(async_database_manager.LocalBlobBackend, "size", size)
+
+    async def read_all():
+        return (await db.get_file_size(str(local)), await db.get_hex_file_chunk(str(local), 4, 2),
+                await db.get_file_size("mem://engine.hex"), await db.read_file_bytes("mem://engine.hex"),
+                await db.get_file_size(azure_url), await db.get_hex_file_chunk(azure_url, 3, 4),
+                await db.get_file_size(str(tmp_path / "missing.hex")))
+
+    assert asyncio.run(read_all()) == (16, b"0600", 9, b"in memory", 10, b"456", 0)
+    # Local stats run on the executor, never on the loop's thread
+    assert stat_threads and threading.main_thread() not in stat_threads
+
+
+def test_feedback_metrics_match_the_sync_manager(tmp_path):
+    db = manager(tmp_path)
+
+    async def report():
+        return await asyncio.gather(
+            db.save_flashing_feedback(feedback("completed", ["Engine"], [])),
+            db.save_flashing_feedback(feedback("partial_failure", ["Engine"], ["Brakes"])),
+            db.save_flashing_feedback(feedback("failed", [], ["Engine"]))
+        )
+
+    assert asyncio.run(report()) == [True, True, True]
+
+    metrics = {(doc["ecu_name"], doc["version"]): doc for doc in db.flashing_metrics_collection.docs}
+    engine = metrics[("Engine", "2.0.0")]
+    assert {key: engine[key] for key in async_database_manager.METRIC_COUNTERS} == \
+           {"total_attempts": 3, "successful_attempts": 2, "failed_attempts": 0, "rollback_attempts": 1}
+    assert round(engine["success_rate"], 2) == 66.67
+    brakes = metrics[("Brakes", "1.0.0")]
+    assert (brakes["total_attempts"], brakes["rollback_attempts"], brakes["failed_attempts"],
+            brakes["success_rate"]) == (1, 1, 0, 0)
+
+    history, = db.car_flashing_history_collection.docs
+    assert (history["car_type"], history["total_flashing_sessions"], history["successful_sessions"],
+            history["partial_success_sessions"], history["failed_sessions"]) == ("ModelX", 3, 1, 1, 1)
+    assert sorted(history["flashing_sessions"]) == ["s-completed", "s-failed", "s-partial_failure"]
+    assert history["current_ecu_versions"] == {"Engine": "2.0.0", "Brakes": "1.0.0"}
+
+
+def test_feedback_for_an_unknown_car_is_rejected(tmp_path):
+    db = manager(tmp_path)
+    unknown = feedback("completed", ["Engine"], [])
+    unknown.car_id = "MX-9"
+    assert asyncio.run(db.save_flashing_feedback(unknown)) is False
+    assert db.flashing_feedback_collection.docs == []
@@ -0,0 +1,17 @@
+from bandwidth import EgressScheduler
+
+
+def test_transfers_of_one_car_are_scheduled_separately():
+    scheduler = EgressScheduler(rate_bytes_per_sec=0, car_type_weights={})
+    scheduler.register("MX-1/a", car_type="ModelX", priority=0)
+    scheduler.register("MX-1/b", car_type="ModelX", priority=2)
+
+    scheduler.acquire("MX-1/a", 100)
+    scheduler.acquire("MX-1/b", 300)
+    scheduler.unregister("MX-1/a")
+
+    sessions = scheduler.get_status()["sessions"]
+    # Finishing one download leaves the other's weight and accounting alone
+    assert list(sessions) == ["MX-1/b"]
+    assert sessions["MX-1/b"] == {"weight": scheduler.priority_weight(2), "sent_bytes": 300}
+    assert scheduler.get_status()["total_sent_bytes"] == 400
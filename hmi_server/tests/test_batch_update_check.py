@@ -0,0 +1,76 @@
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from models import CarType, ECU, Version
+from update_planner import UpdatePlanner
+
+
+@pytest.fixture
+def hmi_server(tmp_path, monkeypatch):
+    monkeypatch.setenv("HMI_CATALOG_STORE", "memory")
+    monkeypatch.setenv("HMI_PUBLISH_EVENTS", "memory")
+    monkeypatch.setenv("HMI_CATALOG_MODE", "eager")
+    import server
+    hmi_server = server.ECUUpdateServer("127.0.0.1", 0, str(tmp_path))
+    versions = [Version(number, ["ModelX"], f"mem://engine_{number}.hex", file_metadata={"size": 16})
+                for number in ("1.0.0", "1.1.0")]
+    hmi_server.db_manager.save_car_type(CarType("ModelX", "MX", [ECU("Engine", "E1", versions)], 3,
+                                                ["MX-1", "MX-2", "MX-3"]))
+    assert hmi_server.refresh_catalog()
+    yield hmi_server
+    hmi_server.shutdown()
+
+
+def test_batch_reports_a_status_per_car_in_order(hmi_server):
+    results = hmi_server.check_for_updates_batch([
+        {"car_type": "modelx", "car_id": "mx-1", "ecu_versions": {"Engine": "1.0.0"}},
+        {"car_type": "ModelX", "car_id": "MX-2", "ecu_versions": {"engine": "1.0.0"}},
+        {"car_type": "ModelX", "car_id": "MX-3", "ecu_versions": {"Engine": "1.1.0"}},
+        {"car_type": "ModelX", "car_id": "MX-9", "ecu_versions": {"Engine": "1.0.0"}},
+        {"car_type": "ModelX", "ecu_versions": {"Engine": "1.0.0"}},
+        {"car_type": "ModelQ", "car_id": "MQ-1", "ecu_versions": {}},
+        {}
+    ])
+
+    assert [(result["car_type"], result["car_id"], result["status"]) for result in results] == [
+        ("ModelX", "mx-1", "authenticated"),
+        ("ModelX", "MX-2", "authenticated"),
+        ("ModelX", "MX-3", "authenticated"),
+        ("ModelX", "MX-9", "non_authenticated"),
+        ("ModelX", "", "non_authenticated"),
+        ("ModelQ", "MQ-1", "unknown_car_type"),
+        ("", "", "unknown_car_type")
+    ]
+    assert [result["updates_needed"] for result in results[:3]] == [{"Engine": "1.1.0"}, {"Engine": "1.1.0"}, {}]
+    assert results[0]["install_plan"]["steps"]
+    assert all(result["updates_needed"] == {} and result["install_plan"] is None for result in results[3:])
+
+
+def test_cars_reporting_the_same_versions_share_one_plan(hmi_server, monkeypatch):
+    plans = []
+    plan = hmi_server.planner.plan
+
+    def counting_plan(*args, **kwargs):
+        plans.append(args[0])
+        return plan(*args, **kwargs)
+
+    monkeypatch.setattr(hmi_server.planner, "plan", counting_plan)
+    cars = [{"car_type": "ModelX", "car_id": car_id, "ecu_versions": {"Engine": "1.0.0"}}
+            for car_id in ("MX-1", "MX-2", "MX-3")]
+    results = hmi_server.check_for_updates_batch(cars)
+    assert [result["status"] for result in results] == ["authenticated"] * 3
+    assert plans == ["ModelX"]
+
+    # The memo carries the offer over to the next batch and to single-car checks
+    hmi_server.check_for_updates_batch(cars[:1])
+    assert plans == ["ModelX"]
+
+
+def test_car_type_missing_from_the_planner_fails(hmi_server):
+    hmi_server.planner = UpdatePlanner([])
+    hmi_server.update_memo.clear()
+    result, = hmi_server.check_for_updates_batch([{"car_type": "ModelX", "car_id": "MX-1",
+                                                    "ecu_versions": {"Engine": "1.0.0"}}])
+    assert (result["status"], result["updates_needed"], result["install_plan"]) == ("failed", {}, None)
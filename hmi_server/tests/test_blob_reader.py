@@ -0,0 +1,115 @@
+import pytest
+
+from blob_reader import RangedBlobReader
+
+
+class FakeBlob:
+    def __init__(self, data: bytes, etag: str = "v1"):
+        self.data = data
+        self.etag = etag
+        self.range_fetches = 0
+        self.size_fetches = 0
+
+    def fetch_range(self, blob_name: str, offset: int, length: int) -> bytes:
+        self.range_fetches += 1
+        return self.data[offset:offset + length]
+
+    def fetch_size(self, blob_name: str):
+        self.size_fetches += 1
+        return len(self.data), self.etag
+
+
+@pytest.fixture
+def blob():
+    return FakeBlob(bytes(range(256)) * 40)  # 10240 bytes
+
+
+def reader_for(blob: FakeBlob, **kwargs) -> RangedBlobReader:
+    kwargs.setdefault("range_size", 1024)
+    kwargs.setdefault("read_ahead", 1)
+    kwargs.setdefault("max_workers", 2)
+    return RangedBlobReader(blob.fetch_range, blob.fetch_size, **kwargs)
+
+
+def test_reads_across_ranges_and_clips_to_end(blob):
+    reader = reader_for(blob)
+    try:
+        assert reader.read("image", 1000, 100) == blob.data[1000:1100]
+        assert reader.read("image", 10200, 500) == blob.data[10200:]
+        assert reader.read("image", 20000, 10) == b""
+        assert reader.read_all("image") == blob.data
+    finally:
+        reader.shutdown()
+
+
+def test_small_reads_are_served_from_buffered_ranges(blob):
+    reader = reader_for(blob, read_ahead=0)
+    try:
+        for offset in range(0, 1024, 128):
+            assert reader.read("image", offset, 128) == blob.data[offset:offset + 128]
+        assert blob.range_fetches == 1
+    finally:
+        reader.shutdown()
+
+
+def test_truncated_blob_raises_instead_of_spinning(blob):
+    reader = reader_for(blob, size_ttl=3600)
+    try:
+        assert reader.size("image") == len(blob.data)
+        blob.data = blob.data[:2048]
+        with pytest.raises(IOError):
+            reader.read("image", 4096, 1024)
+        # The stale size was dropped, so the next read sees the new blob
+        assert reader.read("image", 0, 4096) == blob.data
+    finally:
+        reader.shutdown()
+
+
+def test_truncated_blob_fails_read_all(blob):
+    reader = reader_for(blob, size_ttl=3600)
+    try:
+        reader.size("image")
+        blob.data = blob.data[:1500]
+        with pytest.raises(IOError):
+            reader.read_all("image")
+        assert reader.read_all("image") == blob.data
+    finally:
+        reader.shutdown()
+
+
+def test_republished_blob_drops_buffered_ranges_after_ttl(blob):
+    reader = reader_for(blob, size_ttl=0)
+    try:
+        assert reader.read("image", 0, 16) == blob.data[:16]
+        blob.data = b"\xff" * len(blob.data)
+        blob.etag = "v2"
+        assert reader.read("image", 0, 16) == b"\xff" * 16
+    finally:
+        reader.shutdown()
+
+
+def test_size_is_cached_within_ttl(blob):
+    reader = reader_for(blob, size_ttl=3600)
+    try:
+        reader.size("image")
+        reader.size("image")
+        assert blob.size_fetches == 1
+    finally:
+        reader.shutdown()
+
+
+def test_failed_range_is_retried(blob):
+    failures = [RuntimeError("network")]
+
+    def flaky_fetch(blob_name, offset, length):
+        if failures:
+            raise failures.pop()
+        return blob.data[offset:offset + length]
+
+    reader = RangedBlobReader(flaky_fetch, blob.fetch_size, range_size=1024, read_ahead=0, max_workers=1)
+    try:
+        with pytest.raises(RuntimeError):
+            reader.read("image", 0, 10)
+        assert reader.read("image", 0, 10) == blob.data[:10]
+    finally:
+        reader.shutdown()
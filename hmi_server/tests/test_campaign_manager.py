@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+
+from models import RolloutCampaign
+from campaign_manager import CampaignManager
+
+
+def test_campaign_cohort_is_stable_and_waves_widen_over_time():
+    assert CampaignManager.cohort("c1", "MX-1") == CampaignManager.cohort("c1", "mx-1")
+    assert 0 <= CampaignManager.cohort("c1", "MX-1") < 100
+    cohorts = [CampaignManager.cohort("c1", f"MX-{number}") for number in range(2000)]
+    # Cars spread evenly, so a 25% wave reaches about a quarter of the fleet
+    assert 400 < sum(cohort < 25 for cohort in cohorts) < 600
+    assert cohorts != [CampaignManager.cohort("c2", f"MX-{number}") for number in range(2000)]
+
+    now = datetime.now()
+    campaign = RolloutCampaign(campaign_id="c1", ecu_name="Engine", target_version="2.0.0", waves=[
+        {"start": now + timedelta(days=1), "percentage": 100},
+        {"start": now - timedelta(days=1), "percentage": 10}
+    ])
+    campaigns = CampaignManager([campaign])
+    assert CampaignManager.current_percentage(campaign, now) == 10
+    assert CampaignManager.current_percentage(campaign, now + timedelta(days=2)) == 100
+    assert campaigns.generation == 1
+    campaigns.load([campaign])
+    assert campaigns.generation == 1
+
+
+def test_campaign_download_cap():
+    campaigns = CampaignManager([RolloutCampaign(campaign_id="c1", ecu_name="Engine", target_version="2.0.0",
+                                                 max_active_downloads=1)])
+    assert campaigns.start_download("MX-1/a", "MX-1", {"Engine": "2.0.0"})
+    assert not campaigns.is_offered("ModelX", "MX-2", "Engine", "2.0.0")
+    assert not campaigns.start_download("MX-2/a", "MX-2", {"Engine": "2.0.0"})
+    campaigns.finish_download("MX-1/a")
+    assert campaigns.start_download("MX-2/a", "MX-2", {"Engine": "2.0.0"})
+
+
+def test_parallel_transfers_of_a_car_share_one_slot():
+    campaigns = CampaignManager([RolloutCampaign(campaign_id="c1", ecu_name="Engine", target_version="2.0.0",
+                                                 max_active_downloads=1)])
+    assert campaigns.start_download("MX-1/a", "MX-1", {"Engine": "2.0.0"})
+    assert campaigns.start_download("MX-1/b", "MX-1", {"Engine": "2.0.0"})
+    assert campaigns.get_status()[0]["active_downloads"] == 1
+
+    # The car keeps its slot until its last transfer finishes
+    campaigns.finish_download("MX-1/a")
+    assert not campaigns.start_download("MX-2/a", "MX-2", {"Engine": "2.0.0"})
+    campaigns.finish_download("MX-1/b")
+    assert campaigns.start_download("MX-2/a", "MX-2", {"Engine": "2.0.0"})
+
+
+def test_versions_outside_the_wave_are_withheld():
+    campaign = RolloutCampaign(campaign_id="c1", ecu_name="Engine", target_version="2.0.0", percentage=50,
+                               car_types=["ModelX"])
+    fleet = sorted((f"MX-{number}" for number in range(20)), key=lambda car_id: CampaignManager.cohort("c1", car_id))
+    in_wave, outside = fleet[0], fleet[-1]
+    campaigns = CampaignManager([campaign])
+
+    required = {"Engine": "2.0.0", "Brakes": "1.0.0"}
+    assert campaigns.withheld_versions("ModelX", in_wave, required) == []
+    assert campaigns.withheld_versions("ModelX", outside, required) == ["Engine 2.0.0"]
+    assert campaigns.withheld_versions("ModelY", in_wave, required) == ["Engine 2.0.0"]
@@ -0,0 +1,53 @@
+from catalog_index import CatalogIndex
+from models import CarType, ECU, Version
+
+
+def fresh(text: str) -> str:
+    """A new string object, as each database load returns"""
+    return "".join(list(text))
+
+
+def engine(*numbers: str) -> ECU:
+    return ECU(fresh("Engine"), fresh("E1"), [Version(fresh(number), [fresh("ModelX"), fresh("ModelY")],
+                                                      fresh(f"engine_{number}.hex"), requires={fresh("Gateway"): "1.0"})
+                                              for number in numbers])
+
+
+def car_type(name: str, *ecus: ECU) -> CarType:
+    return CarType(fresh(name), fresh(name[-1]), list(ecus), 1, [fresh(f"{name}-1")])
+
+
+def test_equal_records_of_several_car_types_are_stored_once():
+    index = CatalogIndex([car_type("ModelX", engine("1.0.0", "1.1.0")),
+                          car_type("ModelY", engine("1.0.0", "1.1.0")),
+                          car_type("ModelZ", engine("1.0.0"))])
+
+    x_engine, y_engine, z_engine = (index.ecu(name, "Engine") for name in ("modelx", "MODELY", "ModelZ"))
+    assert x_engine is y_engine
+    # A different version list is a different ECU record, but the versions it shares are not copied
+    assert z_engine is not x_engine and z_engine.versions[0] is x_engine.versions[0]
+    assert index.version("ModelZ", "Engine", "1.0.0") is index.version("ModelX", "Engine", "1.0.0")
+    assert index.get_status() == {"car_types": 3, "ecus": 2, "versions": 2}
+
+
+def test_strings_are_interned():
+    index = CatalogIndex([car_type("ModelX", engine("1.0.0")), car_type("ModelY", engine("2.0.0"))])
+    first, second = (index.ecu(name, "Engine") for name in ("ModelX", "ModelY"))
+    assert first.name is second.name and first.model_number is second.model_number
+    version_x, version_y = first.versions[0], second.versions[0]
+    assert version_x.compatible_car_types[0] is version_y.compatible_car_types[0] is index.car_type("ModelX").name
+    assert next(iter(version_x.requires)) is next(iter(version_y.requires))
+
+
+def test_lookups_ignore_case_of_car_types_and_ids():
+    index = CatalogIndex([car_type("ModelX", engine("1.0.0"))])
+    assert index.car_type("MODELX").name == "ModelX"
+    assert index.has_car("modelx", "MODELX-1") and not index.has_car("ModelX", "ModelX-2")
+    assert index.car_type("Unknown") is None and index.version("ModelX", "Engine", "9.9.9") is None
+    assert not index.has_car(None, None)
+
+
+def test_catalog_records_have_no_instance_dict():
+    index = CatalogIndex([car_type("ModelX", engine("1.0.0"))])
+    records = [index.car_type("ModelX"), index.ecu("ModelX", "Engine"), index.version("ModelX", "Engine", "1.0.0")]
+    assert not any(hasattr(record, "__dict__") for record in records)
@@ -0,0 +1,44 @@
+import json
+from datetime import datetime
+
+from models import CarType, ECU, RolloutCampaign, Version
+from catalog_snapshot import CatalogSnapshot
+
+
+def catalog():
+    car_types = [CarType(name="ModelX", model_number="MX", manufactured_count=2, car_ids=["MX-1", "MX-2"], ecus=[
+        ECU(name="Engine", model_number="E1", versions=[
+            Version("1.0.0", ["ModelX"], "engine_1_0_0.hex", sha256="ab" * 32, priority=1,
+                    requires={"Gateway": "2.0.0"}, min_from_version="0.9.0",
+                    file_metadata={"size": 10, "sha256": "ab" * 32, "format": "srec", "chunk_count": 1, "etag": None})
+        ])
+    ])]
+    campaigns = [RolloutCampaign(campaign_id="c1", ecu_name="Engine", target_version="1.0.0", car_types=["ModelX"],
+                                 waves=[{"start": datetime(2026, 1, 2, 3, 4, 5), "percentage": 25.0},
+                                        {"start": datetime(2026, 1, 9, 3, 4, 5, 250000), "percentage": 100.0}],
+                                 max_active_downloads=3, priority=2)]
+    return car_types, campaigns
+
+
+def test_snapshot_round_trip(tmp_path):
+    snapshot = CatalogSnapshot(str(tmp_path))
+    assert snapshot.load() is None
+    car_types, campaigns = catalog()
+    assert snapshot.save(car_types, campaigns)
+
+    loaded = CatalogSnapshot(str(tmp_path)).load()
+    assert loaded == (car_types, campaigns)
+    assert isinstance(loaded[1][0].waves[0]["start"], datetime)
+    # The temporary file is renamed into place
+    assert [path.name for path in tmp_path.iterdir()] == [snapshot.path.rsplit("/", 1)[-1]]
+
+
+def test_unknown_format_and_corrupt_snapshots_are_ignored(tmp_path):
+    path = tmp_path / "catalog_snapshot.json"
+    snapshot = CatalogSnapshot(str(tmp_path), path=str(path))
+    path.write_text(json.dumps({"format": 999, "car_types": [], "campaigns": []}))
+    assert snapshot.load() is None
+    path.write_text("{not json")
+    assert snapshot.load() is None
+    assert snapshot.save(*catalog())
+    assert snapshot.load() == catalog()
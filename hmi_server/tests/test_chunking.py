@@ -0,0 +1,87 @@
+import hashlib
+import importlib.util
+import os
+import random
+
+import pytest
+
+import firmware_cache
+from chunking import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, build_manifest, chunk_boundaries, chunk_hash
+from firmware_cache import FirmwareCache
+
+
+def image(size: int, seed: int = 7) -> bytes:
+    return random.Random(seed).randbytes(size)
+
+
+def test_chunks_cover_the_image_within_size_limits():
+    data = image(256 * 1024)
+    boundaries = chunk_boundaries(data)
+    assert boundaries[0][0] == 0
+    assert sum(length for _, length in boundaries) == len(data)
+    for (offset, length), (next_offset, _) in zip(boundaries, boundaries[1:]):
+        assert offset + length == next_offset
+        assert MIN_CHUNK_SIZE <= length <= MAX_CHUNK_SIZE
+    assert chunk_boundaries(b"") == []
+
+
+def test_boundaries_resync_after_an_insertion():
+    data = image(256 * 1024)
+    patched = data[:1000] + b"inserted bytes" + data[1000:]
+    before = {hash_ for hash_, _, _ in build_manifest(data)}
+    after = build_manifest(patched)
+    # Only the chunk around the edit changes; the rest are shared and need no transfer
+    assert sum(hash_ not in before for hash_, _, _ in after) <= 2
+    assert len(after) >= 10
+
+
+def test_manifest_is_deterministic():
+    data = image(64 * 1024)
+    manifest = build_manifest(data)
+    assert manifest == build_manifest(bytes(data))
+    hash_, offset, length = manifest[0]
+    assert hash_ == chunk_hash(data[offset:offset + length]) and len(hash_) == 32
+
+
+class PublishedImages:
+    def __init__(self, data: bytes, manifest=None):
+        self.data = data
+        self.manifests = {hashlib.sha256(data).hexdigest(): manifest} if manifest else {}
+
+    def read_file_bytes(self, path: str):
+        return self.data
+
+    def get_chunk_manifest(self, digest: str):
+        return self.manifests.get(digest)
+
+
+def test_published_manifest_is_served_without_rechunking(tmp_path, monkeypatch):
+    data = image(64 * 1024)
+    cache = FirmwareCache(PublishedImages(data, build_manifest(data)), str(tmp_path), max_workers=1)
+    monkeypatch.setattr(firmware_cache, "build_manifest", lambda data: pytest.fail("image was chunked again"))
+    try:
+        manifest, image_path, image_format = cache.get_manifest("engine.bin")
+        assert manifest == build_manifest(data) and image_format == "original"
+        # Kept on disk for the next download
+        assert cache.get_manifest("engine.bin")[0] == manifest
+    finally:
+        cache.shutdown()
+
+
+def test_manifest_not_covering_the_image_is_rebuilt(tmp_path):
+    data = image(64 * 1024)
+    cache = FirmwareCache(PublishedImages(data, [["00" * 16, 0, 10]]), str(tmp_path), max_workers=1)
+    try:
+        assert cache.get_manifest("engine.bin")[0] == build_manifest(data)
+    finally:
+        cache.shutdown()
+
+
+def test_website_publishes_the_same_manifest():
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "website_app", "backend_server", "services", "chunking.py")
+    spec = importlib.util.spec_from_file_location("website_chunking", path)
+    website_chunking = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(website_chunking)
+
+    data = image(256 * 1024)
+    assert website_chunking.build_manifest(data) == build_manifest(data)
@@ -0,0 +1,90 @@
+import os
+import random
+import threading
+import zlib
+
+import pytest
+
+from compression import available_codecs, compress, decompress, negotiate_codec
+from firmware_cache import FirmwareCache
+
+TEXT_IMAGE = b"".join(b"S1130000%04X00112233445566778899AABBCCDDEEFF\n" % line for line in range(2000))
+RANDOM_IMAGE = random.Random(3).randbytes(102400)
+
+
+class Images:
+    def __init__(self):
+        self.images = {"text.srec": TEXT_IMAGE, "random.hex": RANDOM_IMAGE}
+        self.reads = []
+
+    def read_file_bytes(self, path: str):
+        self.reads.append(path)
+        return self.images.get(path)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = FirmwareCache(Images(), str(tmp_path), max_workers=1)
+    yield cache
+    cache.shutdown()
+
+
+def test_negotiation_picks_the_preferred_shared_codec():
+    assert negotiate_codec(None) is None
+    assert negotiate_codec([]) is None
+    assert negotiate_codec(["brotli", 7]) is None
+    assert negotiate_codec(["ZLIB"]) == "zlib"
+    assert negotiate_codec(["zlib", "zstd", "lz4"]) == available_codecs()[0]
+
+
+@pytest.mark.parametrize("codec", available_codecs())
+def test_codecs_round_trip(codec):
+    assert decompress(codec, compress(codec, TEXT_IMAGE)) == TEXT_IMAGE
+    with pytest.raises(ValueError):
+        compress("brotli", TEXT_IMAGE)
+
+
+def test_compressed_variant_is_cached_once(cache):
+    path, size, image_format, codec = cache.get_variant("text.srec", "zlib")
+    assert (image_format, codec) == ("original", "zlib")
+    assert size == os.path.getsize(path) < len(TEXT_IMAGE)
+    with open(path, "rb") as f:
+        assert zlib.decompress(f.read()) == TEXT_IMAGE
+
+    assert cache.get_variant("text.srec", "zlib") == (path, size, image_format, codec)
+    assert cache.db_manager.reads == ["text.srec"]
+
+
+def test_variant_that_would_grow_falls_back_to_the_raw_image(cache):
+    assert len(compress("zlib", RANDOM_IMAGE)) >= len(RANDOM_IMAGE)
+    path, size, image_format, codec = cache.get_variant("random.hex", "zlib")
+    assert codec is None and size == len(RANDOM_IMAGE)
+    with open(path, "rb") as f:
+        assert f.read() == RANDOM_IMAGE
+    # Served raw on every later request too
+    assert cache.get_variant("random.hex", "zlib")[3] is None
+
+
+def test_missing_image_has_no_variant(cache):
+    assert cache.get_variant("missing.hex", "zlib") == (None, 0, "original", None)
+
+
+def test_shutdown_drops_queued_warmups(cache, monkeypatch):
+    started, release, precomputed = threading.Event(), threading.Event(), []
+
+    def precompute(file_path, codecs=None):
+        started.set()
+        release.wait(5)
+        precomputed.append(file_path)
+
+    monkeypatch.setattr(cache, "precompute", precompute)
+    cache.warm("text.srec")
+    cache.warm("random.hex")
+    assert started.wait(5)
+    queued = [future for future in cache.queued if not future.running()]
+
+    cache.shutdown()
+    release.set()
+    cache.executor.shutdown(wait=True)
+    assert len(queued) == 1 and queued[0].cancelled()
+    assert precomputed == ["text.srec"]
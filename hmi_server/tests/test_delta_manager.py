@@ -0,0 +1,109 @@
+import hashlib
+import json
+import time
+
+import pytest
+
+from models import ECU, Version
+from delta_manager import DeltaManager, apply_delta, compute_delta
+
+BASE_IMAGE = bytes(range(256)) * 64
+TARGET_IMAGE = BASE_IMAGE[:8000] + b"patched" + BASE_IMAGE[8000:]
+
+
+def digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class ImageStore:
+    def __init__(self, images):
+        self.images = images
+        self.reads = []
+        self.saved = []
+
+    def read_file_bytes(self, path: str):
+        self.reads.append(path)
+        return self.images.get(path)
+
+    def save_delta_metadata(self, job):
+        self.saved.append(job)
+
+
+def engine(model_number: str, target_sha256: str = None) -> ECU:
+    return ECU(name="Engine", model_number=model_number, versions=[
+        Version("1.0.0", ["ModelX"], f"{model_number}_1_0_0.hex", sha256=digest(BASE_IMAGE)),
+        Version("1.1.0", ["ModelX"], f"{model_number}_1_1_0.hex", sha256=target_sha256 or digest(TARGET_IMAGE))
+    ])
+
+
+@pytest.fixture
+def store():
+    return ImageStore({
+        "E1_1_0_0.hex": BASE_IMAGE, "E1_1_1_0.hex": TARGET_IMAGE,
+        "E2_1_0_0.hex": BASE_IMAGE, "E2_1_1_0.hex": TARGET_IMAGE
+    })
+
+
+@pytest.fixture
+def manager(store, tmp_path):
+    manager = DeltaManager(store, str(tmp_path), history_depth=1, max_workers=1)
+    yield manager
+    manager.shutdown()
+
+
+def wait_for_jobs(manager: DeltaManager, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        statuses = {job["status"] for job in manager.get_status()["jobs"]}
+        if statuses and not statuses & {"queued", "running"}:
+            return
+        time.sleep(0.05)
+    raise AssertionError("Delta jobs did not finish")
+
+
+def test_delta_round_trip():
+    delta = compute_delta(BASE_IMAGE, TARGET_IMAGE)
+    assert len(delta) < len(TARGET_IMAGE) // 4
+    assert apply_delta(BASE_IMAGE, delta) == TARGET_IMAGE
+
+
+def test_ecus_with_the_same_name_get_separate_deltas(manager):
+    manager.schedule_ecu(engine("E1"))
+    manager.schedule_ecu(engine("E2"))
+    wait_for_jobs(manager)
+
+    first = manager.get_delta("Engine", "E1", "1.0.0", "1.1.0")
+    second = manager.get_delta("Engine", "E2", "1.0.0", "1.1.0")
+    assert first["status"] == second["status"] == "completed"
+    assert first["delta_path"] != second["delta_path"]
+    with open(first["delta_path"], "rb") as f:
+        assert apply_delta(BASE_IMAGE, f.read()) == TARGET_IMAGE
+
+
+def test_stored_delta_is_reused_only_for_the_same_images(manager, store, tmp_path):
+    manager.schedule_ecu(engine("E1"))
+    wait_for_jobs(manager)
+    stored = manager.get_delta("Engine", "E1", "1.0.0", "1.1.0")
+
+    # A restart with the same published digests reuses the delta without reading the images
+    restarted = DeltaManager(store, str(tmp_path), history_depth=1, max_workers=1)
+    try:
+        store.reads.clear()
+        restarted.schedule_ecu(engine("E1"))
+        wait_for_jobs(restarted)
+        assert store.reads == []
+        assert restarted.get_delta("Engine", "E1", "1.0.0", "1.1.0")["sha256"] == stored["sha256"]
+    finally:
+        restarted.shutdown()
+
+    # 1.1.0 republished with other bytes: the delta on disk no longer applies
+    store.images["E1_1_1_0.hex"] = TARGET_IMAGE + b"hotfix"
+    republished = engine("E1", target_sha256=digest(TARGET_IMAGE + b"hotfix"))
+    assert manager.get_delta("Engine", "E1", "1.0.0", "1.1.0", None, republished.versions[1].sha256) is None
+
+    manager.schedule_ecu(republished)
+    wait_for_jobs(manager)
+    rebuilt = manager.get_delta("Engine", "E1", "1.0.0", "1.1.0", digest(BASE_IMAGE), republished.versions[1].sha256)
+    assert rebuilt and rebuilt["sha256"] != stored["sha256"]
+    with open(rebuilt["delta_path"] + ".json") as f:
+        assert json.load(f)["target_sha256"] == republished.versions[1].sha256
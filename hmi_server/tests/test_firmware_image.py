@@ -0,0 +1,69 @@
+import io
+
+import pytest
+
+from firmware_image import (FirmwareFormatError, NO_ENTRY_POINT, convert_to_binary, decode_binary_image,
+                            detect_format, parse_text_image)
+
+
+def srec(record_type: str, address: int, data: bytes = b"", address_size: int = 2) -> bytes:
+    body = bytes([address_size + len(data) + 1]) + address.to_bytes(address_size, "big") + data
+    return f"S{record_type}{(body + bytes([0xFF - sum(body) & 0xFF])).hex().upper()}\n".encode()
+
+
+def ihex(record_type: int, address: int, data: bytes = b"") -> bytes:
+    body = bytes([len(data)]) + address.to_bytes(2, "big") + bytes([record_type]) + data
+    return f":{(body + bytes([-sum(body) & 0xFF])).hex().upper()}\n".encode()
+
+
+def test_srec_records_merge_into_segments():
+    image = (srec("0", 0, b"HDR") + srec("1", 0x1000, b"\x01\x02\x03\x04") + srec("1", 0x1004, b"\x05\x06")
+             + srec("2", 0x20000, b"\xaa\xbb", address_size=3) + srec("9", 0x1000))
+    assert detect_format(image) == "srec"
+
+    segments, entry_point = parse_text_image(io.BytesIO(image), "srec", batch_lines=2)
+    assert segments == [(0x1000, b"\x01\x02\x03\x04\x05\x06"), (0x20000, b"\xaa\xbb")]
+    assert entry_point == 0x1000
+
+
+def test_srec_out_of_order_records_are_sorted():
+    image = srec("1", 0x2000, b"\x02") + srec("1", 0x1fff, b"\x01")
+    assert parse_text_image(io.BytesIO(image), "srec") == ([(0x1fff, b"\x01\x02")], NO_ENTRY_POINT)
+
+
+@pytest.mark.parametrize("image, message", [
+    (srec("1", 0x1000, b"\x01")[:-3] + b"00\n", "Checksum"),
+    (b"S1ZZ\n", "Malformed"),
+    (srec("1", 0x1000, b"\x01\x02") + srec("1", 0x1001, b"\x03"), "Overlapping"),
+])
+def test_malformed_srec_is_rejected(image, message):
+    with pytest.raises(FirmwareFormatError, match=message):
+        parse_text_image(io.BytesIO(image), "srec")
+
+
+def test_srec_byte_count_is_checked():
+    record = bytearray(srec("1", 0x1000, b"\x01\x02"))
+    record[2:4] = b"06"  # claims one byte more than the record holds
+    body = bytes.fromhex(record[2:-3].decode())
+    record[-3:-1] = f"{0xFF - sum(body) & 0xFF:02X}".encode()
+    with pytest.raises(FirmwareFormatError, match="byte count"):
+        parse_text_image(io.BytesIO(bytes(record)), "srec")
+
+
+def test_ihex_extended_addresses():
+    image = (ihex(0x04, 0, b"\x00\x01") + ihex(0x00, 0x0010, b"\xde\xad") + ihex(0x05, 0, b"\x00\x01\x00\x10")
+             + ihex(0x01, 0) + ihex(0x00, 0x0000, b"\xff"))
+    assert detect_format(image) == "ihex"
+    # Nothing after the end-of-file record is read
+    assert parse_text_image(io.BytesIO(image), "ihex") == ([(0x10010, b"\xde\xad")], 0x10010)
+
+
+def test_binary_conversion_round_trip():
+    image = srec("1", 0x1000, b"\x01\x02") + srec("1", 0x3000, b"\x03") + srec("9", 0x1000)
+    binary = convert_to_binary(io.BytesIO(image))
+    assert decode_binary_image(binary) == ([(0x1000, b"\x01\x02"), (0x3000, b"\x03")], 0x1000)
+
+    corrupted = binary[:-1] + bytes([binary[-1] ^ 0xFF])
+    with pytest.raises(FirmwareFormatError, match="CRC"):
+        decode_binary_image(corrupted)
+    assert convert_to_binary(io.BytesIO(b"\x7fELF binary")) is None
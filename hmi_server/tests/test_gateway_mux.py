@@ -0,0 +1,194 @@
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from protocol import Protocol
+from gateway_mux import GatewayConnection, MuxSessionChannel
+
+
+def read_frame(sock: socket.socket) -> dict:
+    def read_exactly(count: int) -> bytes:
+        data = b""
+        while len(data) < count:
+            chunk = sock.recv(count - len(data))
+            assert chunk, "connection closed"
+            data += chunk
+        return data
+
+    return Protocol.parse_message(read_exactly(int(read_exactly(10).decode())))
+
+
+def frame(session_id, msg_type: str, payload: dict) -> dict:
+    message = {"type": msg_type, "payload": payload}
+    if session_id is not None:
+        message["session_id"] = session_id
+    return message
+
+
+class Gateway:
+    """Drives a GatewayConnection over a socket pair; the test plays the depot gateway"""
+
+    def __init__(self, handle_control=None, **kwargs):
+        self.server_side, self.gateway_side = socket.socketpair()
+        self.gateway_side.settimeout(5)
+        self.channels = {}
+        self.inbound = []  # frames the test hands to the connection's reader
+
+        def open_session(channel: MuxSessionChannel) -> bool:
+            channel.settimeout(5)
+            self.channels[channel.session_id] = channel
+            return True
+
+        self.connection = GatewayConnection(self.server_side, open_session,
+                                            handle_control or (lambda message, gateway: None), **kwargs)
+        self.frames = threading.Semaphore(0)
+        self.reader = threading.Thread(target=self.connection.run, args=(self._next_frame,), daemon=True)
+        self.reader.start()
+
+    def _next_frame(self, _sock):
+        self.frames.acquire()
+        return self.inbound.pop(0)
+
+    def push(self, message):
+        self.inbound.append(message)
+        self.frames.release()
+
+    def close(self):
+        self.push(None)
+        self.reader.join(timeout=5)
+        self.server_side.close()
+        self.gateway_side.close()
+
+
+def wait_until(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met"
+        time.sleep(0.01)
+
+
+def test_tag_adds_session_id_without_touching_payload():
+    data = Protocol.create_message(Protocol.FILE_CHUNK, {"ecu_name": "Engine", "data": "00ff"})
+    tagged = GatewayConnection.tag("car-7", data)
+    assert int(tagged[:10]) == len(tagged) - 10
+    message = json.loads(tagged[10:])
+    assert message == {"session_id": "car-7", "type": Protocol.FILE_CHUNK,
+                       "payload": {"ecu_name": "Engine", "data": "00ff"}}
+
+
+def test_sessions_are_routed_and_tagged():
+    gateway = Gateway(session_window=8)
+    try:
+        gateway.push(frame("a", Protocol.HANDSHAKE, {"car_id": "A"}))
+        gateway.push(frame("b", Protocol.HANDSHAKE, {"car_id": "B"}))
+        wait_until(lambda: len(gateway.channels) == 2)
+        assert gateway.channels["a"].receive_message()["payload"] == {"car_id": "A"}
+        assert gateway.channels["b"].receive_message()["payload"] == {"car_id": "B"}
+
+        gateway.channels["b"].send(Protocol.create_message(Protocol.UPDATE_RESPONSE, {"ok": True}))
+        reply = read_frame(gateway.gateway_side)
+        assert reply["session_id"] == "b" and reply["payload"] == {"ok": True}
+
+        gateway.push(frame("a", Protocol.SESSION_CLOSE, {}))
+        wait_until(lambda: gateway.connection.get_status()["sessions"] == 1)
+        assert gateway.channels["a"].receive_message() is None
+    finally:
+        gateway.close()
+
+
+def test_send_waits_for_window_update():
+    gateway = Gateway(session_window=2)
+    try:
+        gateway.push(frame("a", Protocol.HANDSHAKE, {}))
+        wait_until(lambda: "a" in gateway.channels)
+        channel = gateway.channels["a"]
+        channel.settimeout(0.2)
+
+        for _ in range(2):
+            channel.send(Protocol.create_message(Protocol.FILE_CHUNK, {}))
+        with pytest.raises(socket.timeout):
+            channel.send(Protocol.create_message(Protocol.FILE_CHUNK, {}))
+
+        gateway.push(frame("a", Protocol.WINDOW_UPDATE, {"frames": 1}))
+        channel.settimeout(5)
+        channel.send(Protocol.create_message(Protocol.FILE_CHUNK, {}))
+        assert [read_frame(gateway.gateway_side)["type"] for _ in range(3)] == [Protocol.FILE_CHUNK] * 3
+    finally:
+        gateway.close()
+
+
+def test_reading_frames_returns_credits_to_the_gateway():
+    gateway = Gateway(session_window=4)
+    try:
+        for number in range(4):
+            gateway.push(frame("a", "CHUNK_ACK", {"n": number}))
+        wait_until(lambda: "a" in gateway.channels)
+        channel = gateway.channels["a"]
+        assert [channel.receive_message()["payload"]["n"] for _ in range(4)] == [0, 1, 2, 3]
+
+        updates = [read_frame(gateway.gateway_side) for _ in range(2)]
+        assert [(update["type"], update["payload"]["frames"]) for update in updates] == \
+               [(Protocol.WINDOW_UPDATE, 2), (Protocol.WINDOW_UPDATE, 2)]
+    finally:
+        gateway.close()
+
+
+def test_overrun_pushes_back_instead_of_dropping_the_session():
+    gateway = Gateway(session_window=2, backpressure_seconds=5)
+    try:
+        for number in range(3):
+            gateway.push(frame("a", "CHUNK_ACK", {"n": number}))
+        wait_until(lambda: gateway.connection.get_status()["window_waits"] == 1)
+        channel = gateway.channels["a"]
+
+        # The third frame is held until the handler reads, then delivered in order
+        assert [channel.receive_message()["payload"]["n"] for _ in range(3)] == [0, 1, 2]
+        status = gateway.connection.get_status()
+        assert status["sessions"] == 1 and status["window_overruns"] == 0
+    finally:
+        gateway.close()
+
+
+def test_batch_checks_do_not_block_session_frames():
+    release = threading.Event()
+
+    def slow_batch(message, connection):
+        release.wait(5)
+        connection.send(Protocol.create_message(Protocol.BATCH_UPDATE_RESPONSE, {"results": []}))
+
+    gateway = Gateway(handle_control=slow_batch, session_window=8)
+    try:
+        gateway.push(frame(None, Protocol.BATCH_UPDATE_CHECK, {"cars": []}))
+        gateway.push(frame("a", Protocol.HANDSHAKE, {"car_id": "A"}))
+        wait_until(lambda: "a" in gateway.channels)
+        assert gateway.channels["a"].receive_message()["payload"] == {"car_id": "A"}
+        assert gateway.connection.get_status()["pending_batches"] == 1
+
+        release.set()
+        assert read_frame(gateway.gateway_side)["type"] == Protocol.BATCH_UPDATE_RESPONSE
+    finally:
+        release.set()
+        gateway.close()
+
+
+def test_queued_batch_checks_are_skipped_after_disconnect():
+    release, handled = threading.Event(), []
+
+    def slow_batch(message, connection):
+        handled.append(message["payload"]["n"])
+        release.wait(5)
+
+    gateway = Gateway(handle_control=slow_batch, session_window=8)
+    try:
+        for number in range(3):
+            gateway.push(frame(None, Protocol.BATCH_UPDATE_CHECK, {"n": number}))
+        wait_until(lambda: gateway.connection.get_status()["pending_batches"] == 3 and handled)
+    finally:
+        gateway.close()
+        release.set()
+    gateway.connection.control.shutdown(wait=True)
+    assert handled == [0]
+    assert gateway.connection.get_status()["pending_batches"] == 0
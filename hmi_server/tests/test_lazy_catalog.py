@@ -0,0 +1,85 @@
+import time
+
+from models import CarType, ECU, Version
+from lazy_catalog import LazyCatalog
+
+
+def model_x() -> CarType:
+    return CarType(name="ModelX", model_number="MX", manufactured_count=1, car_ids=["MX-1"], ecus=[
+        ECU(name="Engine", model_number="E1", versions=[Version("1.0.0", ["ModelX"], "engine_1_0_0.hex"),
+                                                        Version("1.1.0", ["ModelX"], "engine_1_1_0.hex")])
+    ])
+
+
+class CountingStore:
+    def __init__(self):
+        self.lookups = []
+
+    def get_car_type_by_name(self, name: str):
+        self.lookups.append(name)
+        return model_x() if name.lower() == "modelx" else None
+
+
+def wait_for_prefetches(catalog: LazyCatalog):
+    # With one worker, prefetches run in order, so a no-op queued last finishes after them
+    catalog.executor.submit(lambda: None).result(timeout=5)
+
+
+def test_unknown_car_types_are_looked_up_once_per_ttl():
+    store = CountingStore()
+    catalog = LazyCatalog(store.get_car_type_by_name, size_of=lambda version: 0, miss_seconds=3600, max_workers=1)
+    try:
+        for _ in range(5):
+            assert catalog.car_type("Bogus") is None
+            assert not catalog.has_car("bogus", "MX-1")
+        assert store.lookups == ["Bogus"]
+        assert catalog.get_status()["negative_hits"] >= 9
+
+        catalog.forget_missing()
+        assert catalog.car_type("Bogus") is None
+        assert len(store.lookups) == 2
+    finally:
+        catalog.shutdown()
+
+
+def test_missing_names_are_looked_up_again_after_ttl():
+    store = CountingStore()
+    catalog = LazyCatalog(store.get_car_type_by_name, size_of=lambda version: 0, miss_seconds=0.01, max_workers=1)
+    try:
+        catalog.car_type("Bogus")
+        time.sleep(0.02)
+        catalog.car_type("Bogus")
+        assert store.lookups == ["Bogus", "Bogus"]
+    finally:
+        catalog.shutdown()
+
+
+def test_only_resolved_handshakes_are_prefetched_again():
+    store = CountingStore()
+    catalog = LazyCatalog(store.get_car_type_by_name, size_of=lambda version: 0, miss_seconds=3600,
+                          max_car_types=1, max_workers=1)
+    try:
+        catalog.note_handshake("Bogus")
+        catalog.note_handshake("ModelX")
+        wait_for_prefetches(catalog)
+        assert list(catalog.recent) == ["modelx"]
+
+        # A known-missing name does not even queue a prefetch
+        prefetches = catalog.prefetches
+        catalog.note_handshake("BOGUS")
+        assert catalog.prefetches == prefetches
+        assert store.lookups.count("Bogus") + store.lookups.count("BOGUS") == 1
+    finally:
+        catalog.shutdown()
+
+
+def test_planning_goes_through_the_loaded_car_type():
+    store = CountingStore()
+    catalog = LazyCatalog(store.get_car_type_by_name, size_of=lambda version: 0, max_workers=1)
+    try:
+        assert catalog.has_car("modelx", "mx-1")
+        plan = catalog.plan("MODELX", {"Engine": "1.0.0"}, "MX-1")
+        assert plan.updates_needed() == {"Engine": "1.1.0"}
+        assert store.lookups == ["modelx"]
+    finally:
+        catalog.shutdown()
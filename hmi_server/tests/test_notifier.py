@@ -0,0 +1,69 @@
+import threading
+from datetime import datetime
+
+from enums import RequestStatus, ServiceType
+from models import Request
+from notifier import UpdateNotifier
+from protocol import Protocol
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data: bytes) -> int:
+        self.sent.append(Protocol.parse_message(data[10:]))
+        return len(data)
+
+
+def subscribe(notifier: UpdateNotifier, car_id: str) -> RecordingSocket:
+    client_socket = RecordingSocket()
+    request = Request(timestamp=datetime.now(), car_type="ModelX", car_id=car_id,
+                      ip_address="127.0.0.1", port=0, service_type=ServiceType.CHECK_FOR_UPDATE,
+                      metadata={}, status=RequestStatus.AUTHENTICATED, push_updates=True)
+    notifier.subscribe(request, client_socket, threading.Lock(), {"Engine": "1.0.0"}, offered={})
+    return client_socket
+
+
+def test_subscribers_are_replanned_only_when_their_offer_key_changes():
+    notifier = UpdateNotifier()
+    sockets = [subscribe(notifier, car_id) for car_id in ("MX-1", "MX-2")]
+    state = {"generation": 1, "offer": {}}
+    resolved = []
+
+    def offer_key(subscription):
+        return ("modelx", state["generation"], tuple(sorted(subscription.current_versions.items())))
+
+    def resolve(key, subscription):
+        resolved.append(subscription.request.car_id)
+        return dict(state["offer"]), {"steps": []}
+
+    assert notifier.notify(offer_key, resolve) == 0
+    assert notifier.notify(offer_key, resolve) == 0
+    assert resolved == ["MX-1", "MX-2"]
+
+    # A new catalog generation re-checks everyone and pushes the new offer once
+    state["generation"], state["offer"] = 2, {"Engine": "1.1.0"}
+    assert notifier.notify(offer_key, resolve) == 2
+    assert notifier.notify(offer_key, resolve) == 0
+    assert len(resolved) == 4
+    assert [client_socket.sent[-1]["payload"]["updates_needed"] for client_socket in sockets] == [{"Engine": "1.1.0"}] * 2
+
+    # Reported versions move only that car's key
+    notifier.update_versions("MX-1", {"Engine": "1.1.0"})
+    state["offer"] = {}
+    notifier.notify(offer_key, resolve)
+    assert resolved[4:] == ["MX-1"]
+
+
+def test_busy_subscriber_is_retried_on_the_next_round():
+    notifier = UpdateNotifier()
+    client_socket = subscribe(notifier, "MX-1")
+    send_lock = notifier.subscriptions["MX-1"].send_lock
+    offer_key = lambda subscription: ("modelx", 1)
+    resolve = lambda key, subscription: ({"Engine": "1.1.0"}, {"steps": []})
+
+    with send_lock:
+        assert notifier.notify(offer_key, resolve) == 0
+    assert notifier.notify(offer_key, resolve) == 1
+    assert client_socket.sent[0]["payload"]["pushed"] is True
@@ -0,0 +1,119 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from enums import DownloadStatus
+from models import DownloadRequest
+from protocol import Protocol
+
+
+@pytest.fixture
+def hmi_server(tmp_path, monkeypatch):
+    monkeypatch.setenv("HMI_CATALOG_STORE", "memory")
+    monkeypatch.setenv("HMI_PUBLISH_EVENTS", "memory")
+    monkeypatch.setenv("HMI_CATALOG_MODE", "eager")
+    import server
+    hmi_server = server.ECUUpdateServer("127.0.0.1", 0, str(tmp_path))
+    yield hmi_server
+    hmi_server.shutdown()
+
+
+class Car:
+    """Plays the car side of a multiplexed download: records frames and acknowledges chunks"""
+
+    def __init__(self, drop_after: int = None):
+        self.messages = []
+        self.unacked = []
+        self.drop_after = drop_after  # Disconnect after this many acknowledgments
+
+    def send(self, data: bytes) -> int:
+        message = Protocol.parse_message(data[10:])
+        self.messages.append(message)
+        if message["type"] == Protocol.FILE_CHUNK:
+            self.unacked.append(message["payload"])
+        return len(data)
+
+    def receive_message(self, _sock):
+        if self.drop_after is not None:
+            if not self.drop_after:
+                return None
+            self.drop_after -= 1
+        chunk = self.unacked.pop(0)
+        return {"type": "CHUNK_ACK", "payload": {"ecu_name": chunk["ecu_name"], "offset": chunk["offset"]}}
+
+    def received(self, ecu_name: str) -> bytes:
+        chunks = sorted((message["payload"]["offset"], message["payload"]["data"]) for message in self.messages
+                        if message["type"] == Protocol.FILE_CHUNK and message["payload"]["ecu_name"] == ecu_name)
+        return bytes.fromhex("".join(data for _, data in chunks))
+
+
+def download(hmi_server, images: dict, transferred: dict = None):
+    files_info = {}
+    for ecu_name, data in images.items():
+        path = f"mem://{ecu_name}.bin"
+        hmi_server.db_manager.blobs.memory.put(path, data)
+        files_info[ecu_name] = {"path": path, "size": len(data), "missing_chunks": None,
+                                "transferred": (transferred or {}).get(ecu_name, 0)}
+    request = DownloadRequest(timestamp=datetime.now(), car_type="ModelX", car_id="MX-1", ip_address="127.0.0.1",
+                              port=0, required_versions={}, old_versions={}, status=DownloadStatus.PREPARING_FILES,
+                              transfer_id="MX-1/test")
+    return files_info, request
+
+
+def test_streams_are_interleaved_and_completed_one_by_one(hmi_server, monkeypatch):
+    hmi_server.chunk_size = 4
+    images = {"Engine": bytes(range(32)), "Brakes": bytes(range(100, 108))}
+    files_info, request = download(hmi_server, images)
+    car = Car()
+    monkeypatch.setattr(hmi_server, "receive_message", car.receive_message)
+
+    assert hmi_server.transfer_multiplexed(car, files_info, request, window=2) == 2
+
+    frames = [(message["type"], message["payload"]["ecu_name"]) for message in car.messages]
+    chunk_streams = [ecu_name for kind, ecu_name in frames if kind == Protocol.FILE_CHUNK]
+    # Round-robin while both streams have data, then the rest of the longer one
+    assert chunk_streams == ["Engine", "Brakes"] * 2 + ["Engine"] * 6
+    assert all(message["payload"]["stream_id"] == message["payload"]["ecu_name"]
+               for message in car.messages if message["type"] == Protocol.FILE_CHUNK)
+    # Brakes completes as soon as its last chunk is acknowledged, before Engine has finished
+    brakes_done = frames.index((Protocol.FILE_COMPLETE, "Brakes"))
+    assert brakes_done < frames.index((Protocol.FILE_COMPLETE, "Engine"))
+    assert ("FILE_CHUNK", "Engine") in frames[brakes_done:]
+
+    assert {ecu_name: car.received(ecu_name) for ecu_name in images} == images
+    assert request.transferred_size == 40
+
+
+def test_each_stream_resumes_from_its_acknowledged_offset(hmi_server, monkeypatch):
+    hmi_server.chunk_size = 4
+    images = {"Engine": bytes(range(16)), "Brakes": bytes(range(100, 108))}
+
+    # The connection drops after three acknowledgments
+    files_info, request = download(hmi_server, images)
+    car = Car(drop_after=3)
+    monkeypatch.setattr(hmi_server, "receive_message", car.receive_message)
+    with pytest.raises(Exception):
+        hmi_server.transfer_multiplexed(car, files_info, request, window=2)
+    assert request.transferred_size == 12
+
+    # Engine had offsets 0 and 4 acknowledged, Brakes offset 0; each stream resumes on its own
+    files_info, request = download(hmi_server, images, transferred={"Engine": 8, "Brakes": 4})
+    car = Car()
+    monkeypatch.setattr(hmi_server, "receive_message", car.receive_message)
+    assert hmi_server.transfer_multiplexed(car, files_info, request, window=4) == 2
+    assert sorted((message["payload"]["ecu_name"], message["payload"]["offset"]) for message in car.messages
+                  if message["type"] == Protocol.FILE_CHUNK) == [("Brakes", 4), ("Engine", 8), ("Engine", 12)]
+    assert request.transferred_size == 12
+
+
+def test_acknowledgment_of_an_unknown_chunk_is_ignored(hmi_server, monkeypatch):
+    files_info, request = download(hmi_server, {"Engine": b"\x01\x02"})
+    car = Car()
+    acks = iter([{"type": "CHUNK_ACK", "payload": {"ecu_name": "Engine", "offset": 99}},
+                 {"type": "CHUNK_ACK", "payload": {"ecu_name": "Engine", "offset": 0}}])
+    monkeypatch.setattr(hmi_server, "receive_message", lambda _sock: next(acks))
+    assert hmi_server.transfer_multiplexed(car, files_info, request, window=1) == 1
+    assert car.messages[-1]["type"] == Protocol.FILE_COMPLETE
@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("bson")
+pytest.importorskip("dotenv")
+
+from models import CarType, ECU, Version
+from catalog_snapshot import CatalogSnapshot
+
+
+@pytest.fixture
+def unreachable_mongo(monkeypatch):
+    monkeypatch.setenv("MONGO_URI", "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=200&connectTimeoutMS=200")
+    monkeypatch.setenv("HMI_CATALOG_STORE", "mongo")
+    monkeypatch.setenv("HMI_CATALOG_MODE", "eager")
+    monkeypatch.setenv("HMI_PUBLISH_EVENTS", "store")
+    monkeypatch.delenv("HEX_STORAGE_ACCOUNT_NAME", raising=False)
+    yield
+    from database_manager import DatabaseManager
+    DatabaseManager.close_shared()
+
+
+def test_server_starts_from_snapshot_without_database(tmp_path, unreachable_mongo):
+    car_type = CarType(name="ModelX", model_number="MX", manufactured_count=1, car_ids=["MX-1"], ecus=[
+        ECU(name="Engine", model_number="E1", versions=[Version("1.0.0", ["ModelX"], str(tmp_path / "engine.hex"))])
+    ])
+    assert CatalogSnapshot(str(tmp_path)).save([car_type], [])
+
+    import server
+    # Constructing the server must not wait for Mongo
+    hmi_server = server.ECUUpdateServer("127.0.0.1", 0, str(tmp_path))
+    try:
+        assert hmi_server.load_catalog_snapshot()
+        assert hmi_server.catalog_source == "snapshot"
+        assert hmi_server.catalog.has_car("modelx", "mx-1")
+
+        assert not hmi_server.db_manager.warm_up()
+        assert not hmi_server.db_manager.indexes_ready
+        # The reconcile keeps serving the snapshot while the database is down
+        assert not hmi_server.refresh_catalog()
+        assert hmi_server.catalog_source == "snapshot"
+        assert hmi_server.catalog.has_car("ModelX", "MX-1")
+    finally:
+        hmi_server.shutdown()
+
+
+def test_memory_publish_events_shares_the_memory_store_bus(tmp_path, monkeypatch, unreachable_mongo):
+    import server
+    monkeypatch.setenv("HMI_PUBLISH_EVENTS", "memory")
+    # No other store publishes to the in-memory bus, so a server that would never see an event refuses to start
+    with pytest.raises(ValueError):
+        server.ECUUpdateServer("127.0.0.1", 0, str(tmp_path))
+
+    monkeypatch.setenv("HMI_CATALOG_STORE", "memory")
+    hmi_server = server.ECUUpdateServer("127.0.0.1", 0, str(tmp_path))
+    try:
+        assert hmi_server.publish_events.source is hmi_server.db_manager.publish_event_source()
+    finally:
+        hmi_server.shutdown()
@@ -0,0 +1,128 @@
+import json
+import os
+from datetime import datetime
+
+import pytest
+
+from enums import UpdatePriority
+from memory_store import MemoryCatalogStore
+from models import FlashingFeedback, RolloutCampaign
+from storage_backends import BlobStore, open_catalog_store
+
+
+class FakeAzure:
+    def __init__(self):
+        self.reads = []
+
+    def read(self, file_path, offset, length):
+        self.reads.append((file_path, offset, length))
+        return b"azure"[offset:offset + length]
+
+    def size(self, file_path):
+        return 5
+
+    def read_all(self, file_path):
+        return b"azure"
+
+    def get_status(self):
+        return {"fake": True}
+
+    def close(self):
+        self.closed = True
+
+
+def test_scheme_picks_the_backend():
+    assert BlobStore.scheme("https://account.blob.core.windows.net/firmware/sha256/ab/abcd") == "azure"
+    assert BlobStore.scheme("mem://engine.hex") == "mem"
+    assert BlobStore.scheme("/data/engine.hex") == "file"
+    assert BlobStore.scheme("file:///data/engine.hex") == "file"
+    # Only Azure blob hosts go to Azure
+    assert BlobStore.scheme("https://example.com/engine.hex") == "file"
+
+
+def test_reads_are_dispatched_and_azure_is_created_on_first_use(tmp_path):
+    created = []
+
+    def azure_factory():
+        created.append(FakeAzure())
+        return created[-1]
+
+    blobs = BlobStore(azure_factory=azure_factory)
+    local = tmp_path / "engine.hex"
+    local.write_bytes(b"local bytes")
+    blobs.memory.put("mem://engine.hex", b"memory bytes")
+
+    assert blobs.read(str(local), 6, 5) == b"bytes"
+    assert blobs.read_all(f"file://{local}") == b"local bytes"
+    assert (blobs.size("mem://engine.hex"), blobs.read("mem://engine.hex", 0, 6)) == (12, b"memory")
+    # Offline reads never build the Azure client
+    assert created == [] and blobs.get_status()["azure"] is None
+
+    url = "https://account.blob.core.windows.net/firmware/engine.hex"
+    assert blobs.read(url, 1, 3) == b"zur" and blobs.size(url) == 5
+    assert len(created) == 1 and created[0].reads == [(url, 1, 3)]
+
+    with pytest.raises(FileNotFoundError):
+        blobs.read_all("mem://missing.hex")
+    blobs.close()
+    assert created[0].closed and blobs.memory.get_status()["blobs"] == 0
+
+
+def seed(data_directory):
+    documents = {
+        "car_types.json": [{"name": "ModelX", "model_number": "MX", "ecu_ids": ["e1", "gone"],
+                            "manufactured_count": 1, "car_ids": ["MX-1"]}],
+        "ecus.json": [{"id": "e1", "name": "Engine", "model_number": "E1", "version_ids": ["v1", "missing"]}],
+        "versions.json": [{"id": "v1", "version_number": "1.0.0", "compatible_car_types": ["ModelX"],
+                           "hex_file_path": "mem://engine_1_0_0.hex", "priority": "critical"}],
+        "campaigns.json": [{"campaign_id": "c1", "ecu_name": "Engine", "target_version": "1.0.0"},
+                           {"campaign_id": "c2", "ecu_name": "Engine", "target_version": "0.9.0", "status": "done"}]
+    }
+    for file_name, docs in documents.items():
+        with open(os.path.join(data_directory, file_name), "w") as f:
+            json.dump(docs, f)
+
+
+def test_memory_store_is_seeded_from_the_data_directory(tmp_path):
+    seed(str(tmp_path))
+    store = MemoryCatalogStore(str(tmp_path))
+
+    car_type, = store.load_all_data()
+    assert (car_type.name, [ecu.name for ecu in car_type.ecus]) == ("ModelX", ["Engine"])
+    version, = car_type.ecus[0].versions
+    assert (version.version_number, version.priority) == ("1.0.0", UpdatePriority.CRITICAL.value)
+    assert [campaign.campaign_id for campaign in store.load_campaigns()] == ["c1"]
+    assert store.validate_car_exists("mx-1", "ModelX") and not store.validate_car_exists("MX-2", "ModelX")
+
+    # Loads hand out copies, like a fresh database read
+    car_type.ecus.clear()
+    assert store.get_car_type_by_name("modelx").ecus[0].name == "Engine"
+
+    store.save_campaign(RolloutCampaign(campaign_id="c1", ecu_name="Engine", target_version="1.0.0", percentage=5))
+    assert [campaign.percentage for campaign in store.load_campaigns()] == [5]
+
+
+def test_memory_store_records_feedback(tmp_path):
+    seed(str(tmp_path))
+    store = MemoryCatalogStore(str(tmp_path))
+    feedback = FlashingFeedback(session_id="s1", car_id="MX-1", car_type="ModelX",
+                                flashing_timestamp=datetime(2026, 1, 1), overall_status="partial_failure",
+                                total_ecus=2, successful_ecus=["Engine"], rolled_back_ecus=["Brakes"],
+                                final_ecu_versions={"Engine": "1.0.0"}, android_app_version="1",
+                                beaglebone_version="1", request_id="r1")
+    assert store.save_flashing_feedback(feedback)
+
+    history = store.get_car_flashing_history("MX-1")
+    assert (history["total_flashing_sessions"], history["partial_success_sessions"]) == (1, 1)
+    rates = {(metrics["ecu_name"], metrics["version"]): metrics["success_rate"]
+             for metrics in store.get_ecu_success_rates("ModelX")}
+    assert rates == {("Engine", "1.0.0"): 100.0, ("Brakes", "unknown"): 0.0}
+
+    feedback.car_id = "MX-9"
+    assert not store.save_flashing_feedback(feedback)
+
+
+def test_catalog_store_is_chosen_by_environment(tmp_path, monkeypatch):
+    monkeypatch.setenv("HMI_CATALOG_STORE", "memory")
+    store = open_catalog_store(str(tmp_path))
+    assert isinstance(store, MemoryCatalogStore) and store.load_all_data() == []
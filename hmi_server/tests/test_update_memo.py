@@ -0,0 +1,60 @@
+from models import RolloutCampaign
+from campaign_manager import CampaignManager
+from update_memo import UpdateCheckMemo
+
+VERSIONS = {"Engine": "1.0.0", "Brakes": "2.0.0"}
+
+
+def test_reports_differing_only_in_order_and_case_share_an_entry():
+    memo = UpdateCheckMemo(max_entries=8)
+    memo.put(memo.key("ModelX", 1, 1, VERSIONS), {"Engine": "1.1.0"}, {"steps": []})
+    cached = memo.get(memo.key("modelx", 1, 1, {"brakes": "2.0.0", "ENGINE": "1.0.0"}))
+    assert cached == ({"Engine": "1.1.0"}, {"steps": []}, None)
+    assert memo.get(memo.key("ModelX", 1, 1, {"Engine": "1.0.1", "Brakes": "2.0.0"})) is None
+    assert (memo.hits, memo.misses) == (1, 1)
+
+
+def test_new_catalog_or_campaign_generation_misses():
+    memo = UpdateCheckMemo(max_entries=8)
+    memo.put(memo.key("ModelX", 1, 1, VERSIONS), {}, {"steps": []})
+    assert memo.get(memo.key("ModelX", 2, 1, VERSIONS)) is None
+    assert memo.get(memo.key("ModelX", 1, 2, VERSIONS)) is None
+
+    campaigns = CampaignManager()
+    generation = campaigns.generation
+    campaigns.load([RolloutCampaign(campaign_id="c1", ecu_name="Engine", target_version="2.0.0")])
+    assert campaigns.generation == generation + 1
+
+
+def test_offer_bits_move_the_key_when_a_campaign_fills_up():
+    memo = UpdateCheckMemo(max_entries=8)
+    campaigns = CampaignManager([RolloutCampaign(campaign_id="c1", ecu_name="Engine", target_version="2.0.0",
+                                                 max_active_downloads=1)])
+
+    def key():
+        return memo.key("ModelX", 1, campaigns.generation, VERSIONS, campaigns.offer_bits("ModelX", "MX-2"))
+
+    offered = key()
+    memo.put(offered, {"Engine": "2.0.0"}, {"steps": []})
+
+    # Another car takes the only download slot: MX-2 must be re-planned without 2.0.0
+    assert campaigns.start_download("MX-1/a", "MX-1", {"Engine": "2.0.0"})
+    assert key() != offered and memo.get(key()) is None
+
+    # Once the slot frees up the earlier offer is valid again
+    campaigns.finish_download("MX-1/a")
+    assert key() == offered and memo.get(key())[0] == {"Engine": "2.0.0"}
+
+
+def test_least_recently_used_entries_are_evicted():
+    memo = UpdateCheckMemo(max_entries=2)
+    keys = [memo.key("ModelX", 1, 1, {"Engine": version}) for version in ("1.0.0", "1.1.0", "1.2.0")]
+    memo.put(keys[0], {}, {})
+    memo.put(keys[1], {}, {})
+    memo.get(keys[0])
+    memo.put(keys[2], {}, {})
+    assert memo.get(keys[1]) is None
+    assert memo.get(keys[0]) is not None and memo.get(keys[2]) is not None
+
+    memo.clear()
+    assert memo.get_status()["entries"] == 0
@@ -0,0 +1,76 @@
+from models import CarType, ECU, RolloutCampaign, Version
+from campaign_manager import CampaignManager
+from update_planner import UpdatePlanner
+
+
+def version(number: str, **kwargs) -> Version:
+    return Version(number, ["ModelX"], f"{number}.hex", **kwargs)
+
+
+def planner_for(*ecus: ECU) -> UpdatePlanner:
+    return UpdatePlanner([CarType(name="ModelX", model_number="MX", ecus=list(ecus),
+                                  manufactured_count=2, car_ids=["MX-1", "MX-2"])])
+
+
+def test_versions_are_ordered_semantically():
+    assert Version.sort_key("1.10.0") > Version.sort_key("1.9.2")
+    assert Version.sort_key("2.0.0") > Version.sort_key("2.0.0-rc1")
+    assert Version.sort_key("2.0.0-rc.10") > Version.sort_key("2.0.0-rc.9")
+    assert Version.sort_key("v1.2.0") == Version.sort_key("1.2.0")
+    assert Version.sort_key("") < Version.sort_key("0.0.1")
+
+    planner = planner_for(ECU("Engine", "E1", [version("1.9.2"), version("1.10.0"), version("1.2.0")]))
+    assert planner.plan("modelx", {"engine": "1.9.2"}).updates_needed() == {"Engine": "1.10.0"}
+    assert planner.plan("ModelX", {"Engine": "1.10.0"}).updates_needed() == {}
+    assert planner.plan("Unknown", {"Engine": "1.0.0"}) is None
+
+
+def test_incompatible_versions_are_skipped():
+    planner = planner_for(ECU("Engine", "E1", [version("1.0.0"), Version("2.0.0", ["ModelY"], "2.0.0.hex")]))
+    assert planner.plan("ModelX", {"Engine": "0.9.0"}).updates_needed() == {"Engine": "1.0.0"}
+
+
+def test_min_from_version_splits_the_install_into_rounds():
+    planner = planner_for(ECU("Engine", "E1", [version("1.0.0"), version("1.5.0"),
+                                                version("2.0.0", min_from_version="1.5.0")]))
+    plan = planner.plan("ModelX", {"Engine": "1.0.0"})
+    assert [(step.from_version, step.to_version, step.round) for step in plan.steps] == \
+           [("1.0.0", "1.5.0", 0), ("1.5.0", "2.0.0", 1)]
+    assert plan.updates_needed() == {"Engine": "1.5.0"}
+
+
+def test_dependencies_are_installed_first():
+    planner = planner_for(
+        ECU("Engine", "E1", [version("1.0.0"), version("2.0.0", requires={"Gateway": "3.0.0"})]),
+        ECU("Gateway", "G1", [version("2.0.0"), version("3.0.0")])
+    )
+    plan = planner.plan("ModelX", {"Engine": "1.0.0", "Gateway": "2.0.0"})
+    assert list(plan.updates_needed().items()) == [("Gateway", "3.0.0"), ("Engine", "2.0.0")]
+
+    # Already satisfied requirements add no step
+    plan = planner.plan("ModelX", {"Engine": "1.0.0", "Gateway": "3.0.0"})
+    assert plan.updates_needed() == {"Engine": "2.0.0"}
+
+
+def test_unreachable_dependency_withholds_the_version():
+    planner = planner_for(
+        ECU("Engine", "E1", [version("1.0.0"), version("1.1.0"), version("2.0.0", requires={"Gateway": "9.0.0"})]),
+        ECU("Gateway", "G1", [version("2.0.0")])
+    )
+    plan = planner.plan("ModelX", {"Engine": "1.0.0", "Gateway": "2.0.0"})
+    # 2.0.0 cannot be satisfied, so the car is moved to the best version that can
+    assert plan.updates_needed() == {"Engine": "1.1.0"}
+
+
+def test_campaign_withholds_versions_outside_the_current_wave():
+    campaign = RolloutCampaign(campaign_id="engine-2", ecu_name="Engine", target_version="2.0.0", percentage=50)
+    fleet = sorted(["MX-1", "MX-2", "MX-3", "MX-4", "MX-5", "MX-6"],
+                   key=lambda car_id: CampaignManager.cohort("engine-2", car_id))
+    in_wave, outside = fleet[0], fleet[-1]
+    assert CampaignManager.cohort("engine-2", in_wave) < 50 <= CampaignManager.cohort("engine-2", outside)
+
+    campaigns = CampaignManager([campaign])
+    planner = planner_for(ECU("Engine", "E1", [version("1.0.0"), version("1.1.0"), version("2.0.0")]))
+    assert planner.plan("ModelX", {"Engine": "1.0.0"}, in_wave, campaigns).updates_needed() == {"Engine": "2.0.0"}
+    assert planner.plan("ModelX", {"Engine": "1.0.0"}, outside, campaigns).updates_needed() == {"Engine": "1.1.0"}
+    assert planner.plan("ModelX", {"Engine": "1.0.0"}, outside).updates_needed() == {"Engine": "2.0.0"}
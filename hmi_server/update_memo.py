@@ -0,0 +1,67 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class UpdateCheckMemo:
+    """
+    Bounded LRU of update-check results.
+    Cars of one type usually report the same ECU versions, so the offer, its
+    install plan and its encoded UPDATE_RESPONSE are computed once per catalog
+    generation and fingerprint. Batch checks store no response; the first
+    single-car check encodes it.
+    """
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = max_entries or int(os.getenv("HMI_UPDATE_MEMO_SIZE", "4096"))
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[tuple, Tuple[Dict[str, str], Dict, Optional[bytes]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def fingerprint(current_versions: Dict[str, str]) -> str:
+        """Hash of the version map with ECU names lowercased and order removed"""
+        normalized = sorted((str(ecu_name).lower(), str(version)) for ecu_name, version in current_versions.items())
+        return hashlib.sha1(json.dumps(normalized).encode()).hexdigest()
+
+    def key(self, car_type: str, catalog_generation: int, campaign_generation: int,
+            current_versions: Dict[str, str], offer_bits: tuple = ()) -> tuple:
+        return (car_type.lower(), catalog_generation, campaign_generation,
+                self.fingerprint(current_versions), offer_bits)
+
+    def get(self, key: tuple) -> Optional[Tuple[Dict[str, str], Dict, Optional[bytes]]]:
+        """Cached (updates_needed, install plan, encoded response or None), or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, updates_needed: Dict[str, str], install_plan: Dict, response: bytes = None):
+        with self.lock:
+            self.entries[key] = (updates_needed, install_plan, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
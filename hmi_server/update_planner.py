@@ -0,0 +1,214 @@
+import heapq
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+from models import CarType, ECU, Version
+
+
+@dataclass
+class PlanStep:
+    ecu_name: str
+    from_version: Optional[str]
+    to_version: str
+    size: int = 0
+    round: int = 0  # Download round the step can be installed in; 0 is offered now
+
+    def to_dict(self) -> Dict:
+        return {"ecu_name": self.ecu_name, "from_version": self.from_version,
+                "to_version": self.to_version, "size": self.size, "round": self.round}
+
+
+@dataclass
+class UpdatePlan:
+    """Ordered install plan: dependencies come before the versions needing them"""
+    steps: List[PlanStep] = field(default_factory=list)
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(step.size for step in self.steps)
+
+    def updates_needed(self) -> Dict[str, str]:
+        """Versions to download now, keyed by ECU name in install order"""
+        return {step.ecu_name: step.to_version for step in self.steps if step.round == 0}
+
+    def to_dict(self) -> Dict:
+        return {"steps": [step.to_dict() for step in self.steps], "total_bytes": self.total_bytes}
+
+
+class _CompiledECU:
+    __slots__ = ("ecu", "versions", "keys")
+
+    def __init__(self, ecu: ECU, car_type: str):
+        self.ecu = ecu
+        self.versions = [version for version in ecu.sorted_versions() if version.is_compatible_with(car_type)]
+        self.keys = [Version.sort_key(version.version_number) for version in self.versions]
+
+
+class CompiledCarType:
+    """Per-ECU indexes of the compatible versions of one car type, sorted by semantic version"""
+
+    def __init__(self, car_type: CarType, size_of: Callable[[Version], int] = None):
+        self.car_type = car_type
+        self.size_of = size_of or (lambda version: 0)
+        self.ecus: Dict[str, _CompiledECU] = {ecu.name.lower(): _CompiledECU(ecu, car_type.name)
+                                              for ecu in car_type.ecus}
+        self.order = {name: index for index, name in enumerate(self.ecus)}
+
+    def _offered(self, compiled: _CompiledECU, car_id: str, campaigns, excluded: set) -> List[int]:
+        """Indexes of the versions this car may receive"""
+        return [index for index, version in enumerate(compiled.versions)
+                if version.version_number not in excluded and (
+                    campaigns is None or
+                    campaigns.is_offered(self.car_type.name, car_id, compiled.ecu.name, version.version_number))]
+
+    def _chain(self, compiled: _CompiledECU, current: str, car_id: str, campaigns,
+               excluded: set = frozenset()) -> List[Version]:
+        """Versions to install in turn to reach the latest offered one, honouring min_from_version"""
+        offered = self._offered(compiled, car_id, campaigns, excluded)
+        if not offered:
+            return []
+        target_key = compiled.keys[offered[-1]]
+        current_key = Version.sort_key(current)
+
+        chain = []
+        while current_key < target_key:
+            # Largest offered step that can be installed over what the ECU will be running
+            hop = None
+            for index in reversed(offered):
+                key = compiled.keys[index]
+                if key <= current_key:
+                    break
+                minimum = compiled.versions[index].min_from_version
+                if minimum is None or current_key >= Version.sort_key(minimum):
+                    hop = index
+                    break
+            if hop is None:
+                logging.info(f"No install path for {compiled.ecu.name} from {current} to "
+                             f"{compiled.versions[offered[-1]].version_number}")
+                break
+            chain.append(compiled.versions[hop])
+            current_key = compiled.keys[hop]
+        return chain
+
+    def plan(self, current_versions: Dict[str, str], car_id: str = None, campaigns=None) -> UpdatePlan:
+        """Resolve the updates for a car reporting current_versions"""
+        current = {str(name).lower(): str(version) for name, version in current_versions.items()}
+        chains = {name: self._chain(self.ecus[name], version, car_id, campaigns)
+                  for name, version in current.items() if name in self.ecus}
+
+        # Exclude versions whose dependencies cannot be met and re-plan their ECU
+        # towards the best version that remains, until every step is satisfiable
+        excluded = {name: set() for name in chains}
+        while True:
+            dependencies = {}
+            blocked = None
+            for name, chain in chains.items():
+                for hop, version in enumerate(chain):
+                    needed = self._step_dependencies(name, version, current, chains)
+                    if needed is None:
+                        blocked = (name, version)
+                        break
+                    dependencies[(name, hop)] = needed
+                if blocked:
+                    break
+            if not blocked:
+                break
+
+            name, version = blocked
+            logging.info(f"{self.ecus[name].ecu.name} {version.version_number} withheld: "
+                         f"unmet dependency {version.requires}")
+            excluded[name].add(version.version_number)
+            chains[name] = self._chain(self.ecus[name], current[name], car_id, campaigns, excluded[name])
+
+        return self._order(chains, dependencies, current)
+
+    def _step_dependencies(self, name: str, version: Version, current: Dict[str, str],
+                           chains: Dict[str, List[Version]]) -> Optional[List[tuple]]:
+        """Steps that must be installed before this one, or None when a requirement is unreachable"""
+        needed = []
+        for required_ecu, minimum in version.requires.items():
+            required_ecu = required_ecu.lower()
+            if required_ecu == name:
+                continue
+            minimum_key = Version.sort_key(minimum)
+            if required_ecu in current and Version.sort_key(current[required_ecu]) >= minimum_key:
+                continue
+            hop = next((index for index, step in enumerate(chains.get(required_ecu, []))
+                        if Version.sort_key(step.version_number) >= minimum_key), None)
+            if hop is None:
+                return None
+            needed.append((required_ecu, hop))
+        return needed
+
+    def _order(self, chains: Dict[str, List[Version]], dependencies: Dict[tuple, List[tuple]],
+               current: Dict[str, str]) -> UpdatePlan:
+        """Topological order of the steps; each step's round follows its ECU's previous step"""
+        edges: Dict[tuple, List[tuple]] = {}
+        indegree: Dict[tuple, int] = {}
+        for name, chain in chains.items():
+            for hop in range(len(chain)):
+                step = (name, hop)
+                before = list(dependencies.get(step, []))
+                if hop:
+                    before.append((name, hop - 1))
+                indegree[step] = len(before)
+                for dependency in before:
+                    edges.setdefault(dependency, []).append(step)
+
+        rounds: Dict[tuple, int] = {}
+        ready = [(0, self.order[name], hop, name) for (name, hop), degree in indegree.items() if not degree]
+        heapq.heapify(ready)
+        plan = UpdatePlan()
+        while ready:
+            step_round, _, hop, name = heapq.heappop(ready)
+            version = chains[name][hop]
+            from_version = chains[name][hop - 1].version_number if hop else current.get(name)
+            plan.steps.append(PlanStep(self.ecus[name].ecu.name, from_version, version.version_number,
+                                       self.size_of(version), step_round))
+            for successor in edges.get((name, hop), []):
+                # A car installs one version per ECU per download
+                successor_round = step_round + 1 if successor[0] == name else step_round
+                rounds[successor] = max(rounds.get(successor, 0), successor_round)
+                indegree[successor] -= 1
+                if not indegree[successor]:
+                    heapq.heappush(ready, (rounds[successor], self.order[successor[0]], successor[1], successor[0]))
+
+        if len(plan.steps) < len(indegree):
+            logging.warning(f"Circular version dependencies in {self.car_type.name}; some updates are withheld")
+        return plan
+
+
+class UpdatePlanner:
+    """Compiled update resolution for every car type of a catalog generation"""
+
+    def __init__(self, car_types: List[CarType] = None, size_of: Callable[[Version], int] = None):
+        self.sizes: Dict[str, int] = {}
+        self.sizes_lock = threading.Lock()
+        self.size_of = size_of
+        self.car_types: Dict[str, CompiledCarType] = {
+            car_type.name.lower(): CompiledCarType(car_type, self._cached_size)
+            for car_type in car_types or []
+        }
+
+    def _cached_size(self, version: Version) -> int:
+        if self.size_of is None:
+            return 0
+        with self.sizes_lock:
+            if version.hex_file_path in self.sizes:
+                return self.sizes[version.hex_file_path]
+        size = self.size_of(version)
+        with self.sizes_lock:
+            self.sizes[version.hex_file_path] = size
+        return size
+
+    def get(self, car_type: str) -> Optional[CompiledCarType]:
+        return self.car_types.get(car_type.lower())
+
+    def plan(self, car_type: str, current_versions: Dict[str, str], car_id: str = None,
+             campaigns=None) -> Optional[UpdatePlan]:
+        """Install plan for a car, or None when the car type is unknown"""
+        compiled = self.get(car_type)
+        if compiled is None:
+            return None
+        return compiled.plan(current_versions, car_id, campaigns)
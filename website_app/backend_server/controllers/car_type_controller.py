@@ -137,7 +137,9 @@ def create_car_type():
                 versions.append(Version(
                     version_number=version_data['version_number'],
                     compatible_car_types=version_data.get('compatible_car_types', []),
-                    hex_file_path=version_data.get('hex_file_path', '')
+                    hex_file_path=version_data.get('hex_file_path', ''),
+                    sha256=version_data.get('sha256'),
+                    file_metadata=version_data.get('file_metadata')
                 ))
 
             ecu = ECU(
@@ -216,7 +218,9 @@ def update_car_type(name):
                     version_number=version_data['version_number'],
                     compatible_car_types=version_data.get(
                         'compatible_car_types', []),
-                    hex_file_path=version_data.get('hex_file_path', '')
+                    hex_file_path=version_data.get('hex_file_path', ''),
+                    sha256=version_data.get('sha256'),
+                    file_metadata=version_data.get('file_metadata')
                 ))
 
             ecu = ECU(
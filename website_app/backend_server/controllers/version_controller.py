@@ -2,8 +2,6 @@ from dotenv import load_dotenv
 from flask import Blueprint, jsonify, request, current_app, send_file
 import os
 import io
-from azure.storage.blob import BlobServiceClient, ContentSettings
-import uuid
 import json
 
 version_bp = Blueprint('version', __name__)
@@ -276,10 +274,6 @@ load_dotenv()
 def upload_firmware_to_azure():
     """Upload a new firmware version to Azure Blob Storage"""
     try:
-        hex_storage_account_name = os.environ.get('HEX_STORAGE_ACCOUNT_NAME')
-        hex_storage_container_name = os.environ.get('HEX_STORAGE_CONTAINER_NAME')
-        hex_storage_account_key = os.environ.get('HEX_STORAGE_ACCOUNT_KEY')
-
         # Check if the file is in the request
         if 'file' not in request.files:
             return jsonify({'error': 'No file part'}), 400
@@ -307,29 +301,13 @@ def upload_firmware_to_azure():
         if isinstance(compatible_car_types, list):
             compatible_car_types = [car_type.lower() if isinstance(car_type, str) else car_type for car_type in compatible_car_types]        
 
-        # Create a unique blob name
-        file_extension = os.path.splitext(file.filename)[1]
-        blob_name = f"{ecu_name}_{ecu_model}_{version_number}_{uuid.uuid4().hex}{file_extension}"
-        
-        # Connect to Azure Blob Storage
-        connection_string = (f"DefaultEndpointsProtocol=https;AccountName={hex_storage_account_name};"
-                            f"AccountKey={hex_storage_account_key};EndpointSuffix=core.windows.net")
-        
-        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
-        container_client = blob_service_client.get_container_client(hex_storage_container_name)
-        
-        # Upload the file
-        blob_client = container_client.get_blob_client(blob_name)
+        # Store the file under its SHA-256 digest; identical images are uploaded only once
+        db_service = current_app.db_service
         file_data = file.read()  # Read file content
-        
-        content_settings = ContentSettings(content_type=file.content_type)
-        blob_client.upload_blob(file_data, overwrite=True, content_settings=content_settings)
-        
-        # Generate the URL for the blob
-        blob_url = f"https://{hex_storage_account_name}.blob.core.windows.net/{hex_storage_container_name}/{blob_name}"
+        stored = db_service.get_firmware_store_service().put(file_data, file.content_type)
+        blob_url = stored['url']
         
         # Now create the version in the database with the blob URL as hex_file_path
-        db_service = current_app.db_service
         ecu_service = db_service.get_ecu_service()
         
         # Get the ECU first
@@ -353,14 +331,19 @@ def upload_firmware_to_azure():
         new_version = Version(
             version_number=version_number,
             compatible_car_types=compatible_car_types,
-            hex_file_path=blob_url  # Store the Azure Blob URL
+            hex_file_path=blob_url,  # Store the Azure Blob URL
+            sha256=stored['sha256'],
+            file_metadata=stored['metadata']
         )
         
         # Add the version to the ECU
         ecu.versions.append(new_version)
         
-        # Save the updated ECU
-        ecu_service.save(ecu)
+        # Save the updated ECU; its version now references the image, so the upload's pin is dropped
+        try:
+            ecu_service.save(ecu)
+        finally:
+            db_service.get_firmware_store_service().release_reference(stored['sha256'])
         
         # Get the car type service
         car_type_service = db_service.get_car_type_service()
@@ -387,7 +370,9 @@ def upload_firmware_to_azure():
                                 {
                                     "version_number": v.version_number,
                                     "compatible_car_types": v.compatible_car_types,
-                                    "hex_file_path": v.hex_file_path
+                                    "hex_file_path": v.hex_file_path,
+                                    "sha256": v.sha256,
+                                    "file_metadata": v.file_metadata
                                 } for v in ecu.versions
                             ]
                         })
@@ -400,7 +385,9 @@ def upload_firmware_to_azure():
                                 {
                                     "version_number": v.version_number,
                                     "compatible_car_types": v.compatible_car_types,
-                                    "hex_file_path": v.hex_file_path
+                                    "hex_file_path": v.hex_file_path,
+                                    "sha256": v.sha256,
+                                    "file_metadata": v.file_metadata
                                 } for v in (ct_ecu.versions if hasattr(ct_ecu, 'versions') and ct_ecu.versions else [])
                             ]
                         })
@@ -417,12 +404,25 @@ def upload_firmware_to_azure():
                 else:
                     print(f"Failed to update ECU in car type: {car_type.name}")
 
+        # Let HMI nodes warm their caches before the first car asks
+        db_service.get_publish_event_service().publish_version(
+            ecu_name=ecu.name,
+            ecu_model=ecu.model_number,
+            version_number=version_number,
+            hex_file_path=blob_url,
+            compatible_car_types=compatible_car_types,
+            sha256=stored['sha256'],
+            file_metadata=stored['metadata']
+        )
         
         return jsonify({
             'message': 'Firmware uploaded successfully to Azure Blob Storage',
             'version': {
                 'version_number': version_number,
                 'hex_file_path': blob_url,
+                'sha256': stored['sha256'],
+                'deduplicated': stored['deduplicated'],
+                'file_metadata': stored['metadata'],
                 'compatible_car_types': compatible_car_types
             }
         }), 201
@@ -43,6 +43,8 @@ class DatabaseManager:
         self.versions_collection = self.db['versions']
         self.requests_collection = self.db['requests']
         self.download_requests_collection = self.db['download_requests']
+        self.firmware_blobs_collection = self.db['firmware_blobs']
+        self.publish_events_collection = self.db['publish_events']
 
         # Initialize collections with indexes
         self._initialize_db()
@@ -52,6 +54,8 @@ class DatabaseManager:
         self.get_ecu_service = None
         self.get_version_service = None
         self.get_request_service = None
+        self.get_firmware_store_service = None
+        self.get_publish_event_service = None
 
     def _initialize_db(self):
         """Create indexes and ensure collections exist"""
@@ -92,6 +96,11 @@ class DatabaseManager:
                     # No unique constraint
                     [("version_number", 1), ("hex_file_path", 1)])
 
+            # Versions are saved per ECU; content-addressed images share hex_file_path across ECUs
+            if 'ecu_name_1_ecu_model_1_version_number_1' not in versions_index_names:
+                self.versions_collection.create_index(
+                    [("ecu_name", 1), ("ecu_model", 1), ("version_number", 1)])
+
             # Request indexes
             requests_indexes = list(self.requests_collection.list_indexes())
             requests_index_names = [idx['name'] for idx in requests_indexes]
@@ -123,7 +132,8 @@ class DatabaseManager:
             # Check for duplicates
             pipeline = [
                 {"$group": {
-                    "_id": {"version_number": "$version_number", "hex_file_path": "$hex_file_path"},
+                    "_id": {"ecu_name": "$ecu_name", "ecu_model": "$ecu_model",
+                            "version_number": "$version_number", "hex_file_path": "$hex_file_path"},
                     "count": {"$sum": 1},
                     "ids": {"$push": "$_id"}
                 }},
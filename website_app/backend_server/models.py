@@ -27,10 +27,14 @@ class ECU:
 class Version:
     """Class representing a firmware version"""
     
-    def __init__(self, version_number: str, compatible_car_types: List[str], hex_file_path: str):
+    def __init__(self, version_number: str, compatible_car_types: List[str], hex_file_path: str,
+                 sha256: Optional[str] = None, file_metadata: Optional[Dict] = None):
         self.version_number = version_number
         self.compatible_car_types = compatible_car_types
         self.hex_file_path = hex_file_path
+        self.sha256 = sha256  # Content address of the image in the firmware store
+        # Size, digest, format, chunk count and ETag captured when the image was published
+        self.file_metadata = file_metadata
 
 class RequestStatus(Enum):
     """Enum for request status"""
@@ -73,6 +73,7 @@ class CarTypeService:
             # Prepare car type data for saving
             car_type_data = {
                 "name": name_lower,
+                "name_lower": name_lower,  # Indexed lookup key of the HMI server
                 "model_number": model_number_lower,
                 "ecu_ids": car_type.ecus,
                 "manufactured_count": car_type.manufactured_count,
@@ -100,6 +101,8 @@ class CarTypeService:
             # If model_number is in the data, convert it to lowercase
             if "model_number" in updated_data:
                 updated_data["model_number"] = updated_data["model_number"].lower()
+            if "name" in updated_data:
+                updated_data["name_lower"] = updated_data["name"].lower()
             
             self.collection.update_one(
                 {"name": name.lower()},
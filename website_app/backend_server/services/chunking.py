@@ -0,0 +1,48 @@
+import hashlib
+from typing import List, Tuple
+
+# Must stay identical to hmi_server/chunking.py: the HMI serves these manifests
+# to cars as they are, and cars chunk the images they hold with the same values
+MIN_CHUNK_SIZE = 2 * 1024
+AVG_CHUNK_SIZE = 8 * 1024
+MAX_CHUNK_SIZE = 32 * 1024
+CHUNK_HASH_LENGTH = 32
+
+_HASH_BITS = 64
+_HASH_LIMIT = (1 << _HASH_BITS) - 1
+
+GEAR = [int.from_bytes(hashlib.sha256(b"ota-cdc-gear" + bytes([i])).digest()[:8], "big") for i in range(256)]
+
+
+def _boundary_mask(avg_size: int) -> int:
+    bits = avg_size.bit_length() - 1
+    return ((1 << bits) - 1) << (_HASH_BITS - bits)
+
+
+def chunk_boundaries(data: bytes) -> List[Tuple[int, int]]:
+    """Content-defined chunk (offset, length) pairs of an image"""
+    mask = _boundary_mask(AVG_CHUNK_SIZE)
+    gear = GEAR
+    boundaries = []
+    start = 0
+    length = len(data)
+
+    while start < length:
+        end = min(start + MAX_CHUNK_SIZE, length)
+        cut = end
+        gear_hash = 0
+        for position in range(start + MIN_CHUNK_SIZE, end):
+            gear_hash = ((gear_hash << 1) + gear[data[position]]) & _HASH_LIMIT
+            if not gear_hash & mask:
+                cut = position + 1
+                break
+        boundaries.append((start, cut - start))
+        start = cut
+
+    return boundaries
+
+
+def build_manifest(data: bytes) -> List[List]:
+    """[chunk hash, offset, length] per chunk, computed once when an image is published"""
+    return [[hashlib.sha256(data[offset:offset + size]).hexdigest()[:CHUNK_HASH_LENGTH], offset, size]
+            for offset, size in chunk_boundaries(data)]
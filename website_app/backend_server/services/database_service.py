@@ -2,6 +2,8 @@ from database_manager import DatabaseManager
 from services.car_type_service import CarTypeService
 from services.ecu_service import ECUService
 from services.version_service import VersionService
+from services.firmware_store_service import FirmwareStoreService
+from services.publish_event_service import PublishEventService
 
 class DatabaseService:
     """
@@ -17,12 +19,16 @@ class DatabaseService:
         self.db_manager.get_car_type_service = self.get_car_type_service
         self.db_manager.get_ecu_service = self.get_ecu_service
         self.db_manager.get_version_service = self.get_version_service
+        self.db_manager.get_firmware_store_service = self.get_firmware_store_service
+        self.db_manager.get_publish_event_service = self.get_publish_event_service
         
         # Create service instances
         self._car_type_service = None
         self._ecu_service = None
         self._version_service = None
         self._request_service = None
+        self._firmware_store_service = None
+        self._publish_event_service = None
     
     def get_car_type_service(self) -> CarTypeService:
         """Get or create the car type service"""
@@ -41,4 +47,15 @@ class DatabaseService:
         if self._version_service is None:
             self._version_service = VersionService(self.db_manager)
         return self._version_service
-    
\ No newline at end of file
+    
+    def get_firmware_store_service(self) -> FirmwareStoreService:
+        """Get or create the content-addressed firmware store"""
+        if self._firmware_store_service is None:
+            self._firmware_store_service = FirmwareStoreService(self.db_manager)
+        return self._firmware_store_service
+    
+    def get_publish_event_service(self) -> PublishEventService:
+        """Get or create the publish event service"""
+        if self._publish_event_service is None:
+            self._publish_event_service = PublishEventService(self.db_manager)
+        return self._publish_event_service
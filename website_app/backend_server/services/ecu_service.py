@@ -50,10 +50,13 @@ class ECUService:
         try:
             version_service = self.db_manager.get_version_service()
             version_ids = []
+            existing = self.collection.find_one(
+                {"name": ecu.name.lower(), "model_number": ecu.model_number.lower()}, {"version_ids": 1}
+            )
             
             # Save versions first and get their IDs
             for version in ecu.versions:
-                version_id = version_service.save(version)
+                version_id = version_service.save(version, ecu.name, ecu.model_number)
                 if version_id:
                     version_ids.append(version_id)
             
@@ -71,14 +74,17 @@ class ECUService:
                 upsert=True
             )
             
+            # Versions the ECU no longer lists are deleted, which releases their images;
+            # skipped when a version failed to save, so its document is not mistaken for a dropped one
+            if existing and len(version_ids) == len(ecu.versions):
+                dropped = [version_id for version_id in existing.get("version_ids", []) if version_id not in version_ids]
+                self._delete_unlisted_versions(existing["_id"], dropped)
+
             # Get the ID of the inserted/updated ECU
             if result.upserted_id:
                 return result.upserted_id
             else:
-                ecu_doc = self.collection.find_one(
-                    {"name": ecu.name.lower(), "model_number": ecu.model_number.lower()}
-                )
-                return ecu_doc["_id"] if ecu_doc else None
+                return existing["_id"] if existing else None
             
         except Exception as e:
             print(f"Error saving ECU: {str(e)}")
@@ -96,11 +102,20 @@ class ECUService:
             print(f"Error updating ECU: {str(e)}")
             return False
     
+    def _delete_unlisted_versions(self, ecu_id: ObjectId, version_ids: List[ObjectId]):
+        """Delete versions unless another ECU still lists them (documents saved before versions were keyed by ECU)"""
+        unlisted = [version_id for version_id in version_ids
+                    if not self.collection.find_one({"_id": {"$ne": ecu_id}, "version_ids": version_id}, {"_id": 1})]
+        if unlisted:
+            self.db_manager.get_version_service().delete_by_ids(unlisted)
+
     def delete(self, name: str, model_number: str) -> bool:
-        """Delete an ECU by name and model number"""
+        """Delete an ECU by name and model number, together with its versions"""
         try:
-            result = self.collection.delete_one({"name": name.lower(), "model_number": model_number.lower()})
-            return result.deleted_count > 0
+            ecu_doc = self.collection.find_one_and_delete({"name": name.lower(), "model_number": model_number.lower()})
+            if ecu_doc:
+                self._delete_unlisted_versions(ecu_doc["_id"], ecu_doc.get("version_ids", []))
+            return ecu_doc is not None
         except Exception as e:
             print(f"Error deleting ECU: {str(e)}")
             return False
@@ -0,0 +1,147 @@
+from typing import Dict, Optional
+from database_manager import DatabaseManager
+from azure.storage.blob import BlobServiceClient, ContentSettings
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+from pymongo import ReturnDocument
+from datetime import datetime
+from services.chunking import build_manifest
+import hashlib
+import math
+import os
+
+# Transfer chunk size of the HMI server, used to precompute chunk counts
+TRANSFER_CHUNK_SIZE = int(os.environ.get('HMI_TRANSFER_CHUNK_SIZE', '8192'))
+
+
+class FirmwareStoreService:
+    """
+    Content-addressed firmware blob store keyed by SHA-256.
+    ref_count counts the versions pointing at an image plus the pins of uploads
+    that have not been attached to a version yet; an image is collected when it drops to 0.
+    """
+
+    def __init__(self, db_manager: DatabaseManager):
+        """Initialize with database manager and Azure Blob Storage settings"""
+        self.db_manager = db_manager
+        self.collection = db_manager.firmware_blobs_collection
+
+        self.account_name = os.environ.get('HEX_STORAGE_ACCOUNT_NAME')
+        self.container_name = os.environ.get('HEX_STORAGE_CONTAINER_NAME')
+        account_key = os.environ.get('HEX_STORAGE_ACCOUNT_KEY')
+        connection_string = (f"DefaultEndpointsProtocol=https;AccountName={self.account_name};"
+                             f"AccountKey={account_key};EndpointSuffix=core.windows.net")
+        blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+        self.container_client = blob_service_client.get_container_client(self.container_name)
+
+    @staticmethod
+    def blob_name_for(digest: str) -> str:
+        """Blob name of an image in the content-addressed layout"""
+        return f"sha256/{digest[:2]}/{digest}"
+
+    def blob_url_for(self, digest: str) -> str:
+        """Public URL of an image in the content-addressed layout"""
+        return f"https://{self.account_name}.blob.core.windows.net/{self.container_name}/{self.blob_name_for(digest)}"
+
+    @staticmethod
+    def detect_format(file_data: bytes) -> str:
+        """Image format from the first record: srec, ihex or binary"""
+        first_line = file_data[:128].lstrip().split(b"\n", 1)[0].strip()
+        if first_line[:1] == b"S" and first_line[1:2].isdigit():
+            return "srec"
+        if first_line[:1] == b":":
+            return "ihex"
+        return "binary"
+
+    @staticmethod
+    def build_metadata(file_data: bytes, digest: str, etag: Optional[str]) -> Dict:
+        """File metadata stored with every version, so the HMI never asks storage for it"""
+        return {
+            "size": len(file_data),
+            "sha256": digest,
+            "format": FirmwareStoreService.detect_format(file_data),
+            "chunk_count": math.ceil(len(file_data) / TRANSFER_CHUNK_SIZE),
+            "etag": etag
+        }
+
+    def put(self, file_data: bytes, content_type: str = None) -> Dict:
+        """
+        Store an image once per digest and pin it for the caller.
+        The content-defined chunk manifest is computed here, while the bytes are in hand,
+        and kept on the image record for the HMI servers to serve as it is.
+        Returns the digest, size, blob URL and file metadata; identical bytes are not uploaded again.
+        The pin is one reference, taken in the same update that finds or records the image,
+        so the image cannot be collected before the caller's version references it.
+        The caller releases the pin with release_reference once the version is saved.
+        """
+        digest = hashlib.sha256(file_data).hexdigest()
+        blob_url = self.blob_url_for(digest)
+
+        existing = self.collection.find_one_and_update(
+            {"_id": digest, "metadata": {"$exists": True}},
+            {"$inc": {"ref_count": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        blob_client = self.container_client.get_blob_client(self.blob_name_for(digest))
+        if existing and blob_client.exists():
+            if "chunk_manifest" not in existing:
+                # Images stored before manifests were published get theirs on the next upload
+                self.collection.update_one({"_id": digest}, {"$set": {"chunk_manifest": build_manifest(file_data)}})
+            return {"sha256": digest, "size": existing["size"], "url": blob_url, "deduplicated": True,
+                    "metadata": existing["metadata"]}
+
+        content_settings = ContentSettings(content_type=content_type or 'application/octet-stream')
+        upload = blob_client.upload_blob(file_data, overwrite=True, content_settings=content_settings)
+        metadata = self.build_metadata(file_data, digest, upload.get('etag'))
+
+        update = {
+            "$set": {"url": blob_url, "size": len(file_data), "metadata": metadata,
+                     "chunk_manifest": build_manifest(file_data)},
+            "$setOnInsert": {"created_at": datetime.now()}
+        }
+        if not existing:
+            update["$inc"] = {"ref_count": 1}
+        self.collection.update_one({"_id": digest}, update, upsert=True)
+        return {"sha256": digest, "size": len(file_data), "url": blob_url, "deduplicated": False,
+                "metadata": metadata}
+
+    def add_reference(self, digest: str) -> bool:
+        """Count one more version pointing at the image"""
+        try:
+            result = self.collection.update_one({"_id": digest}, {"$inc": {"ref_count": 1}})
+            return result.matched_count > 0
+        except Exception as e:
+            print(f"Error adding firmware reference: {str(e)}")
+            return False
+
+    def release_reference(self, digest: str) -> bool:
+        """Drop one reference and delete the blob once nothing points at it"""
+        try:
+            doc = self.collection.find_one_and_update(
+                {"_id": digest, "ref_count": {"$gt": 0}},
+                {"$inc": {"ref_count": -1}},
+                return_document=ReturnDocument.AFTER
+            )
+            if doc and doc["ref_count"] <= 0:
+                # Remove the record first, so a concurrent put either pins it (and this delete
+                # matches nothing) or uploads the blob again under a new ETag
+                claimed = self.collection.find_one_and_delete({"_id": digest, "ref_count": {"$lte": 0}})
+                if claimed:
+                    etag = (claimed.get("metadata") or {}).get("etag")
+                    blob_client = self.container_client.get_blob_client(self.blob_name_for(digest))
+                    try:
+                        if etag:
+                            # Keeps a blob that was uploaded again after the record was removed
+                            blob_client.delete_blob(etag=etag, match_condition=MatchConditions.IfNotModified)
+                        else:
+                            blob_client.delete_blob()
+                    except (ResourceModifiedError, ResourceNotFoundError):
+                        pass
+            return True
+        except Exception as e:
+            print(f"Error releasing firmware reference: {str(e)}")
+            return False
+
+    def get(self, digest: str) -> Optional[Dict]:
+        """Get the stored image record for a digest"""
+        return self.collection.find_one({"_id": digest})
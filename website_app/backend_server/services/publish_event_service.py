@@ -0,0 +1,39 @@
+from typing import Dict, List, Optional
+from database_manager import DatabaseManager
+from datetime import datetime
+
+
+class PublishEventService:
+    """Announces published firmware versions to HMI nodes through the publish_events collection"""
+
+    VERSION_PUBLISHED = "version_published"
+
+    def __init__(self, db_manager: DatabaseManager):
+        """Initialize with database manager"""
+        self.db_manager = db_manager
+        self.collection = db_manager.publish_events_collection
+
+    def publish_version(self, ecu_name: str, ecu_model: str, version_number: str, hex_file_path: str,
+                        compatible_car_types: List[str], sha256: Optional[str] = None,
+                        file_metadata: Optional[Dict] = None) -> bool:
+        """Record that a version is ready; HMI nodes warm their caches when they see it"""
+        try:
+            self.collection.insert_one({
+                "type": self.VERSION_PUBLISHED,
+                "ecu_name": ecu_name,
+                "ecu_model": ecu_model,
+                "version_number": version_number,
+                "hex_file_path": hex_file_path,
+                "compatible_car_types": compatible_car_types,
+                "sha256": sha256,
+                "file_metadata": file_metadata,
+                "created_at": datetime.now()
+            })
+            return True
+        except Exception as e:
+            print(f"Error publishing version event: {str(e)}")
+            return False
+
+    def get_recent(self, limit: int = 50) -> List[Dict]:
+        """Most recent publish events, newest first"""
+        return list(self.collection.find().sort("created_at", -1).limit(limit))
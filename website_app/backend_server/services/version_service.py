@@ -2,6 +2,7 @@ from typing import List, Optional, Dict
 from models import Version
 from database_manager import DatabaseManager
 from bson import ObjectId
+from pymongo import ReturnDocument
 import os
 
 class VersionService:
@@ -39,42 +40,61 @@ class VersionService:
         versions_data = list(self.collection.find({"_id": {"$in": version_ids}}))
         return self._convert_to_versions(versions_data)
     
-    def save(self, version: Version) -> Optional[ObjectId]:
-        """Save a version and return its ID"""
+    @staticmethod
+    def _key(ecu_name: str, ecu_model: str, version_number: str) -> Dict:
+        """
+        A version belongs to one ECU. Content-addressed images make different
+        ECUs share a hex_file_path, so the path cannot identify a version.
+        """
+        return {"ecu_name": ecu_name.lower(), "ecu_model": ecu_model.lower(), "version_number": version_number}
+
+    def save(self, version: Version, ecu_name: str, ecu_model: str) -> Optional[ObjectId]:
+        """Save a version of an ECU and return its ID"""
         try:
             version.compatible_car_types = [car_type.lower() for car_type in version.compatible_car_types]
+            key = self._key(ecu_name, ecu_model, version.version_number)
             # Prepare version data for saving
             version_data = {
-                "version_number": version.version_number,
+                **key,
                 "compatible_car_types": version.compatible_car_types,
                 "hex_file_path": version.hex_file_path
             }
+            if version.sha256:
+                version_data["sha256"] = version.sha256
+            if version.file_metadata:
+                version_data["file_metadata"] = version.file_metadata
             
-            # Check if version exists, update or insert
-            result = self.collection.update_one(
-                {"version_number": version.version_number, "hex_file_path": version.hex_file_path},
+            # Update or insert, and learn which image the version pointed at before
+            previous = self.collection.find_one_and_update(
+                key,
                 {"$set": version_data},
-                upsert=True
+                projection={"sha256": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
             )
-            
+            previous_sha256 = previous.get("sha256") if previous else None
+
+            # A new version or a republished image moves the reference to the new image
+            if version.sha256 != previous_sha256:
+                firmware_store = self.db_manager.get_firmware_store_service()
+                if version.sha256:
+                    firmware_store.add_reference(version.sha256)
+                if previous_sha256:
+                    firmware_store.release_reference(previous_sha256)
+
             # Get the ID of the inserted/updated version
-            if result.upserted_id:
-                return result.upserted_id
-            else:
-                version_doc = self.collection.find_one(
-                    {"version_number": version.version_number, "hex_file_path": version.hex_file_path}
-                )
-                return version_doc["_id"] if version_doc else None
+            version_doc = previous or self.collection.find_one(key, {"_id": 1})
+            return version_doc["_id"] if version_doc else None
                 
         except Exception as e:
             print(f"Error saving version: {str(e)}")
             return None
     
-    def update(self, version_number: str, hex_file_path: str, data: Dict) -> bool:
+    def update(self, ecu_name: str, ecu_model: str, version_number: str, data: Dict) -> bool:
         """Update specific fields of a version"""
         try:
             self.collection.update_one(
-                {"version_number": version_number, "hex_file_path": hex_file_path},
+                self._key(ecu_name, ecu_model, version_number),
                 {"$set": data}
             )
             return True
@@ -82,16 +102,32 @@ class VersionService:
             print(f"Error updating version: {str(e)}")
             return False
     
-    def delete(self, version_number: str, hex_file_path: str) -> bool:
-        """Delete a version by number and hex file path"""
+    def delete(self, ecu_name: str, ecu_model: str, version_number: str) -> bool:
+        """Delete a version of an ECU and release its image"""
         try:
-            result = self.collection.delete_one(
-                {"version_number": version_number, "hex_file_path": hex_file_path}
-            )
-            return result.deleted_count > 0
+            version_doc = self.collection.find_one_and_delete(self._key(ecu_name, ecu_model, version_number))
+            if version_doc and version_doc.get("sha256"):
+                self.db_manager.get_firmware_store_service().release_reference(version_doc["sha256"])
+            return version_doc is not None
         except Exception as e:
             print(f"Error deleting version: {str(e)}")
             return False
+
+    def delete_by_ids(self, version_ids: List[ObjectId]) -> int:
+        """Delete versions no ECU lists any more and release their images; returns how many were deleted"""
+        deleted = 0
+        firmware_store = self.db_manager.get_firmware_store_service()
+        for version_id in version_ids:
+            try:
+                version_doc = self.collection.find_one_and_delete({"_id": version_id})
+                if not version_doc:
+                    continue
+                deleted += 1
+                if version_doc.get("sha256"):
+                    firmware_store.release_reference(version_doc["sha256"])
+            except Exception as e:
+                print(f"Error deleting version {version_id}: {str(e)}")
+        return deleted
     
     def get_compatible_versions(self, car_type_name: str, versions: List[Version] = None) -> List[Version]:
         """Get all versions compatible with a specific car type"""
@@ -132,7 +168,9 @@ class VersionService:
             versions.append(Version(
                 version_number=version_info['version_number'],
                 compatible_car_types=version_info.get('compatible_car_types', []),
-                hex_file_path=version_info.get('hex_file_path', '')
+                hex_file_path=version_info.get('hex_file_path', ''),
+                sha256=version_info.get('sha256'),
+                file_metadata=version_info.get('file_metadata')
             ))
         
         return versions
\ No newline at end of file